@@ -0,0 +1,384 @@
+"""
+Benchmarks for the hub_management data structures and the whole Hub pipeline.
+Run with: python benchmarks.py [--locations 1000 --packages 100000 --non-metric --output results.json]
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import math
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+
+from hash_table import HashTable
+from hub_management import Hub
+from instrumentation import Instrumentation
+from load_planner import LoadPlanner
+import manifest
+from package import Package
+from package_store import PackageStore
+
+STREETS = ("S State St", "E 3300 S", "W North Temple", "S 900 W", "S Main St", "E 2100 S", "W 4800 S",
+           "S 700 E", "Dalton Ave S", "Parkway Blvd", "Canyon Rd", "W Oakland Ave")
+DEADLINES = ("EOD",) * 14 + ("10:30 AM",) * 5 + ("9:00 AM",)
+
+
+def bench_hash_table(sizes=(1000, 10000, 100000, 1000000), seed=2020):
+    """
+    Times insert and look_up on sparse random pkg_ids. The per operation cost should stay flat as
+    the table grows if inserts and lookups are amortized O(1).
+    :param sizes: number of packages to store for each run
+    :param seed: random seed for the pkg_ids
+    :return: list of (size, insert ns/op, look_up ns/op)
+    """
+    results = []
+    rng = random.Random(seed)
+    for size in sizes:
+        pkg_ids = rng.sample(range(10 ** 12), size)
+        packages = [Package(pkg_id, "", 0, "EOD", 0, "") for pkg_id in pkg_ids]
+        table = HashTable()
+        start = time.perf_counter()
+        for pkg in packages:
+            table.put(pkg)
+        insert_time = time.perf_counter() - start
+        rng.shuffle(pkg_ids)
+        start = time.perf_counter()
+        for pkg_id in pkg_ids:
+            table.look_up(pkg_id)
+        look_up_time = time.perf_counter() - start
+        results.append((size, insert_time / size * 1e9, look_up_time / size * 1e9))
+    return results
+
+
+def bench_settlement(count=100000, seed=2020):
+    """
+    Times day-end settlement, marking every package Delivered, with the per-package loop and with
+    set_status_many.
+    :param count: number of packages
+    :param seed: random seed for the pkg_ids
+    :return: (per-package seconds, bulk seconds)
+    """
+    rng = random.Random(seed)
+    pkg_ids = rng.sample(range(10 ** 12), count)
+    rows = [(pkg_id, "", 0, "EOD", 0, "") for pkg_id in pkg_ids]
+    times = []
+    for bulk in (False, True):
+        table = HashTable()
+        table.insert_many(rows)
+        table.set_status_many(pkg_ids, "In Route")
+        start = time.perf_counter()
+        if bulk:
+            table.set_status_many(pkg_ids, "Delivered", 17 * 60)
+        else:
+            for pkg_id in pkg_ids:
+                pkg = table.look_up(pkg_id)
+                pkg.delivery_status = "Delivered"
+                pkg.delivery_minutes = 17 * 60
+        times.append(time.perf_counter() - start)
+    return times[0], times[1]
+
+
+def bench_restart(count=100000, seed=2020):
+    """
+    Times rebuilding the package store after a restart: ingesting the manifest csv, replaying a journal
+    of the same packages, and loading a snapshot of them.
+    :param count: number of packages
+    :param seed: random seed for the generated files
+    :return: (csv seconds, journal replay seconds, snapshot seconds)
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        manifest_path = os.path.join(folder, "packages.csv")
+        addresses = generate_distance_table(os.path.join(folder, "distances.csv"), 100, True, seed)
+        generate_manifest(manifest_path, addresses, count, 10, seed)
+        start = time.perf_counter()
+        manifest.ingest(HashTable(), manifest_path)
+        csv_time = time.perf_counter() - start
+        store = PackageStore(os.path.join(folder, "store"))
+        manifest.ingest(store.open(), manifest_path)
+        store.close(snapshot=False)
+        start = time.perf_counter()
+        store.open()
+        replay_time = time.perf_counter() - start
+        store.close()
+        start = time.perf_counter()
+        store.open()
+        snapshot_time = time.perf_counter() - start
+        store.close()
+    return csv_time, replay_time, snapshot_time
+
+
+class LegacyPackage:
+    """
+    The original Package layout with a per instance __dict__ and string times and statuses,
+    kept only to compare memory use.
+    """
+    def __init__(self, pkg_id: int, address: str, zip_code: int, dl: str, wt: int, notes: str):
+        self.pkg_id = pkg_id
+        self.address = Package.convert_delivery_address(address)
+        self.city = "Salt Lake City"
+        self.state = "UT"
+        self.zip_code = zip_code
+        self.deadline = dl
+        self.weight = wt
+        self.special_notes = notes
+        self.delivery_status = "At Hub"
+        self.delivery_time = "24:00 AM"
+
+
+def bench_package_memory(count=100000, seed=2020):
+    """
+    Measures the memory held by count packages in the old and the new layout.
+    Rows are built from separate string objects like a csv reader would produce.
+    :param count: number of packages
+    :param seed: random seed for the rows
+    :return: (legacy bytes/pkg, slotted bytes/pkg)
+    """
+    rng = random.Random(seed)
+    addresses = [f'{rng.randrange(100, 9999)} South {rng.randrange(1, 99)}00 East' for _ in range(500)]
+    notes = ["", "Can only be on truck 2", "Delayed on flight---will not arrive to depot until 9:05 am"]
+    rows = [(pkg_id, "".join(list(rng.choice(addresses))), 84100 + rng.randrange(30),
+             "".join(list(rng.choice(["EOD", "10:30 AM", "9:00 AM"]))), rng.randrange(1, 90),
+             "".join(list(rng.choice(notes)))) for pkg_id in range(count)]
+    results = []
+    for layout in (LegacyPackage, Package):
+        tracemalloc.start()
+        packages = [layout(*row) for row in rows]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results.append(size / len(packages))
+        del packages
+    return tuple(results)
+
+
+def generate_distance_table(path: str, size: int, metric=True, seed=2020):
+    """
+    Writes a distance table csv laid out like WGUPS_Distance_Table.csv with size locations besides the Hub.
+    Locations are random points in a 20 x 20 mile square. Metric tables use the straight line distance
+    times 1.3 for the roads, non-metric tables scale each road by a random factor from 0.5 to 2.5 so some
+    direct roads are longer than a detour.
+    :param path: csv file to write
+    :param size: number of delivery locations
+    :param metric: whether distances follow the triangle inequality (up to rounding)
+    :param seed: random seed
+    :return: List[(address, zip_code)] of the delivery locations
+    """
+    rng = random.Random(seed)
+    points = [(10.0, 10.0)] + [(rng.uniform(0, 20), rng.uniform(0, 20)) for _ in range(size)]
+    addresses = []
+    width = size + 3
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([""] + ["WGUPS Distance Table"] + [""] * (width - 2))
+        writer.writerow(["", "", "NHP1 : WGUPS Routing Program"] + [""] * (width - 3))
+        writer.writerow(["Western Governors University\n4001 South 700 East,\nSalt Lake City, UT 84107", " HUB", 0]
+                        + [""] * (width - 3))
+        for i in range(1, size + 1):
+            address = f'{i} {STREETS[i % len(STREETS)]}'
+            zip_code = 84100 + int(points[i][0] // 2) * 10 + int(points[i][1] // 2)
+            addresses.append((address, zip_code))
+            row = [f'Stop {i}\n {address}', f' {address}\n({zip_code})']
+            for j in range(i):
+                distance = math.dist(points[i], points[j]) * 1.3
+                if not metric:
+                    distance *= rng.uniform(0.5, 2.5)
+                row.append(max(round(distance, 1), 0.1))
+            row.append(0)
+            writer.writerow(row + [""] * (width - len(row)))
+    return addresses
+
+
+def generate_manifest(path: str, addresses: list, count: int, truck_count=3, seed=2020):
+    """
+    Writes a package manifest csv laid out like WGUPS_Package_File.csv with notes in the same proportions
+    as the WGUPS file: delayed packages, truck pins, co-delivery groups and a few wrong addresses.
+    :param path: csv file to write
+    :param addresses: List[(address, zip_code)] from generate_distance_table
+    :param count: number of packages
+    :param truck_count: trucks the pins are spread over
+    :param seed: random seed
+    :return: None
+    """
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["WGUPS Package File"] + [""] * 7)
+        writer.writerow(["NHP1 : WGUPS Routing Program"] + [""] * 7)
+        writer.writerow(["Package\nID", "Address", "City ", "State", "Zip", "Delivery\nDeadline", "Mass\nKILO",
+                         "Special Notes"])
+        for pkg_id in range(1, count + 1):
+            address, zip_code = rng.choice(addresses)
+            roll = rng.random()
+            notes = ""
+            if roll < 0.1:
+                notes = "Delayed on flight---will not arrive to depot until 9:05 am"
+            elif roll < 0.14:
+                notes = f'Can only be on truck {rng.randint(1, truck_count)}'
+            elif roll < 0.16 and pkg_id > 2:
+                notes = f'Must be delivered with {pkg_id - 1}, {pkg_id - 2}'
+            elif roll < 0.165:
+                notes = "Wrong address listed"
+            writer.writerow([pkg_id, address, "Salt Lake City", "UT", zip_code, rng.choice(DEADLINES),
+                             rng.randrange(1, 90), notes])
+
+
+class StageTimer:
+    """
+    Times the stages of a pipeline run and records the peak memory allocated during each one.
+    """
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **details):
+        """
+        with timer.stage("routing"): ... adds a stage result with seconds and peak_bytes
+        """
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield details
+        result = {"name": name, "seconds": time.perf_counter() - start}
+        if self.trace_memory:
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1] - base
+        result.update(details)
+        self.stages.append(result)
+
+
+def bench_pipeline(locations=1000, packages=100000, truck_count=50, metric=True, seed=2020, trace_memory=True,
+                   instrument=False):
+    """
+    Runs the Hub pipeline on generated data and times each stage: csv load, indexing, loading, routing,
+    and delivery queries. Timings include the tracemalloc overhead when trace_memory is on.
+    :param locations: delivery locations in the distance table
+    :param packages: packages in the manifest
+    :param truck_count: trucks loaded and routed in one wave
+    :param metric: generate a metric or a non-metric distance table
+    :param seed: random seed for the generated files
+    :param trace_memory: record the peak memory of each stage
+    :param instrument: add the Hub's instrumentation report with its timers and counters
+    :return: dict with the config, a list of stage results, and the instrumentation report if instrument is set
+    """
+    timer = StageTimer(trace_memory)
+    config = {"locations": locations, "packages": packages, "trucks": truck_count, "metric": metric,
+              "seed": seed}
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            distance_path = os.path.join(folder, "distances.csv")
+            manifest_path = os.path.join(folder, "packages.csv")
+            with timer.stage("generate"):
+                addresses = generate_distance_table(distance_path, locations, metric, seed)
+                generate_manifest(manifest_path, addresses, packages, truck_count, seed)
+            with contextlib.redirect_stdout(io.StringIO()):
+                hub = Hub(truck_count, distance_table=None, manifest=None, shortest_path_routing=not metric,
+                          instrumentation=Instrumentation(enabled=instrument))
+            with timer.stage("csv_load_locations"):
+                hub.load_locations(distance_path, use_cache=False)
+            with timer.stage("csv_load_packages") as details:
+                details.update(hub.load_packages(manifest_path))
+            with timer.stage("indexing") as details:
+                details["at_hub"] = len(hub.database.select("At Hub"))
+                details["early_deadlines"] = len(hub.database.deadline_range(latest=10 * 60 + 30, status="At Hub"))
+                zip_codes = {zip_code for _, zip_code in addresses[:10]}
+                details["zip_matches"] = len(hub.database.select("At Hub", zip_code=zip_codes))
+                hub.routing_graph()
+            with timer.stage("loading") as details:
+                details["unplanned"] = len(hub.plan_loads(planner=LoadPlanner(time_budget=1.0)))
+                details["loaded"] = sum(truck.pkg_count for truck in hub.trucks)
+            with timer.stage("routing") as details:
+                details["miles"] = sum(hub.get_miles()[1])
+            with timer.stage("delivery_queries") as details:
+                for hour in range(8, 18):
+                    details[f'delivered_by_{hour}'] = len(hub.get_deliveries(f'{hour % 12 or 12}:00 '
+                                                                             f'{"AM" if hour < 12 else "PM"}'))
+                for pkg_id in range(1, min(packages, 1000) + 1):
+                    hub.get_status(pkg_id, "10:00 AM")
+                details["snapshot"] = len(hub.get_snapshot("10:00 AM"))
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    results = {"config": config, "stages": timer.stages}
+    if instrument:
+        results["instrumentation"] = hub.metrics.report()
+    return results
+
+
+def write_results(results: dict, path: str):
+    """
+    Writes benchmark results as json with the python version and platform.
+    :return: None
+    """
+    results = dict(results, python=platform.python_version(), platform=platform.platform(), timestamp=time.time())
+    with open(path, "w") as json_file:
+        json.dump(results, json_file, indent=2)
+
+
+def main(argv=None):
+    """
+    Runs every benchmark, prints the results, and writes them as json.
+    :param argv: command line arguments, sys.argv if None
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description="hub_management benchmarks")
+    parser.add_argument("--locations", type=int, default=1000)
+    parser.add_argument("--packages", type=int, default=100000)
+    parser.add_argument("--trucks", type=int, default=50)
+    parser.add_argument("--non-metric", action="store_true", help="generate a non-metric distance table")
+    parser.add_argument("--seed", type=int, default=2020)
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc for cleaner timings")
+    parser.add_argument("--instrument", action="store_true", help="include the Hub's timers and counters")
+    parser.add_argument("--pipeline-only", action="store_true", help="skip the data structure benchmarks")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+    results = {}
+    if not args.pipeline_only:
+        results["hash_table"] = [{"size": size, "insert_ns": insert_ns, "look_up_ns": look_up_ns}
+                                 for size, insert_ns, look_up_ns in bench_hash_table()]
+        legacy, slotted = bench_package_memory()
+        results["package_memory"] = {"legacy_bytes": legacy, "slotted_bytes": slotted}
+        per_package, bulk = bench_settlement()
+        results["settlement"] = {"per_package_seconds": per_package, "bulk_seconds": bulk}
+        csv_time, replay_time, snapshot_time = bench_restart()
+        results["restart"] = {"csv_seconds": csv_time, "journal_seconds": replay_time,
+                              "snapshot_seconds": snapshot_time}
+        print("HashTable (ns/op)")
+        print(f'{"size":>10} {"insert":>10} {"look_up":>10}')
+        for row in results["hash_table"]:
+            print(f'{row["size"]:>10} {row["insert_ns"]:>10.0f} {row["look_up_ns"]:>10.0f}')
+        print()
+        print("Package memory (bytes/pkg)")
+        print(f'{"legacy":>10} {legacy:>10.0f}')
+        print(f'{"slotted":>10} {slotted:>10.0f}')
+        print()
+        print("Settlement of 100000 packages (seconds)")
+        print(f'{"loop":>10} {per_package:>10.3f}')
+        print(f'{"bulk":>10} {bulk:>10.3f}')
+        print()
+        print("Restart with 100000 packages (seconds)")
+        print(f'{"csv":>10} {csv_time:>10.3f}')
+        print(f'{"journal":>10} {replay_time:>10.3f}')
+        print(f'{"snapshot":>10} {snapshot_time:>10.3f}')
+        print()
+    pipeline = bench_pipeline(args.locations, args.packages, args.trucks, not args.non_metric, args.seed,
+                              not args.no_memory, args.instrument)
+    results["pipeline"] = pipeline
+    print(f'Pipeline ({args.locations} locations, {args.packages} packages, '
+          f'{"non-metric" if args.non_metric else "metric"})')
+    print(f'{"stage":>20} {"seconds":>10} {"peak MB":>10}')
+    for stage in pipeline["stages"]:
+        peak = stage.get("peak_bytes", 0) / 2 ** 20
+        print(f'{stage["name"]:>20} {stage["seconds"]:>10.3f} {peak:>10.1f}')
+    write_results(results, args.output)
+    print(f'\nResults written to {args.output}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Dense matrix backend for the graph class. Uses NumPy when it is installed and falls back to a flat
+array from the standard library otherwise.
+"""
+from array import array
+
+from distance_table import DistanceTable
+from location import Location
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MISSING = float("inf")
+
+
+class DenseDistanceTable(DistanceTable):
+    """
+    DenseDistanceTable gives each location an integer index and stores the edge weights in a
+    square matrix instead of a dictionary keyed by (Location, Location).
+    Big-O is as follows:
+    add_location: O(1) amortized, O(N^2) when the matrix grows
+    add_distance: O(1)
+    get_distance: O(1)
+    get_row: O(K)
+    nearest_neighbor_tour: O(K^2), one vectorized argmin per step when NumPy is installed
+    closest: O(K)
+    adjacent: O(N)
+    set_matrix: O(1) for a NumPy matrix, O(N^2) otherwise
+    export_matrix: O(N^2)
+    """
+    def __init__(self, dtype="float64", capacity=32):
+        """
+        Index: indexes maps each Location to its row/column in the matrix
+        Edge Weights: matrix, missing edges are stored as infinity
+        :param dtype: float64 or float32
+        :param capacity: initial number of rows reserved in the matrix
+        """
+        super().__init__()
+        self.dtype = dtype
+        self.indexes = {}
+        self.locations = []
+        self.capacity = 0
+        self.matrix = None
+        self.grow(capacity)
+
+    def grow(self, capacity: int):
+        """
+        Reallocates the matrix with room for capacity locations and copies the existing distances.
+        :param capacity: new number of rows and columns
+        :return: None
+        """
+        size = len(self.locations)
+        if numpy is not None:
+            matrix = numpy.full((capacity, capacity), MISSING, dtype=self.dtype)
+            if self.matrix is not None:
+                matrix[:size, :size] = self.matrix[:size, :size]
+        else:
+            matrix = array("d" if self.dtype == "float64" else "f", [MISSING]) * (capacity * capacity)
+            for i in range(size):
+                start = i * self.capacity
+                matrix[i * capacity:i * capacity + size] = self.matrix[start:start + size]
+        self.matrix = matrix
+        self.capacity = capacity
+
+    def add_location(self, new_location: Location):
+        """
+        add a new location to the graph and give it the next row/column in the matrix
+        :param new_location: the Location to be added
+        :return: None
+        """
+        if new_location in self.indexes:
+            return
+        super().add_location(new_location)
+        if len(self.locations) == self.capacity:
+            self.grow(self.capacity * 2)
+        index = len(self.locations)
+        self.indexes[new_location] = index
+        self.locations.append(new_location)
+        self.set_cell(index, index, 0.0)
+
+    def add_distance(self, point_a: Location, point_b: Location, distance: float):
+        """
+        set point a and b as adjacent locations in the graph by storing the distance in the matrix.
+        Adjacency is read back from the matrix rows so the adjacency lists in points stay empty.
+        :param point_a: Location
+        :param point_b: Location
+        :param distance: float
+        :return: None
+        """
+        self.version += 1
+        index_a = self.indexes[point_a]
+        index_b = self.indexes[point_b]
+        self.set_cell(index_a, index_b, distance)
+        self.set_cell(index_b, index_a, distance)
+
+    def adjacent(self, point: Location) -> list:
+        """
+        returns every location with a known distance from point
+        :param point: Location
+        :return: List[Location]
+        """
+        row = self.get_row(point)
+        own = self.indexes[point]
+        return [self.locations[i] for i, distance in enumerate(row) if distance != MISSING and i != own]
+
+    def set_matrix(self, matrix, size: int):
+        """
+        replaces every distance at once, used when loading a cached graph
+        :param matrix: size x size NumPy array (may be memory mapped) or flat array of size * size floats
+        :param size: number of locations, must match the locations already added
+        :return: None
+        """
+        if size != len(self.locations):
+            raise ValueError(f'matrix has {size} rows but the table has {len(self.locations)} locations')
+        if numpy is not None:
+            self.matrix = numpy.asarray(matrix, dtype=self.dtype).reshape(size, size)
+        else:
+            self.matrix = array(self.matrix.typecode, matrix)
+        self.capacity = size
+        self.version += 1
+
+    def export_matrix(self):
+        """
+        returns the distances between the locations without the unused capacity
+        :return: N x N NumPy array or flat array of N * N floats
+        """
+        size = len(self.locations)
+        if numpy is not None:
+            return self.matrix[:size, :size]
+        compact = array(self.matrix.typecode)
+        for i in range(size):
+            compact.extend(self.matrix[i * self.capacity:i * self.capacity + size])
+        return compact
+
+    def set_cell(self, row: int, column: int, distance: float):
+        """
+        stores one distance in the matrix
+        :return: None
+        """
+        if numpy is not None:
+            self.matrix[row, column] = distance
+        else:
+            self.matrix[row * self.capacity + column] = distance
+
+    def get_distance(self, from_point: Location, to_point: Location) -> float:
+        """
+        returns the distance between 2 points
+        :param from_point: Location
+        :param to_point: Location
+        :return: float or None if the points are not adjacent
+        """
+        if from_point is None or to_point is None:
+            return 0
+        if from_point is to_point:
+            return 0
+        row = self.indexes[from_point]
+        column = self.indexes[to_point]
+        if numpy is not None:
+            distance = float(self.matrix[row, column])
+        else:
+            distance = self.matrix[row * self.capacity + column]
+        if distance == MISSING:
+            return None
+        return distance
+
+    def get_row(self, from_point: Location, to_points=None):
+        """
+        returns the distances from one point to many in a single query
+        :param from_point: Location
+        :param to_points: list of Locations, all locations if None
+        :return: numpy array or list of floats in the same order as to_points
+        """
+        row = self.indexes[from_point]
+        size = len(self.locations)
+        if numpy is not None:
+            if to_points is None:
+                return self.matrix[row, :size]
+            columns = numpy.fromiter((self.indexes[point] for point in to_points), dtype=numpy.intp)
+            return self.matrix[row, columns]
+        start = row * self.capacity
+        if to_points is None:
+            return self.matrix[start:start + size].tolist()
+        matrix = self.matrix
+        indexes = self.indexes
+        return [matrix[start + indexes[point]] for point in to_points]
+
+    def nearest_neighbor_tour(self, points: list) -> list:
+        """
+        orders points by repeatedly moving to the closest unvisited point, starting at points[0],
+        each step is one argmin over the current point's row with the visited points masked out,
+        ties keep the order of points
+        :param points: list of Locations
+        :return: List[int] indexes of points in visiting order, starting with 0
+        """
+        if numpy is None:
+            return super().nearest_neighbor_tour(points)
+        indexes = numpy.fromiter((self.indexes[point] for point in points), dtype=numpy.intp)
+        visited = numpy.zeros(len(points), dtype=bool)
+        visited[0] = True
+        current = 0
+        tour = [0]
+        for _ in range(len(points) - 1):
+            row = numpy.where(visited, MISSING, self.matrix[indexes[current], indexes])
+            current = int(row.argmin())
+            if visited[current]:  # only points without an edge from current are left
+                current = int(visited.argmin())
+            visited[current] = True
+            tour.append(current)
+        return tour
+
+    def closest(self, from_point: Location, to_points: list):
+        """
+        returns the closest of to_points using an argmin over the matrix row
+        :param from_point: Location
+        :param to_points: list of Locations
+        :return: (Location, float) or (None, inf) if to_points is empty
+        """
+        if not to_points:
+            return None, MISSING
+        distances = self.get_row(from_point, to_points)
+        if numpy is not None:
+            best = int(numpy.argmin(distances))
+            return to_points[best], float(distances[best])
+        shortest = min(distances)
+        return to_points[distances.index(shortest)], shortest
@@ -0,0 +1,135 @@
+"""
+Bounded memoization for distance and shortest path leg queries. Entries are evicted least recently used
+first and every cache is cleared when add_distance changes the graph's version.
+"""
+from functools import lru_cache
+
+from dense_distance_table import DenseDistanceTable
+from distance_table import DistanceTable
+
+
+class LRUMemo:
+    """
+    LRUMemo wraps a two argument query in an lru_cache that is thrown away whenever graph.version changes.
+    Big-O is as follows:
+    __call__: O(1) on a hit, the cost of the query on a miss
+    stats: O(1)
+    """
+    def __init__(self, function, graph, maxsize: int):
+        """
+        :param function: callable(from_point, to_point)
+        :param graph: DistanceTable whose version invalidates the cache
+        :param maxsize: entries kept before the least recently used is evicted
+        """
+        self.function = function
+        self.graph = graph
+        self.maxsize = maxsize
+        self.version = graph.version
+        self.cached = lru_cache(maxsize)(function)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __call__(self, from_point, to_point):
+        if self.version != self.graph.version:
+            self.invalidate()
+        return self.cached(from_point, to_point)
+
+    def invalidate(self):
+        """
+        Clears the cache and keeps its hit and miss counts. Only clearing a cache that held entries is counted.
+        :return: None
+        """
+        info = self.cached.cache_info()
+        self.hits += info.hits
+        self.misses += info.misses
+        if info.currsize:
+            self.invalidations += 1
+        self.cached.cache_clear()
+        self.version = self.graph.version
+
+    def stats(self) -> dict:
+        """
+        :return: dict with hits, misses, hit_rate, size, maxsize and invalidations
+        """
+        info = self.cached.cache_info()
+        hits = self.hits + info.hits
+        misses = self.misses + info.misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "size": info.currsize,
+            "maxsize": self.maxsize,
+            "invalidations": self.invalidations,
+        }
+
+
+class CachedGraph:
+    """
+    CachedGraph stands in for a DistanceTable whose lookups are expensive: get_distance is memoized and
+    everything else is passed straight through to the wrapped graph.
+    Over a table that is not dense, the row queries read the memo one entry at a time. Over a dense table
+    they are passed through, since one vectorized read of the matrix row is cheaper than K memo hits
+    and a memo keyed by the whole list of points would cost as much to key as to answer.
+    Big-O is as follows:
+    get_distance: O(1) on a hit, the cost of the wrapped lookup on a miss
+    get_row, closest: O(K)
+    nearest_neighbor_tour: O(K^2)
+    """
+    def __init__(self, graph, maxsize=65536):
+        """
+        :param graph: DistanceTable
+        :param maxsize: distances kept
+        """
+        self.graph = graph
+        self.dense = isinstance(graph, DenseDistanceTable)
+        self.get_distance = LRUMemo(graph.get_distance, graph, maxsize)
+
+    def __getattr__(self, name):
+        return getattr(self.graph, name)
+
+    def get_row(self, from_point, to_points=None):
+        """
+        :return: the distances from one point to many, see DistanceTable.get_row
+        """
+        if self.dense:
+            return self.graph.get_row(from_point, to_points)
+        return DistanceTable.get_row(self, from_point, to_points)
+
+    def closest(self, from_point, to_points: list):
+        """
+        :return: (Location, float) the closest of to_points, see DistanceTable.closest
+        """
+        if self.dense:
+            return self.graph.closest(from_point, to_points)
+        return DistanceTable.closest(self, from_point, to_points)
+
+    def nearest_neighbor_tour(self, points: list) -> list:
+        """
+        :return: List[int] indexes of points in nearest neighbor order, see DistanceTable.nearest_neighbor_tour
+        """
+        if self.dense:
+            return self.graph.nearest_neighbor_tour(points)
+        return DistanceTable.nearest_neighbor_tour(self, points)
+
+
+class CachedLegs:
+    """
+    CachedLegs memoizes the length and the path of shortest path legs between two locations.
+    """
+    def __init__(self, paths, maxsize=4096):
+        """
+        :param paths: ShortestPaths
+        :param maxsize: legs kept for each of distance and path
+        """
+        self.paths = paths
+        self.distance = LRUMemo(paths.distance, paths.graph, maxsize)
+        self.path = LRUMemo(lambda from_point, to_point: tuple(paths.path(from_point, to_point)), paths.graph,
+                            maxsize)
+
+    def stats(self) -> dict:
+        """
+        :return: dict with the stats of the distance and path caches
+        """
+        return {"distance": self.distance.stats(), "path": self.path.stats()}
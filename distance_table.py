@@ -1,27 +1,42 @@
 """
 This graph class represents the data from the WGUPS_Distance_Table.csv
 """
+from bisect import bisect_left, bisect_right, insort
+
 from location import Location
 
 
 class DistanceTable:
     """
-    DistanceTable uses 2 dictionaries to represent adjacency list and edge weights.
+    DistanceTable uses 2 dictionaries to represent adjacency list and edge weights,
+    and two more to look up locations by label and by zip code.
     Big-O is as follows:
     add_location: O(1)
     add_distance: O(1)
-    get_location: O(N)
-    get_zip_code_matches: O(N^2)
+    get_location: O(1)
+    get_locations: O(K)
+    get_zip_code_matches: O(K + M) for K locations and M matches
     get_distance: O(1)
+    adjacent: O(1)
+    get_row: O(K)
+    nearest_neighbor_tour: O(K^2)
+    closest: O(K)
     print_table: O(N)
     """
     def __init__(self):
         """
         Adjacency List: points
         Edge Weights: distances
+        Label Index: labels
+        Zip Code Index: zip_codes, with the distinct zip codes kept sorted in zip_code_list
+        Version: counts changes so cached results built from the graph can tell when they are stale
         """
         self.points = {}
         self.distances = {}
+        self.labels = {}
+        self.zip_codes = {}
+        self.zip_code_list = []
+        self.version = 0
 
     def add_location(self, new_location: Location):
         """
@@ -30,6 +45,13 @@ class DistanceTable:
         :return: None
         """
         self.points[new_location] = []
+        self.version += 1
+        self.labels.setdefault(self.label_key(new_location.label), new_location)
+        zip_code = int(new_location.zip_code)
+        if zip_code not in self.zip_codes:
+            self.zip_codes[zip_code] = set()
+            insort(self.zip_code_list, zip_code)
+        self.zip_codes[zip_code].add(new_location)
 
     def add_distance(self, point_a: Location, point_b: Location, distance: float):
         """
@@ -40,33 +62,64 @@ class DistanceTable:
         :param distance: int
         :return: None
         """
+        self.version += 1
         self.distances[(point_a, point_b)] = distance
         self.points[point_a].append(point_b)
         self.distances[(point_b, point_a)] = distance
         self.points[point_b].append(point_a)
 
+    @staticmethod
+    def label_key(label: str) -> str:
+        """
+        Normalizes a label or delivery address so small differences in spelling still match.
+        :param label: str
+        :return: abbreviated, single spaced, lower case label
+        """
+        return " ".join(Location.convert_delivery_label(label).split()).lower()
+
     def get_location(self, label: str):
         """
-        iterate over the locations in points and return the location with a matching label if found
+        return the location with a matching label if found
         :param label: str
         :return: Location with matching label or None if not found
         """
-        for location in self.points:
-            if location.label == label:
-                return location
-        return None
+        return self.labels.get(self.label_key(label))
 
-    def get_zip_code_matches(self, locations: list) -> set:
+    def get_locations(self, labels) -> list:
+        """
+        return the location for each label in labels
+        :param labels: iterable of str
+        :return: List[Location] with None for labels that are not found
         """
-        iterate over the locations in points and return all locations with same zip_code
-        :param locations: list of locations
+        label_key = self.label_key
+        index = self.labels
+        return [index.get(label_key(label)) for label in labels]
+
+    def get_zip_code_matches(self, locations, prefix_length=5, spread=0) -> set:
+        """
+        return all locations in the same zip code as any of the given locations.
+        Zip codes can be grouped regionally by matching only the first prefix_length digits,
+        or by including zip codes within spread of each other.
+        :param locations: iterable of locations
+        :param prefix_length: number of leading zip code digits that must match
+        :param spread: how far apart two zip codes can be and still match
         :return: set of Locations with matching zip_codes
         """
-        matches = set()
+        width = 10 ** (5 - prefix_length)
+        ranges = set()
         for location in locations:
-            for point in self.points:
-                if location.zip_code == point.zip_code:
-                    matches.add(point)
+            zip_code = int(location.zip_code)
+            low = zip_code // width * width
+            ranges.add((low - spread, low + width - 1 + spread))
+        matches = set()
+        for low, high in ranges:
+            if low == high:
+                matches.update(self.zip_codes.get(low, ()))
+                continue
+            start = bisect_left(self.zip_code_list, low)
+            end = bisect_right(self.zip_code_list, high)
+            for zip_code in self.zip_code_list[start:end]:
+                matches.update(self.zip_codes[zip_code])
         return matches
 
     def get_distance(self, from_point: Location, to_point: Location) -> float:
@@ -83,6 +136,56 @@ class DistanceTable:
         distance = self.distances.get((from_point, to_point))
         return distance
 
+    def adjacent(self, point: Location) -> list:
+        """
+        returns the locations adjacent to point
+        :param point: Location
+        :return: List[Location]
+        """
+        return self.points[point]
+
+    def get_row(self, from_point: Location, to_points=None) -> list:
+        """
+        returns the distances from one point to many in a single query
+        :param from_point: Location
+        :param to_points: list of Locations, all locations if None
+        :return: list of floats in the same order as to_points
+        """
+        if to_points is None:
+            to_points = self.points
+        return [self.get_distance(from_point, point) for point in to_points]
+
+    def nearest_neighbor_tour(self, points: list) -> list:
+        """
+        orders points by repeatedly moving to the closest unvisited point, starting at points[0],
+        each step queries one row of the unvisited points and ties keep the order of points
+        :param points: list of Locations
+        :return: List[int] indexes of points in visiting order, starting with 0
+        """
+        remaining = list(range(1, len(points)))
+        tour = [0]
+        while remaining:
+            row = self.get_row(points[tour[-1]], [points[i] for i in remaining])
+            best = min(range(len(row)), key=lambda position: float("inf") if row[position] is None else row[position])
+            tour.append(remaining.pop(best))
+        return tour
+
+    def closest(self, from_point: Location, to_points: list):
+        """
+        loop through to_points and hold onto the min value to find the shortest distance
+        :param from_point: Location
+        :param to_points: list of Locations
+        :return: (Location, float) or (None, inf) if to_points is empty
+        """
+        neighbor = None
+        val = float("inf")
+        for point in to_points:
+            dist = self.get_distance(from_point, point)
+            if dist is not None and dist < val:
+                neighbor = point
+                val = dist
+        return neighbor, val
+
     def print_table(self):
         """
         prints out a list of all the labels contained in the graph
@@ -0,0 +1,101 @@
+"""
+The EventLog records every package status change so statuses can be looked up at any time of day.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+
+class EventLog:
+    """
+    Events are (time, pkg_id, status) tuples with time in minutes since midnight.
+    Events are kept sorted by time, along with sorted lists per package and per status.
+    Big-O is as follows:
+    record: O(1) amortized when events arrive in time order, O(N) otherwise
+    status_at: O(log K) for K events of the package
+    between: O(log N + K)
+    with_status_by: O(log N + K)
+    snapshot: O(log N + K)
+    """
+    def __init__(self, initial_status="At Hub"):
+        """
+        :param initial_status: status of every package before its first event
+        """
+        self.initial_status = initial_status
+        self.times = []
+        self.events = []
+        self.by_package = {}
+        self.by_status = {}
+
+    def record(self, time: int, pkg_id: int, status: str):
+        """
+        Adds an event to the log.
+        :param time: minutes since midnight
+        :param pkg_id: id of the package
+        :param status: the package's new status
+        :return: None
+        """
+        event = (time, pkg_id, status)
+        position = bisect_right(self.times, time)
+        self.times.insert(position, time)
+        self.events.insert(position, event)
+        times, statuses = self.by_package.setdefault(pkg_id, ([], []))
+        position = bisect_right(times, time)
+        times.insert(position, time)
+        statuses.insert(position, status)
+        insort(self.by_status.setdefault(status, []), (time, pkg_id))
+
+    def status_at(self, pkg_id: int, time: int):
+        """
+        Returns the status of a package at the given time.
+        :param pkg_id: id of the package
+        :param time: minutes since midnight
+        :return: (status, minutes the status started or None if it never changed)
+        """
+        times, statuses = self.by_package.get(pkg_id, ((), ()))
+        position = bisect_right(times, time)
+        if position == 0:
+            return self.initial_status, None
+        return statuses[position - 1], times[position - 1]
+
+    def between(self, start: int, end: int) -> list:
+        """
+        Returns the events with start <= time < end in time order.
+        :param start: minutes since midnight
+        :param end: minutes since midnight
+        :return: List[(time, pkg_id, status)]
+        """
+        return self.events[bisect_left(self.times, start):bisect_left(self.times, end)]
+
+    def with_status_by(self, status: str, time: int) -> list:
+        """
+        Returns the pkg_ids that entered status before the given time.
+        :param status: str
+        :param time: minutes since midnight
+        :return: List[int] in the order the packages entered the status
+        """
+        history = self.by_status.get(status, [])
+        return [pkg_id for _, pkg_id in history[:bisect_left(history, (time,))]]
+
+    def snapshot(self, time: int) -> dict:
+        """
+        Returns the latest status of every package that has an event at or before the given time.
+        Packages missing from the result still have the initial status.
+        :param time: minutes since midnight
+        :return: Dict[pkg_id, (status, minutes)]
+        """
+        statuses = {}
+        for event_time, pkg_id, status in self.events[:bisect_right(self.times, time)]:
+            statuses[pkg_id] = (status, event_time)
+        return statuses
+
+    def clear(self):
+        """
+        Removes every event.
+        :return: None
+        """
+        self.times.clear()
+        self.events.clear()
+        self.by_package.clear()
+        self.by_status.clear()
+
+    def __len__(self) -> int:
+        return len(self.events)
@@ -0,0 +1,110 @@
+"""
+On disk cache of the parsed distance table. The distance matrix is stored as raw little endian
+float64 values in <csv>.matrix so it can be memory mapped, and the locations and the csv's
+fingerprint are stored in a <csv>.json sidecar.
+"""
+import hashlib
+import json
+import os
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CACHE_VERSION = 1
+
+
+def cache_paths(csv_path: str):
+    """
+    Returns the paths of the matrix file and the sidecar for a csv file.
+    :param csv_path: path to the distance table csv
+    :return: (matrix path, sidecar path)
+    """
+    return csv_path + ".matrix", csv_path + ".json"
+
+
+def fingerprint(csv_path: str) -> dict:
+    """
+    Returns the size, mtime and sha1 of the csv file.
+    :param csv_path: path to the distance table csv
+    :return: dict
+    """
+    stat = os.stat(csv_path)
+    digest = hashlib.sha1()
+    with open(csv_path, "rb") as csv_file:
+        for block in iter(lambda: csv_file.read(1 << 20), b""):
+            digest.update(block)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": digest.hexdigest()}
+
+
+def is_current(csv_path: str, saved: dict) -> bool:
+    """
+    A cache is current when the csv's size and mtime match, or failing that when its sha1 matches.
+    :param csv_path: path to the distance table csv
+    :param saved: fingerprint stored in the sidecar
+    :return: bool
+    """
+    stat = os.stat(csv_path)
+    if stat.st_size != saved.get("size"):
+        return False
+    if stat.st_mtime_ns == saved.get("mtime_ns"):
+        return True
+    return fingerprint(csv_path)["sha1"] == saved.get("sha1")
+
+
+def load(csv_path: str):
+    """
+    Loads the cached locations and distance matrix for a csv file.
+    :param csv_path: path to the distance table csv
+    :return: (List[location args], matrix, size) or None if there is no current cache
+    """
+    matrix_path, sidecar_path = cache_paths(csv_path)
+    try:
+        with open(sidecar_path) as sidecar_file:
+            sidecar = json.load(sidecar_file)
+        if sidecar.get("version") != CACHE_VERSION or not is_current(csv_path, sidecar["source"]):
+            return None
+        size = sidecar["size"]
+        if numpy is not None:
+            matrix = numpy.memmap(matrix_path, dtype="<f8", mode="c", shape=(size, size))
+        else:
+            matrix = array("d")
+            with open(matrix_path, "rb") as matrix_file:
+                matrix.fromfile(matrix_file, size * size)
+            if sys.byteorder == "big":
+                matrix.byteswap()
+    except (OSError, ValueError, KeyError, EOFError):
+        return None
+    return sidecar["locations"], matrix, size
+
+
+def save(csv_path: str, location_args: list, matrix, size: int):
+    """
+    Writes the cache for a csv file. Failures to write are ignored since the cache is optional.
+    :param csv_path: path to the distance table csv
+    :param location_args: (name, address, zip_code, label) for each location loaded from the csv
+    :param matrix: numpy array or flat array of the first size x size distances
+    :param size: number of rows in the matrix
+    :return: None
+    """
+    matrix_path, sidecar_path = cache_paths(csv_path)
+    sidecar = {"version": CACHE_VERSION, "source": fingerprint(csv_path), "size": size,
+               "locations": location_args}
+    try:
+        if numpy is not None:
+            numpy.ascontiguousarray(matrix, dtype="<f8").tofile(matrix_path + ".tmp")
+        else:
+            values = array("d", matrix)
+            if sys.byteorder == "big":
+                values.byteswap()
+            with open(matrix_path + ".tmp", "wb") as matrix_file:
+                values.tofile(matrix_file)
+        with open(sidecar_path + ".tmp", "w") as sidecar_file:
+            json.dump(sidecar, sidecar_file)
+        os.replace(matrix_path + ".tmp", matrix_path)
+        os.replace(sidecar_path + ".tmp", sidecar_path)
+    except OSError:
+        pass
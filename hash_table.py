@@ -1,38 +1,187 @@
 """
 HashTable to manage storage of all packages and their information
 """
-from package import Package
+from bisect import bisect_left, bisect_right, insort
+from operator import attrgetter, itemgetter
+
+from package import END_OF_DAY, STATUSES, Package, status_code
+
+EMPTY = -1
+DELETED = -2
 
 
 # noinspection PyMethodMayBeStatic
 class HashTable:
     """
+    Open addressing hash table keyed by pkg_id.
+    slots holds an index into entries (or EMPTY/DELETED), entries holds [pkg_id, Package]
+    pairs in insertion order so iterating the table visits packages in the order they were loaded.
+    Secondary indexes map delivery_status, address, zip_code and deadline to pkg_ids, with the
+    distinct deadlines kept in a sorted list. Packages report changes back through reindex so the indexes stay current.
     The Hashtable class has Big-O is as follows:
     Init: O(N)
     Resize: O(N)
-    Lookup: O(1)
-    Insert: O(1)
-    Update: O(1)
-    Remove: O(1)
+    Lookup: O(1) amortized
+    Insert: O(1) amortized
+    Update: O(1) amortized
+    Remove: O(1) amortized
+    Iterate: O(N)
+    Reindex: O(1)
+    Look up many, set status many: O(K) for K pkg_ids
+    Insert many, put many: O(K) plus one resize and one sort of new deadlines
+    Load, rebuild indexes: O(N)
+    Select: O(K log K) for K candidates
+    Deadline range: O(log D + K log K) for D distinct deadlines
     """
 
-    def __init__(self, table_size=41):
+    def __init__(self, table_size=41, load_factor=0.8):
         """
-        table is initialized with empty values and small initial capacity
+        table is initialized with empty slots and small initial capacity
+        :param table_size: initial number of slots, rounded up to a power of 2
+        :param load_factor: fraction of used slots that triggers a resize
         """
-        self.dummy_pkg = Package(0, "", 0, "EOD", 0, "")
-        self.table_size = table_size
-        self.table = [self.dummy_pkg] * self.table_size
+        self.load_factor = load_factor
+        self.table_size = self.round_capacity(table_size)
+        self.slots = [EMPTY] * self.table_size
+        self.entries = []
         self.element_count = 0
+        self.used_count = 0  # live entries plus DELETED tombstones
+        self.by_status = {}
+        self.by_address = {}
+        self.by_zip = {}
+        self.by_deadline = {}
+        self.deadlines = []
+
+    @staticmethod
+    def round_capacity(size: int) -> int:
+        """
+        Round size up to the next power of 2 so probing can mask instead of mod.
+        :param size: requested capacity
+        :return: int
+        """
+        capacity = 8
+        while capacity < size:
+            capacity <<= 1
+        return capacity
+
+    def find_slot(self, pkg_id: int):
+        """
+        Probes the slots for pkg_id using perturbed probing.
+        :param pkg_id: int
+        :return: (slot to use, index into entries or EMPTY if the key is missing)
+        """
+        slots = self.slots
+        mask = self.table_size - 1
+        perturb = hash(pkg_id) & 0xFFFFFFFFFFFFFFFF
+        i = perturb & mask
+        free = EMPTY
+        while True:
+            index = slots[i]
+            if index == EMPTY:
+                return (i if free == EMPTY else free), EMPTY
+            if index == DELETED:
+                if free == EMPTY:
+                    free = i
+            elif self.entries[index][0] == pkg_id:
+                return i, index
+            perturb >>= 5
+            i = (i * 5 + perturb + 1) & mask
 
     def resize(self):
         """
-        if the element count exceeds 80% of the hash table size, the hash table is doubled in size
+        if the used slots exceed the load factor, the hash table is doubled in size.
+        Tombstones and removed entries are dropped while rehashing.
         :return: None
         """
-        if self.element_count > len(self.table) * 0.8:
-            expansion = [self.dummy_pkg] * self.table_size
-            self.table.extend(expansion)
+        if max(self.used_count, len(self.entries)) + 1 <= self.table_size * self.load_factor:
+            return
+        capacity = self.table_size
+        if self.element_count + 1 > capacity * self.load_factor / 2:
+            capacity <<= 1
+        self.rehash(capacity)
+
+    def reserve(self, count: int):
+        """
+        Grows the table ahead of a bulk insert so count packages fit without resizing one step at a time.
+        :param count: total number of packages the table should hold
+        :return: None
+        """
+        capacity = self.table_size
+        while count + 1 > capacity * self.load_factor:
+            capacity <<= 1
+        if capacity != self.table_size:
+            self.rehash(capacity)
+
+    def rehash(self, capacity: int):
+        """
+        Rebuilds the slots at the given capacity from the live entries.
+        :param capacity: power of 2
+        :return: None
+        """
+        self.entries = [entry for entry in self.entries if entry is not None]
+        self.table_size = capacity
+        self.slots = [EMPTY] * capacity
+        for index, entry in enumerate(self.entries):
+            slot = self.find_slot(entry[0])[0]
+            self.slots[slot] = index
+        self.used_count = len(self.entries)
+
+    def load(self, packages: list, slots=None):
+        """
+        Replaces the contents of the table with packages in the given order. slots may be a saved slot list
+        for exactly these packages, written from a table without removed entries, which saves probing for
+        every package. Without it the slots are rebuilt. The secondary indexes are rebuilt in bulk.
+        :param packages: List[Package] with distinct pkg_ids
+        :param slots: sequence of ints, a power of 2 long
+        :return: None
+        """
+        self.entries = [[int(package.pkg_id), package] for package in packages]
+        self.element_count = len(self.entries)
+        if slots is not None and len(slots) >= 8 and len(slots) & (len(slots) - 1) == 0:
+            self.table_size = len(slots)
+            self.slots = list(slots)
+            self.used_count = self.table_size - self.slots.count(EMPTY)
+        else:
+            capacity = self.round_capacity(8)
+            while self.element_count + 1 > capacity * self.load_factor:
+                capacity <<= 1
+            self.rehash(capacity)
+        self.rebuild_indexes()
+
+    def rebuild_indexes(self):
+        """
+        Rebuilds every secondary index from the stored packages, grouping the pkg_ids by key
+        instead of adding one package at a time.
+        :return: None
+        """
+        live = [entry for entry in self.entries if entry is not None]
+        pkg_ids = [pkg_id for pkg_id, _ in live]
+        packages = [package for _, package in live]
+        for package in packages:
+            package.listener = self
+        zip_keys = {}
+        for package in packages:
+            if package.zip_code not in zip_keys:
+                zip_keys[package.zip_code] = self.zip_key(package.zip_code)
+        self.by_status = self.group(pkg_ids, [package.delivery_status for package in packages])
+        self.by_address = self.group(pkg_ids, [package.address for package in packages])
+        self.by_zip = self.group(pkg_ids, [zip_keys[package.zip_code] for package in packages])
+        self.by_deadline = self.group(pkg_ids, [package.deadline_minutes for package in packages])
+        self.deadlines = sorted(self.by_deadline)
+
+    @staticmethod
+    def group(pkg_ids: list, keys: list) -> dict:
+        """
+        Builds a secondary index from parallel lists of pkg_ids and keys.
+        :return: Dict[key, Dict[int, None]]
+        """
+        index = {}
+        for pkg_id, key in zip(pkg_ids, keys):
+            bucket = index.get(key)
+            if bucket is None:
+                bucket = index[key] = {}
+            bucket[pkg_id] = None
+        return index
 
     def look_up(self, pkg_id: int):
         """
@@ -40,10 +189,186 @@ class HashTable:
         :param pkg_id: int
         :return: Package
         """
-        index = int(pkg_id)
-        if self.table[index] is None:
+        index = self.find_slot(int(pkg_id))[1]
+        if index == EMPTY:
             return None
-        return self.table[index]
+        return self.entries[index][1]
+
+    def look_up_many(self, pkg_ids) -> list:
+        """
+        Gets the packages for many pkg_ids in one pass, probing inline instead of once per call.
+        :param pkg_ids: iterable of pkg_ids
+        :return: List[Package] in the order of pkg_ids, None for each missing pkg_id
+        """
+        slots = self.slots
+        entries = self.entries
+        mask = self.table_size - 1
+        packages = []
+        for pkg_id in pkg_ids:
+            pkg_id = int(pkg_id)
+            perturb = hash(pkg_id) & 0xFFFFFFFFFFFFFFFF
+            i = perturb & mask
+            while True:
+                index = slots[i]
+                if index == EMPTY:
+                    packages.append(None)
+                    break
+                if index != DELETED and entries[index][0] == pkg_id:
+                    packages.append(entries[index][1])
+                    break
+                perturb >>= 5
+                i = (i * 5 + perturb + 1) & mask
+        return packages
+
+    def packages_for(self, pkg_ids) -> list:
+        """
+        Gets the distinct packages for a batch of pkg_ids in no particular order. A batch covering a large part
+        of the table is matched with one pass over entries, which reads memory in order instead of
+        probing a random slot for every pkg_id, and a batch naming every stored package returns them all
+        without testing each one.
+        :param pkg_ids: iterable of pkg_ids, missing and repeated ones are skipped
+        :return: List[Package]
+        """
+        if not isinstance(pkg_ids, (list, tuple, set, dict)):
+            pkg_ids = list(pkg_ids)
+        if len(pkg_ids) * 16 < self.element_count:
+            return [package for package in self.look_up_many(dict.fromkeys(pkg_ids)) if package is not None]
+        entries = list(filter(None, self.entries))
+        wanted = set(pkg_ids)
+        if wanted.issuperset(map(itemgetter(0), entries)):
+            return list(map(itemgetter(1), entries))
+        wanted = {int(pkg_id) for pkg_id in wanted}
+        return [entry[1] for entry in entries if entry[0] in wanted]
+
+    def set_status_many(self, pkg_ids, status: str, minutes: int = None) -> int:
+        """
+        Sets the delivery_status, and the delivery time if given, of many packages at once.
+        The status index is updated once per old status instead of once per package, and when every package
+        with an old status moves, its bucket is handed over whole.
+        :param pkg_ids: iterable of pkg_ids, missing ones are skipped
+        :param status: the new delivery_status
+        :param minutes: delivery time in minutes since midnight, left unchanged if None
+        :return: number of packages updated
+        """
+        packages = self.packages_for(pkg_ids)
+        self.apply_status(packages, status, minutes)
+        return len(packages)
+
+    def apply_status(self, packages: list, status: str, minutes: int = None):
+        """
+        Sets the delivery_status, and the delivery time if given, of stored packages. Used by set_status_many.
+        When the packages are the whole table, or all share one old status, they are moved without
+        sorting them by status.
+        :param packages: List[Package] from this table, each at most once
+        :param status: the new delivery_status
+        :param minutes: delivery time in minutes since midnight, left unchanged if None
+        :return: None
+        """
+        code = status_code(status)
+        if minutes is not None:
+            for package in packages:
+                package.delivery_minutes = minutes
+        by_status = self.by_status
+        if packages and len(packages) == self.element_count:
+            # the whole table moves, so the old statuses are read from the index instead of from every package
+            for package in packages:
+                package._status = code
+            new_bucket = by_status.pop(status, None)
+            for bucket in by_status.values():
+                if new_bucket is None:
+                    new_bucket = bucket
+                else:
+                    new_bucket.update(bucket)
+            by_status.clear()
+            by_status[status] = new_bucket
+            return
+        olds = set(map(attrgetter("_status"), packages))
+        if code in olds:
+            olds.discard(code)
+            packages = [package for package in packages if package._status != code]
+        if not olds:
+            return
+        if len(olds) == 1:
+            moved = {olds.pop(): packages}
+        else:
+            moved = {old: [] for old in olds}
+            for package in packages:
+                moved[package._status].append(package)
+        for package in packages:
+            package._status = code
+        for old, group in moved.items():
+            old_status = STATUSES[old]
+            bucket = by_status[old_status]
+            if len(group) == len(bucket):
+                # every package with the old status moved, so its bucket is reused or merged whole
+                del by_status[old_status]
+                if status not in by_status:
+                    by_status[status] = bucket
+                    continue
+                ids = bucket
+            else:
+                ids = [int(package.pkg_id) for package in group]
+                for pkg_id in ids:
+                    del bucket[pkg_id]
+            new_bucket = by_status.get(status)
+            if new_bucket is None:
+                new_bucket = by_status[status] = {}
+            new_bucket.update(dict.fromkeys(ids))
+
+    def insert_many(self, rows) -> int:
+        """
+        Creates and stores a package for each row, see put_many.
+        :param rows: sequence of (pkg_id, address, zip_code, deadline, weight, notes)
+        :return: number of rows stored
+        """
+        return self.put_many([Package(*row) for row in rows])
+
+    def put_many(self, packages: list) -> int:
+        """
+        Stores many packages. The table is grown once for the whole batch and new deadlines
+        are sorted into the deadline list once at the end.
+        Packages with a pkg_id already in the table replace that package.
+        :param packages: List[Package]
+        :return: number of packages stored
+        """
+        self.reserve(max(self.used_count, len(self.entries)) + len(packages))
+        slots = self.slots
+        entries = self.entries
+        by_status = self.by_status
+        by_address = self.by_address
+        by_zip = self.by_zip
+        by_deadline = self.by_deadline
+        new_deadlines = set()
+        added = 0
+        for package in packages:
+            pkg_id = int(package.pkg_id)
+            slot, index = self.find_slot(pkg_id)
+            if index != EMPTY:
+                self.replace(index, package)
+                continue
+            if slots[slot] == EMPTY:
+                self.used_count += 1
+            slots[slot] = len(entries)
+            entries.append([pkg_id, package])
+            added += 1
+            package.listener = self
+            self.index_add(by_status, package.delivery_status, pkg_id)
+            self.index_add(by_address, package.address, pkg_id)
+            self.index_add(by_zip, self.zip_key(package.zip_code), pkg_id)
+            minutes = package.deadline_minutes
+            bucket = by_deadline.get(minutes)
+            if bucket is None:
+                bucket = by_deadline[minutes] = {}
+                new_deadlines.add(minutes)
+            bucket[pkg_id] = None
+        self.element_count += added
+        # a package replaced later in the same batch can leave its deadline without packages,
+        # or put it back into the list already through replace
+        existing = set(self.deadlines)
+        new_deadlines = [minutes for minutes in new_deadlines if minutes in by_deadline and minutes not in existing]
+        if new_deadlines:
+            self.deadlines = sorted(self.deadlines + new_deadlines)
+        return len(packages)
 
     def insert(self, pkg_id: int, address: str, zip_code: int, dl: str, wt: int, notes: str):
         """
@@ -56,27 +381,236 @@ class HashTable:
         :param notes: misc. delivery instructions
         :return: None
         """
-        self.resize()
-        index = int(pkg_id)
         new_pkg = Package(pkg_id, address, zip_code, dl, wt, notes)
-        self.table[index] = new_pkg
+        self.put(new_pkg)
+
+    def put(self, package: Package):
+        """
+        Stores the package under its pkg_id, replacing any package with the same id.
+        :param package: Package
+        :return: None
+        """
+        self.resize()
+        pkg_id = int(package.pkg_id)
+        slot, index = self.find_slot(pkg_id)
+        if index != EMPTY:
+            self.replace(index, package)
+            return
+        if self.slots[slot] == EMPTY:
+            self.used_count += 1
+        self.slots[slot] = len(self.entries)
+        self.entries.append([pkg_id, package])
         self.element_count += 1
+        self.add_indexes(package)
 
-    def update(self, package):
+    def commit(self):
+        """
+        The table only lives in memory, so there is nothing to make durable. See package_store.JournaledHashTable.
+        :return: None
+        """
+
+    def update(self, package: Package):
         """
         Update a package if it exists in the table
         :param package: Package
         :return: None
         """
-        if self.look_up(package.pkg_id) == package.pkg_id:
-            index = int(package.pkg_id)
-            self.table[index] = package
+        index = self.find_slot(int(package.pkg_id))[1]
+        if index != EMPTY:
+            self.replace(index, package)
 
-    def remove(self, pkg_id):
+    def replace(self, index: int, package: Package):
+        """
+        Swaps the package stored at entries[index] for a new one and moves its index entries.
+        :param index: position in entries
+        :param package: Package
+        :return: None
+        """
+        old = self.entries[index][1]
+        if old is package:
+            return
+        self.remove_indexes(old)
+        self.entries[index][1] = package
+        self.add_indexes(package)
+
+    def remove(self, pkg_id: int):
         """
         Removes an item with matching pkg_id.
         :param pkg_id: int
         :return: None
         """
-        index = int(pkg_id)
-        self.table[index] = self.dummy_pkg
+        slot, index = self.find_slot(int(pkg_id))
+        if index == EMPTY:
+            return
+        self.remove_indexes(self.entries[index][1])
+        self.slots[slot] = DELETED
+        self.entries[index] = None
+        self.element_count -= 1
+
+    @staticmethod
+    def index_add(index: dict, key, pkg_id: int):
+        """
+        Adds pkg_id to the bucket for key. Buckets are dicts used as insertion ordered sets.
+        :return: None
+        """
+        bucket = index.get(key)
+        if bucket is None:
+            bucket = index[key] = {}
+        bucket[pkg_id] = None
+
+    @staticmethod
+    def index_discard(index: dict, key, pkg_id: int):
+        """
+        Removes pkg_id from the bucket for key and drops empty buckets.
+        :return: None
+        """
+        bucket = index.get(key)
+        if bucket is None:
+            return
+        bucket.pop(pkg_id, None)
+        if not bucket:
+            del index[key]
+
+    @staticmethod
+    def zip_key(zip_code) -> int:
+        """
+        Zip codes arrive as int from the csv and as str from corrections.
+        :return: int
+        """
+        try:
+            return int(zip_code)
+        except ValueError:
+            return 0
+
+    def add_indexes(self, package: Package):
+        """
+        Adds the package to every secondary index and starts listening for its changes.
+        :param package: Package
+        :return: None
+        """
+        pkg_id = int(package.pkg_id)
+        package.listener = self
+        self.index_add(self.by_status, package.delivery_status, pkg_id)
+        self.index_add(self.by_address, package.address, pkg_id)
+        self.index_add(self.by_zip, self.zip_key(package.zip_code), pkg_id)
+        deadline = package.deadline_minutes
+        if deadline not in self.by_deadline:
+            insort(self.deadlines, deadline)
+        self.index_add(self.by_deadline, deadline, pkg_id)
+
+    def remove_indexes(self, package: Package):
+        """
+        Removes the package from every secondary index and stops listening for its changes.
+        :param package: Package
+        :return: None
+        """
+        pkg_id = int(package.pkg_id)
+        package.listener = None
+        self.index_discard(self.by_status, package.delivery_status, pkg_id)
+        self.index_discard(self.by_address, package.address, pkg_id)
+        self.index_discard(self.by_zip, self.zip_key(package.zip_code), pkg_id)
+        deadline = package.deadline_minutes
+        self.index_discard(self.by_deadline, deadline, pkg_id)
+        if deadline not in self.by_deadline:
+            position = bisect_left(self.deadlines, deadline)
+            if position < len(self.deadlines) and self.deadlines[position] == deadline:
+                del self.deadlines[position]
+
+    def reindex(self, package: Package, field: str, old, new):
+        """
+        Called by a stored package when one of its indexed fields changes.
+        :param package: Package that changed
+        :param field: delivery_status, address, or zip_code
+        :param old: previous value
+        :param new: new value
+        :return: None
+        """
+        pkg_id = int(package.pkg_id)
+        if field == "delivery_status":
+            index = self.by_status
+        elif field == "address":
+            index = self.by_address
+        else:
+            index = self.by_zip
+            old, new = self.zip_key(old), self.zip_key(new)
+        self.index_discard(index, old, pkg_id)
+        self.index_add(index, new, pkg_id)
+
+    def in_order(self, pkg_ids) -> list:
+        """
+        Returns the packages for pkg_ids in table (insertion) order.
+        :param pkg_ids: iterable of pkg_ids
+        :return: List[Package]
+        """
+        positions = sorted(self.find_slot(pkg_id)[1] for pkg_id in pkg_ids)
+        return [self.entries[index][1] for index in positions if index != EMPTY]
+
+    def select(self, status: str = None, address=None, zip_code=None) -> list:
+        """
+        Returns the packages matching every given criteria in table order.
+        address and zip_code may be a single value or a collection of values to match any of.
+        Only the smallest matching bucket is scanned.
+        :param status: delivery_status
+        :param address: delivery address or addresses
+        :param zip_code: zip code or zip codes
+        :return: List[Package]
+        """
+        buckets = []
+        if status is not None:
+            buckets.append(self.by_status.get(status, {}))
+        if address is not None:
+            buckets.append(self.bucket(self.by_address, address))
+        if zip_code is not None:
+            if isinstance(zip_code, (int, str)):
+                zip_code = [zip_code]
+            buckets.append(self.bucket(self.by_zip, [self.zip_key(code) for code in zip_code]))
+        if not buckets:
+            return list(self)
+        buckets.sort(key=len)
+        pkg_ids = [pkg_id for pkg_id in buckets[0] if all(pkg_id in bucket for bucket in buckets[1:])]
+        return self.in_order(pkg_ids)
+
+    @staticmethod
+    def bucket(index: dict, keys):
+        """
+        Returns the bucket for a single key or the union of the buckets for a collection of keys.
+        :param index: secondary index
+        :param keys: key or collection of keys
+        :return: dict or set of pkg_ids
+        """
+        if isinstance(keys, (int, str)):
+            return index.get(keys, {})
+        pkg_ids = set()
+        for key in keys:
+            pkg_ids.update(index.get(key, ()))
+        return pkg_ids
+
+    def deadline_range(self, earliest: int = 0, latest: int = END_OF_DAY, status: str = None) -> list:
+        """
+        Returns the packages with earliest <= deadline <= latest in table order.
+        :param earliest: minutes since midnight
+        :param latest: minutes since midnight
+        :param status: optional delivery_status filter
+        :return: List[Package]
+        """
+        low = bisect_left(self.deadlines, earliest)
+        high = bisect_right(self.deadlines, latest)
+        pkg_ids = [pkg_id for deadline in self.deadlines[low:high] for pkg_id in self.by_deadline[deadline]]
+        if status is not None:
+            bucket = self.by_status.get(status, {})
+            pkg_ids = [pkg_id for pkg_id in pkg_ids if pkg_id in bucket]
+        return self.in_order(pkg_ids)
+
+    def __len__(self) -> int:
+        return self.element_count
+
+    def __contains__(self, pkg_id) -> bool:
+        return self.find_slot(int(pkg_id))[1] != EMPTY
+
+    def __iter__(self):
+        """
+        Yields every package in insertion order.
+        """
+        for entry in self.entries:
+            if entry is not None:
+                yield entry[1]
@@ -4,30 +4,68 @@ The Hub class loads all the data from the csv files, creates the package hash ta
 """
 import csv
 
-import distance_table
+from dense_distance_table import DenseDistanceTable
+from distance_cache import CachedGraph, CachedLegs
+from event_log import EventLog
+import graph_cache
+from instrumentation import Instrumentation, timed
+import manifest
+import parallel_routing
+import simulator
+from load_planner import LoadPlanner
 from location import Location
 from hash_table import HashTable
 from package import Package
-from truck import Truck
+from package_store import PackageStore
+from rerouting import LiveRoute, Rerouter
+from route_optimizer import RouteOptimizer
+from shortest_paths import ShortestPaths
+from trip_scheduler import TripScheduler
+from truck import Trip, Truck
 
 
 class Hub:
     """
     Class constructor takes in the number of trucks and an optional opening time.
     The hub location is created manually for use elsewhere.
+    distance_table and manifest name the csv files to load, None leaves the graph or the database empty.
+    instrumentation is an Instrumentation that collects timers and counters, disabled if None.
+    depot is the label of a location in the distance table to use as the Hub instead of WGU.
+    distance_cache_size bounds the memo of shortest path distances and legs, 0 turns it off.
+    store is a directory for a PackageStore: the database and the event log are restored from it, every change
+    is journaled there, and the manifest is only read when the store is empty.
     """
 
-    def __init__(self, truck_count=3, opening_time="08:00 AM"):
+    def __init__(self, truck_count=3, opening_time="08:00 AM", optimizer=None, shortest_path_routing=False,
+                 truck_capacity=16, distance_table='WGUPS_Distance_Table.csv', manifest='WGUPS_Package_File.csv',
+                 instrumentation=None, depot=None, distance_cache_size=65536, store=None):
         print("Welcome to Hub Management Center")
+        self.metrics = Instrumentation(enabled=False) if instrumentation is None else instrumentation
+        self.truck_capacity = truck_capacity
+        self.optimizer = RouteOptimizer() if optimizer is None else optimizer
+        self.shortest_path_routing = shortest_path_routing
         self.current_time = opening_time
         self.truck_count = truck_count
         self.trucks = []
         self.add_truck(truck_count)
         self.center = Location("Western Governors University", "4001 South 700 E", 84107, "HUB")
-        self.destinations = distance_table.DistanceTable()
-        self.database = HashTable()
-        self.load_locations()
-        self.load_packages()
+        self.destinations = DenseDistanceTable()
+        self.paths = ShortestPaths(self.destinations)
+        self.distance_cache_size = distance_cache_size
+        self.distance_cache = None
+        self.legs = CachedLegs(self.paths, distance_cache_size) if distance_cache_size else None
+        self.route_pool = None
+        self.store = None if store is None else PackageStore(store)
+        self.database = HashTable() if self.store is None else self.store.open()
+        self.events = EventLog() if self.store is None else self.store.events
+        if distance_table is not None:
+            self.load_locations(distance_table)
+        if depot is not None:
+            self.center = self.destinations.get_location(depot)
+            if self.center is None:
+                raise ValueError(f'depot {depot} is not in the distance table')
+        if manifest is not None and len(self.database) == 0:
+            self.load_packages(manifest)
 
     def add_truck(self, count):
         """
@@ -36,32 +74,35 @@ class Hub:
         :return:None
         """
         while count > 0:
-            new_truck = Truck(count)
+            new_truck = Truck(count, self.truck_capacity)
             self.trucks.append(new_truck)
             count -= 1
         self.trucks.reverse()
 
+    @timed("load_any_truck_")
     def load_any_truck_(self, truck: Truck):
         """
         Loads the next available package from hash table onto the truck.
         :param truck:Truck
         :return:None
         """
-        for pkg in self.database.table:
+        loaded = truck.pkg_count
+        for pkg in self.metrics.scan("load_any_truck_", self.database.select("At Hub")):
             if truck.not_full() is False:
                 break
-            if pkg.delivery_status != "At Hub":
-                continue
             if truck.load_package(pkg.pkg_id, self.destinations.get_location(pkg.address)):
                 pkg.delivery_status = "In Route"
+        self.metrics.count("load_any_truck_.loaded", truck.pkg_count - loaded)
 
+    @timed("load_forced_group")
     def load_forced_group(self, truck: Truck):
         """
         Loads packages that must be delivered together.
         :param truck:Truck
         :return:None
         """
-        for pkg in self.database.table:
+        loaded = truck.pkg_count
+        for pkg in self.metrics.scan("load_forced_group", self.database.select("At Hub")):
             if truck.not_full() is False:
                 break
             if pkg.delivery_status != "At Hub":
@@ -69,44 +110,48 @@ class Hub:
             if pkg.special_notes.endswith('Must', 0, 4):
                 if truck.load_package(pkg.pkg_id, self.destinations.get_location(pkg.address)):
                     pkg.delivery_status = "In Route"
-                    group = pkg.special_notes.strip('Must be delivered with ').split(',')
-                    for pair in group:
-                        pkg_match = self.database.look_up(int(pair))
+                    group = [int(pair) for pair in pkg.special_notes.strip('Must be delivered with ').split(',')]
+                    for pkg_match in self.database.look_up_many(group):
                         destination = self.destinations.get_location(pkg_match.address)
-                        truck.load_package(int(pair), destination)
-                        pkg_match.delivery_status = "In Route"
+                        truck.load_package(pkg_match.pkg_id, destination)
+                    self.database.set_status_many(group, "In Route")
+        self.metrics.count("load_forced_group.loaded", truck.pkg_count - loaded)
 
+    @timed("load_truck_2")
     def load_truck_2(self, truck: Truck):
         """
         Loads all packages that must be on truck 2.
         :param truck:Truck
         :return:None
         """
-        for pkg in self.database.table:
+        loaded = truck.pkg_count
+        for pkg in self.metrics.scan("load_truck_2", self.database.select("At Hub")):
             if truck.not_full() is False:
                 break
-            if pkg.delivery_status != "At Hub":
-                continue
             if pkg.special_notes.endswith('truck 2'):
                 if truck.load_package(pkg.pkg_id, self.destinations.get_location(pkg.address)):
                     pkg.delivery_status = "In Route"
+        self.metrics.count("load_truck_2.loaded", truck.pkg_count - loaded)
 
+    @timed("load_same_stop_truck")
     def load_same_stop_truck(self, truck: Truck):
         """
         Loads packages with delivery addresses that the truck is already going to.
+        Addresses are matched to stops through get_location, so spellings that normalize to the same label match.
         :param truck:Truck
         :return:None
         """
-        for pkg in self.database.table:
+        get_location = self.destinations.get_location
+        addresses = [address for address in self.database.by_address if get_location(address) in truck.cargo]
+        loaded = truck.pkg_count
+        for pkg in self.metrics.scan("load_same_stop_truck", self.database.select("At Hub", address=addresses)):
             if truck.not_full() is False:
                 break
-            if pkg.delivery_status != "At Hub":
-                continue
-            pkg_location = self.destinations.get_location(pkg.address)
-            if pkg_location in truck.cargo.keys():
-                if truck.load_package(pkg.pkg_id, pkg_location):
-                    pkg.delivery_status = "In Route"
+            if truck.load_package(pkg.pkg_id, self.destinations.get_location(pkg.address)):
+                pkg.delivery_status = "In Route"
+        self.metrics.count("load_same_stop_truck.loaded", truck.pkg_count - loaded)
 
+    @timed("load_zip_code_truck")
     def load_zip_code_truck(self, truck: Truck):
         """
         Loads packages with similar zip_codes onto the given truck.
@@ -114,16 +159,18 @@ class Hub:
         :return:None
         """
         zip_code_locations = self.destinations.get_zip_code_matches(truck.cargo.keys())
-        for pkg in self.database.table:
+        zip_codes = {location.zip_code for location in zip_code_locations}
+        loaded = truck.pkg_count
+        for pkg in self.metrics.scan("load_zip_code_truck", self.database.select("At Hub", zip_code=zip_codes)):
             if truck.not_full() is False:
                 break
-            if pkg.delivery_status != "At Hub":
-                continue
             pkg_location = self.destinations.get_location(pkg.address)
             if pkg_location in zip_code_locations:
                 if truck.load_package(pkg.pkg_id, pkg_location):
                     pkg.delivery_status = "In Route"
+        self.metrics.count("load_zip_code_truck.loaded", truck.pkg_count - loaded)
 
+    @timed("load_delayed_truck")
     def load_delayed_truck(self, truck: Truck, has_deadline=True):
         """
         Loads a truck with delayed packages
@@ -131,82 +178,107 @@ class Hub:
         :param has_deadline:
         :return:
         """
-        for pkg in self.database.table:
+        loaded = truck.pkg_count
+        for pkg in self.metrics.scan("load_delayed_truck", self.database.select("At Hub")):
             if truck.not_full() is False:
                 break
-            if pkg.delivery_status != "At Hub":
-                continue
             if has_deadline:
                 if pkg.deadline == "EOD":
                     continue
             if pkg.special_notes.__contains__("Delayed"):
-                delay = pkg.special_notes[-8:]
-                later_time = pkg.calculate_deadline(delay)
-                depart_time = Package.calculate_deadline(truck.depart_at)
-                if later_time > depart_time:
-                    truck.depart_at = delay
+                later_time = Package.parse_time(pkg.special_notes[-8:])
+                if later_time > truck.depart_minutes:
+                    truck.depart_minutes = later_time
                 if truck.load_package(pkg.pkg_id, self.destinations.get_location(pkg.address)):
                     pkg.delivery_status = "In Route"
+        self.metrics.count("load_delayed_truck.loaded", truck.pkg_count - loaded)
 
+    @timed("load_early_truck")
     def load_early_truck(self, truck: Truck):
         """
         Load truck with packages that have deadlines before 10:30 AM.
         :param truck:
         :return:
         """
-        for pkg in self.database.table:
+        loaded = truck.pkg_count
+        early = self.database.deadline_range(latest=10 * 60 + 30, status="At Hub")
+        for pkg in self.metrics.scan("load_early_truck", early):
             if truck.not_full() is False:
                 break
-            if pkg.delivery_status != "At Hub":
-                continue
             if len(pkg.special_notes) > 1:
                 continue
-            if pkg.calculate_deadline(pkg.deadline) <= 10.5:
-                if truck.load_package(pkg.pkg_id, self.destinations.get_location(pkg.address)):
-                    pkg.delivery_status = "In Route"
+            if truck.load_package(pkg.pkg_id, self.destinations.get_location(pkg.address)):
+                pkg.delivery_status = "In Route"
+        self.metrics.count("load_early_truck.loaded", truck.pkg_count - loaded)
 
-    def load_packages(self):
-        """
-        Loads all the packages into the database (hash table) from the csv file.
-        :return:None
-        """
-        with open('WGUPS_Package_File.csv') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            line_count = 0
-            for row in csv_reader:
-                if line_count > 2:
-                    self.database.insert(int(row[0]), row[1], int(row[4]), row[5], int(row[6]), row[7])
-                line_count += 1
+    @timed("plan_loads")
+    def plan_loads(self, trucks=None, planner=None) -> list:
+        """
+        Assigns every package waiting at the Hub to a truck with the load planner, keeping truck pins,
+        co-delivery groups, arrival times and deadlines from the special notes.
+        :param trucks: List[Truck], all of the Hub's trucks if None
+        :param planner: LoadPlanner, a default planner if None
+        :return: List[int] pkg_ids that could not be loaded
+        """
+        planner = LoadPlanner() if planner is None else planner
+        trucks = self.trucks if trucks is None else trucks
+        loaded = sum(truck.pkg_count for truck in trucks)
+        unplanned = planner.plan(self, trucks)
+        self.metrics.count("plan_loads.loaded", sum(truck.pkg_count for truck in trucks) - loaded)
+        self.metrics.count("plan_loads.unplanned", len(unplanned))
+        return unplanned
+
+    @timed("load_packages")
+    def load_packages(self, *sources):
+        """
+        Streams all the packages into the database (hash table) from one or more manifest csv files.
+        :param sources: paths or file-like objects, WGUPS_Package_File.csv if none are given
+        :return:dict with rows, skipped, seconds and rows_per_second
+        """
+        if not sources:
+            sources = ('WGUPS_Package_File.csv',)
+        report = manifest.ingest(self.database, *sources)
+        self.database.commit()
+        return report
 
     def load_distances(self, distances: list):
         """
         Populates the distances or edge weights for the graph class, destinations.
+        Row r holds the distances from point r to the points before it and ends with a 0.
         :param distances:List[[str, str]]
         :return:None
         """
         points = list(self.destinations.points.keys())
-        for i in distances:
-            for j in range(0, len(points) - 1):
-                distance = float(i[j])
+        for row_index, row in enumerate(distances):
+            point_b = points[row_index]
+            for j in range(0, min(len(row), len(points) - 1)):
+                distance = float(row[j])
                 if distance == 0:
                     break
-                point_a = points[j]
-                point_b = points[distances.index(i)]
-                self.destinations.add_distance(point_a, point_b, distance)
+                self.destinations.add_distance(points[j], point_b, distance)
 
-    def load_locations(self):
+    @timed("load_locations")
+    def load_locations(self, path='WGUPS_Distance_Table.csv', use_cache=True):
         """
-        Reads in the string data from the csv file. Loads each location as a point in the graph class.
+        Loads each location as a point in the graph class. A compiled cache of the csv is used when
+        it is current, otherwise the csv is parsed and the cache is rebuilt.
+        :param path: path to the distance table csv
+        :param use_cache: read and write the compiled cache
         :return:None
         """
-        with open('WGUPS_Distance_Table.csv') as csv_file:
+        self.destinations.add_location(self.center)
+        cached = graph_cache.load(path) if use_cache else None
+        if cached is not None:
+            location_args, matrix, size = cached
+            for args in location_args:
+                self.destinations.add_location(Location(*args))
+            self.destinations.set_matrix(matrix, size)
+            return
+        location_args = []
+        distances = [['0']]
+        with open(path) as csv_file:
             csv_reader = csv.reader(csv_file)
             line_count = 0
-            distances = list()
-            self.destinations.add_location(self.center)
-            distances.append(
-                ['0', '', '', '', '', '', '', '', '', '', '', '', '', '', '',
-                 '', '', '', '', '', '', '', '', '', '', ''])
             for row in csv_reader:
                 line_count += 1
                 if line_count < 4:
@@ -214,84 +286,308 @@ class Hub:
                 address = row[0].split("\n")
                 label = row[1].split("\n")
                 zip_code = int(label[1].strip("(").strip(")"))
-                location = Location(
-                    address[0], address[1], zip_code, label[0].strip(" "))
-                self.destinations.add_location(location)
+                args = [address[0], address[1], zip_code, label[0].strip(" ")]
+                self.destinations.add_location(Location(*args))
+                location_args.append(args)
                 distances.append(row[2:-1])
-            self.load_distances(distances)
+        self.load_distances(distances)
+        if use_cache and isinstance(self.destinations, DenseDistanceTable):
+            graph_cache.save(path, location_args, self.destinations.export_matrix(), len(location_args) + 1)
 
+    @timed("find_a_way")
     def find_a_way(self, truck: Truck):
         """
-        finds the shortest route along the stops from truck in O(N^2) time
+        Builds the truck's route with nearest neighbor, lets the optimizer shorten it,
+        then drives the route and delivers the packages at each stop.
+        Delivery times are taken from the driven route so they always match the mileage.
         :param truck: truck with stops to make
-        :return: the list of locations and the total distance traveled by the truck
+        :return: the list of locations, the total distance traveled by the truck,
+         and the distance of the nearest neighbor route before it was improved
+        """
+        the_way, initial_distance = self.plan_route(truck)
+        return the_way, self.drive_route(truck, the_way, initial_distance), initial_distance
+
+    @timed("plan_route")
+    def plan_route(self, truck: Truck):
         """
-        stops = list(truck.cargo.keys())
-        current = self.center  # start at the Hub
-        the_way = [current]
+        Builds the truck's route with nearest neighbor and lets the optimizer shorten it.
+        :param truck: truck with stops to make
+        :return: the list of locations and the distance of the nearest neighbor route
+        """
+        the_way = self.nearest_neighbor_route(list(truck.cargo.keys()))
+        initial_distance = self.route_distance(the_way)
+        if self.optimizer is not None:
+            the_way = self.optimizer.improve(the_way, self.routing_graph(), self.stop_deadlines(truck),
+                                             truck.depart_minutes, truck.speed)
+        return the_way, initial_distance
+
+    def stop_deadlines(self, truck: Truck) -> dict:
+        """
+        Returns the earliest package deadline at each of the truck's stops.
+        :param truck: Truck
+        :return: Dict[Location, int] minutes since midnight
+        """
+        deadlines = {}
+        for stop, packages in truck.cargo.items():
+            deadlines[stop] = min(pkg.deadline_minutes for pkg in self.database.look_up_many(packages))
+        return deadlines
+
+    @timed("drive_route")
+    def drive_route(self, truck: Truck, the_way: list, initial_distance=None) -> float:
+        """
+        Drives the truck along the_way, delivering the packages at each stop and returning to the Hub.
+        The drive is recorded as one of the truck's trips.
+        :param truck: truck with stops to make
+        :param the_way: List[Location] starting at the Hub
+        :param initial_distance: miles of the route before it was improved, recorded on the trip
+        :return: the total distance traveled by the truck
+        """
+        graph = self.routing_graph()
+        pkg_ids = [pkg_id for packages in truck.cargo.values() for pkg_id in packages]
+        for packages in truck.cargo.values():
+            for pkg_id in packages:
+                self.events.record(truck.depart_minutes, pkg_id, "In Route")
         distance = 0.0
-        while stops:
-            result = self.nearest_neighbor(stops, current)
-            distance += result[1]
-            the_way.append(result[0])
-            current = stops.pop(0)
+        for previous, current in zip(the_way, the_way[1:]):
+            distance += graph.get_distance(previous, current)
             packages = truck.unload_package(current)
-            delivery_time = Package.get_delivery_time(distance, truck.speed, truck.depart_at)
+            delivery_time = Package.get_delivery_minutes(distance, truck.speed, truck.depart_minutes)
+            self.database.set_status_many(packages, "Delivered", delivery_time)
             for pkg_id in packages:
-                pkg = self.database.look_up(pkg_id)
-                pkg.delivery_status = "Delivered"
-                pkg.delivery_time = delivery_time
-        distance += self.destinations.get_distance(the_way[-1], self.center)  # return to the Hub
-        truck.depart_at = Package.get_delivery_time(distance, truck.speed, truck.depart_at)
-        return the_way, distance
+                self.events.record(delivery_time, pkg_id, "Delivered")
+        distance += graph.get_distance(the_way[-1], self.center)  # return to the Hub
+        self.metrics.count("distance_lookups", len(the_way))
+        self.metrics.count("deliveries", len(pkg_ids))
+        truck.return_minutes = Package.get_delivery_minutes(distance, truck.speed, truck.depart_minutes)
+        initial_distance = distance if initial_distance is None else initial_distance
+        truck.trips.append(Trip(truck.truck_id, len(truck.trips) + 1, truck.depart_minutes, truck.return_minutes,
+                                distance, initial_distance, pkg_ids, the_way))
+        self.database.commit()
+        return distance
+
+    def routing_graph(self):
+        """
+        Returns the graph routes are planned on: the direct distances from the csv, or the shortest
+        path distances between every pair of locations when shortest_path_routing is on.
+        The distance lookups of the shortest path table, or of a table that is not dense, are memoized and
+        the memo is kept across planning runs until the graph changes. A dense table of direct distances
+        is already an O(1) matrix read, so it is returned as is.
+        :return: DistanceTable
+        """
+        graph = self.paths.metric_table() if self.shortest_path_routing else self.destinations
+        if not self.distance_cache_size:
+            return graph
+        if not self.shortest_path_routing and isinstance(graph, DenseDistanceTable):
+            return graph
+        if self.distance_cache is None or self.distance_cache.graph is not graph:
+            self.distance_cache = CachedGraph(graph, self.distance_cache_size)
+        return self.distance_cache
+
+    def route_distance(self, route: list) -> float:
+        """
+        Returns the miles driven along route, including the return to the Hub.
+        :param route: List[Location] starting at the Hub
+        :return: float
+        """
+        graph = self.routing_graph()
+        distance = 0.0
+        for previous, current in zip(route, route[1:] + [self.center]):
+            distance += graph.get_distance(previous, current)
+        self.metrics.count("distance_lookups", len(route))
+        return distance
+
+    def nearest_neighbor_route(self, stops: [Location]) -> list:
+        """
+        Orders the stops by repeatedly driving to the closest unvisited stop, starting at the Hub.
+        Each step is one row query over the unvisited stops, so the route costs O(N^2).
+        :param stops: list of points
+        :return: List[Location] starting at the Hub
+        """
+        points = [self.center] + stops
+        tour = self.routing_graph().nearest_neighbor_tour(points)
+        self.metrics.count("nearest_neighbor.iterations", len(stops))
+        # the tour reads its distances as matrix rows, so they are counted apart from single distance_lookups
+        self.metrics.count("neighbor_matrix_cells", len(stops) * len(points))
+        return [points[i] for i in tour]
 
     def nearest_neighbor(self, stops: [Location], current: Location):
         """
-        Loop through stops and hold onto min value to find shortest distance.
+        Finds the stop with the shortest distance from current with one row query on the graph.
         :param stops: list of points
         :param current: current stop
         :return: Neighbor is the next closest stop and val is the distance to that stop.
         """
-        val = 140.0
-        neighbor = current
-        # loop through packages and hold onto min value to compare distances
-        for stop in stops:
-            dist = self.destinations.get_distance(current, stop)
-            if dist < val:
-                neighbor = stop
-                val = dist
-        return neighbor, val
+        return self.routing_graph().closest(current, stops)
 
+    @timed("get_deliveries")
     def get_deliveries(self, current_time="EOD"):
         """
-        Returns a list of all delivered packages.
+        Returns a list of all packages delivered before current_time, found with a bisect on the event log.
         :param current_time: What time is it?
-        :return: None
+        :return: List[Package]
         """
-        deliveries = []
-        for pkg in self.database.table:
-            if pkg.delivery_status.__contains__("Delivered"):
-                if pkg.calculate_deadline(pkg.delivery_time) < pkg.calculate_deadline(current_time):
-                    deliveries.append(pkg)
-        return deliveries
+        limit = Package.parse_time(current_time)
+        return self.database.in_order(self.events.with_status_by("Delivered", limit))
 
-    def get_miles(self):
+    @timed("get_status")
+    def get_status(self, pkg_id: int, current_time="EOD"):
+        """
+        Returns the status of one package at current_time.
+        :param pkg_id: id of the package
+        :param current_time: What time is it?
+        :return: (status, time the status started or None)
+        """
+        status, minutes = self.events.status_at(pkg_id, Package.parse_time(current_time))
+        if minutes is None:
+            return status, None
+        return status, Package.format_time(minutes)
+
+    @timed("get_snapshot")
+    def get_snapshot(self, current_time="EOD"):
+        """
+        Returns the status of every package at current_time.
+        :param current_time: What time is it?
+        :return: List[(Package, status, time the status started or None)]
+        """
+        changed = self.events.snapshot(Package.parse_time(current_time))
+        snapshot = []
+        for pkg in self.database:
+            status, minutes = changed.get(pkg.pkg_id, (self.events.initial_status, None))
+            snapshot.append((pkg, status, None if minutes is None else Package.format_time(minutes)))
+        return snapshot
+
+    @timed("get_miles")
+    def get_miles(self, workers=0):
         """
         Returns the mileage, departure time, and return time for all hub trucks.
+        :param workers: plan the routes in this many processes, kept until close, 0 plans them one after another here
         :return: info, miles
         """
         miles = []
         info = []
-        for truck in self.trucks:
+        plans = [None] * len(self.trucks)
+        if workers and len(self.trucks) > 1:
+            if self.route_pool is None:
+                self.route_pool = parallel_routing.RoutePool()
+            plans = parallel_routing.plan_routes(self, self.trucks, workers, self.route_pool)
+        for truck, plan in zip(self.trucks, plans):
             departure_time = f'Truck {truck.truck_id}:\n'
             departure_time += f'Departs from {self.center.label} at {truck.depart_at}.'
-            result = self.find_a_way(truck)
-            mileage = f'Travels {result[1].__round__(2)} miles.'
-            return_time = f'Returns to {self.center.label} by {truck.depart_at}.'
-            miles.append(result[1])
+            the_way, initial_distance = self.plan_route(truck) if plan is None else plan
+            distance = self.drive_route(truck, the_way, initial_distance)
+            mileage = f'Travels {distance.__round__(2)} miles.'
+            if self.optimizer is not None:
+                mileage += f' (nearest neighbor route: {initial_distance.__round__(2)} miles)'
+            return_time = f'Returns to {self.center.label} by {truck.returns_at}.'
+            miles.append(distance)
+            info.append([departure_time, mileage, return_time])
+        return info, miles
+
+    @timed("schedule_trips")
+    def schedule_trips(self, drivers=2, scheduler=None):
+        """
+        Runs the whole day as waves of trips: trucks reload at the Hub, at most drivers trucks are out
+        at once, and delayed or corrected packages are loaded once they arrive.
+        :param drivers: number of drivers
+        :param scheduler: TripScheduler, a default scheduler if None, its unplanned lists the packages left at the Hub
+        :return: info, miles with one entry per trip
+        """
+        scheduler = TripScheduler(drivers) if scheduler is None else scheduler
+        miles = []
+        info = []
+        for trip in scheduler.schedule(self, self.trucks):
+            departure_time = f'Truck {trip.truck_id}, trip {trip.number}:\n'
+            departure_time += f'Departs from {self.center.label} at {Package.format_time(trip.depart_minutes)}'
+            departure_time += f' with {len(trip.pkg_ids)} packages.'
+            mileage = f'Travels {trip.miles.__round__(2)} miles.'
+            if self.optimizer is not None:
+                mileage += f' (nearest neighbor route: {trip.initial_miles.__round__(2)} miles)'
+            return_time = f'Returns to {self.center.label} by {Package.format_time(trip.return_minutes)}.'
+            miles.append(trip.miles)
             info.append([departure_time, mileage, return_time])
+        self.metrics.count("schedule_trips.unplanned", len(scheduler.unplanned))
         return info, miles
 
+    def live_route(self, truck: Truck) -> LiveRoute:
+        """
+        Plans the truck's route and returns it as a LiveRoute starting at the Hub at its departure time,
+        ready for incremental changes while the truck is out.
+        :param truck: Truck
+        :return: LiveRoute
+        """
+        the_way = self.plan_route(truck)[0]
+        return LiveRoute(truck, self.center, self.center, truck.depart_minutes, the_way[1:], self.stop_deadlines(truck))
+
+    @timed("correct_package")
+    def correct_package(self, pkg_id: int, address="", zip_code="", notes="", live=None, rerouter=None) -> float:
+        """
+        Corrects a package and, if it is on the truck of live, moves its stop on that truck's route only.
+        :param pkg_id: int
+        :param address: corrected address
+        :param zip_code: corrected zip code
+        :param notes: updated special notes
+        :param live: LiveRoute of the truck carrying the package or None
+        :param rerouter: Rerouter, one over the routing graph if None
+        :return: miles added to the rest of the truck's route
+        :raises ValueError: if the corrected address is not in the distance table, nothing is changed
+        """
+        pkg = self.database.look_up(pkg_id)
+        old_location = self.destinations.get_location(pkg.address)
+        new_location = old_location
+        if address != "":
+            new_location = self.destinations.get_location(Package.convert_delivery_address(address))
+            if new_location is None:
+                raise ValueError(f'address {address} is not in the distance table')
+        pkg.correct_info(address, zip_code, notes)
+        self.database.update(pkg)  # a journaled database also records the notes
+        self.database.commit()
+        if live is None or old_location not in live.truck.cargo or pkg_id not in live.truck.cargo[old_location]:
+            return 0.0
+        rerouter = Rerouter(self.routing_graph()) if rerouter is None else rerouter
+        emptied = live.truck.move_package(pkg_id, old_location, new_location)
+        added = rerouter.insert(live, new_location, pkg.deadline_minutes)
+        if emptied:
+            added -= rerouter.remove(live, old_location)
+        return added
+
+    def close(self):
+        """
+        Commits and closes the package store, if the Hub has one, and stops the route planning workers.
+        :return: None
+        """
+        if self.store is not None:
+            self.store.close()
+        if self.route_pool is not None:
+            self.route_pool.close()
+
+    def profile_operation(self, operation: str, *args, profile=True, memory=False, **kwargs):
+        """
+        Runs any Hub method under cProfile and/or tracemalloc, the results go into the instrumentation report.
+        :param operation: name of the Hub method, like "get_miles"
+        :param profile: capture a cProfile of the call
+        :param memory: capture the tracemalloc peak and top allocation sites of the call
+        :return: whatever the method returns
+        """
+        with self.metrics.capture(operation, profile, memory):
+            return getattr(self, operation)(*args, **kwargs)
+
+    @timed("simulate_day")
+    def simulate_day(self, corrections=(), drivers=2, trace=False) -> dict:
+        """
+        Runs the day in the discrete-event simulator without changing the database or the trucks.
+        :param corrections: (time like "10:20 AM", pkg_id, corrected address) applied when the clock reaches them
+        :param drivers: number of drivers
+        :param trace: keep every event in the result under "trace"
+        :return: dict from Simulator.run
+        """
+        matrix, packages, events = simulator.from_hub(self, corrections)
+        day = simulator.Simulator(matrix, len(self.trucks), drivers, self.truck_capacity,
+                                  self.trucks[0].speed, Package.parse_time(self.current_time))
+        result = day.run(packages, events, trace)
+        if trace:
+            result["trace"] = day.trace
+        return result
+
     # the following functions are only for testing purposes and not used in the main program
     def truck_mileage(self, truck: Truck):
         """
@@ -299,15 +595,13 @@ class Hub:
         :param truck:Truck
         :return:int, List[Location]
         """
-        stops = self.route_truck(truck)
+        stops, distance = self.route_truck(truck)
         miles = 0.0
         route = []
         for packages in truck.cargo.values():
-            for pkg_id in packages:
-                pkg = self.database.look_up(pkg_id)
-                pkg.delivery_status = "Delivered"
+            self.database.set_status_many(packages, "Delivered")
         for stop in stops:
-            miles += stop.distance
+            miles += distance[stop]
             route.append(stop.label)
         return miles, route
 
@@ -317,56 +611,47 @@ class Hub:
         :param truck:Truck
         :return:None
         """
-        truck.capacity = 41
-        for num in range(0, truck.capacity):
-            pkg = self.database.look_up(num)
+        truck.capacity = len(self.database)
+        packages = list(self.database)
+        locations = self.destinations.get_locations(pkg.address for pkg in packages)
+        for pkg, location in zip(packages, locations):
             pkg.delivery_status = "In Route"
-            truck.load_package(pkg.pkg_id, self.destinations.get_location(pkg.address))
+            truck.load_package(pkg.pkg_id, location)
 
     def route_truck(self, truck):
         """
         Finds shortest route using Dijkstra's Shortest Paths.
         :param truck:Truck
-        :return:List[Location]
+        :return:List[Location], Dict[Location, float] of distances from the Hub
         """
         stops = [self.center]
         stops += list(truck.cargo.keys())
-        self.dijkstra_shortest_path(self.center, stops)
-        return stops
+        distance = self.dijkstra_shortest_path(self.center, stops)[0]
+        return stops, distance
 
-    def dijkstra_shortest_path(self, start_point, stops):
+    def dijkstra_shortest_path(self, start_point, stops=None):
         """
-        Implementation of Dijkstra's Algorithm used only for testing purposes.
+        Shortest paths from start_point to every point, answered by the cached shortest path service.
         :param start_point:Location
-        :param stops:List[Location]
-        :return:None
+        :param stops:List[Location] kept for compatibility, every point is searched
+        :return:Dict[Location, float] distances and Dict[Location, Location] predecessors
+        """
+        return self.paths.from_source(start_point)
+
+    def shortest_leg(self, from_point: Location, to_point: Location):
+        """
+        The shortest path between two locations, memoized per pair until the graph changes.
+        :return: miles, inf if to_point cannot be reached, and the tuple of Locations along the way
+        """
+        if self.legs is None:
+            return self.paths.distance(from_point, to_point), tuple(self.paths.path(from_point, to_point))
+        return self.legs.distance(from_point, to_point), self.legs.path(from_point, to_point)
+
+    def cache_stats(self) -> dict:
+        """
+        :return: dict with the hit and miss stats of the distance and shortest path leg memos
         """
-        # Put all points in an unvisited queue.
-        unvisited_queue = []
-        for current_point in stops:
-            if isinstance(current_point, Location):
-                unvisited_queue.append(current_point)
-
-        # start_point has a distance of 0 from itself
-        start_point.distance = 0
-
-        # A point is removed each iteration and repeats until the list is empty.
-        while len(unvisited_queue) > 0:
-
-            # Visit point with minimum distance from start_point
-            smallest_index = 0
-            for i in range(1, len(unvisited_queue)):
-                if unvisited_queue[i].distance < unvisited_queue[smallest_index].distance:
-                    smallest_index = i
-            current_point = unvisited_queue.pop(smallest_index)
-
-            # Check potential path lengths from the current_point to all neighbors.
-            for neighbor in self.destinations.points[current_point]:
-                route_distance = self.destinations.distances[(current_point, neighbor)]
-                alternative_path_distance = current_point.distance + route_distance
-
-                # If shorter path from start_point to neighbor is found,
-                # update neighbor's distance and predecessor
-                if alternative_path_distance < neighbor.distance:
-                    neighbor.distance = alternative_path_distance
-                    neighbor.prev_point = current_point
+        return {
+            "distance": None if self.distance_cache is None else self.distance_cache.get_distance.stats(),
+            "legs": None if self.legs is None else self.legs.stats(),
+        }
@@ -0,0 +1,215 @@
+"""
+Opt-in instrumentation for the Hub: per-stage timers, counters, and cProfile/tracemalloc captures,
+reported as json. When disabled every hook returns straight away.
+"""
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+
+class Instrumentation:
+    """
+    Instrumentation collects timers as name -> [calls, seconds] and counters as name -> int.
+    Hub methods are timed with the timed decorator and loops are counted with scan, both of which
+    skip all bookkeeping when enabled is False.
+    Big-O is as follows:
+    timer, count: O(1)
+    scan: O(1) per item when enabled, O(1) in total when disabled
+    report: O(T + C) for T timers and C counters
+    merge: same as report
+    """
+    def __init__(self, enabled=True, top=20):
+        """
+        :param enabled: collect timers and counters
+        :param top: functions and allocation sites kept per capture
+        """
+        self.enabled = enabled
+        self.top = top
+        self.timers = {}
+        self.counters = {}
+        self.captures = {}
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        """
+        with metrics.timer("routing"): ... adds the time spent in the block to the named timer
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        """
+        Adds one call of seconds to the named timer.
+        :return: None
+        """
+        entry = self.timers.get(name)
+        if entry is None:
+            self.timers[name] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def count(self, name: str, amount=1):
+        """
+        Adds amount to the named counter.
+        :return: None
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def scan(self, name: str, items):
+        """
+        Counts the items a loop takes from items under name + ".scanned".
+        :param name: counter prefix
+        :param items: iterable
+        :return: items itself when disabled, otherwise a generator over it
+        """
+        if not self.enabled:
+            return items
+        return self.counted(name + ".scanned", items)
+
+    def counted(self, name: str, items):
+        """
+        Yields items and adds each one to the named counter, also when the loop breaks early.
+        :return: generator
+        """
+        scanned = 0
+        try:
+            for item in items:
+                scanned += 1
+                yield item
+        finally:
+            self.counters[name] = self.counters.get(name, 0) + scanned
+
+    @contextlib.contextmanager
+    def capture(self, name: str, profile=True, memory=False):
+        """
+        Runs the block under cProfile and/or tracemalloc and keeps the results under name.
+        Captures are explicit requests, so they run even when the timers and counters are disabled.
+        """
+        result = {}
+        profiler = cProfile.Profile() if profile else None
+        tracing = memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield result
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            result["seconds"] = time.perf_counter() - start
+            if memory:
+                result["memory"] = self.memory_report(before)
+                if tracing:
+                    tracemalloc.stop()
+            if profiler is not None:
+                result["profile"] = self.profile_report(profiler)
+            self.captures[name] = result
+
+    def memory_report(self, before) -> dict:
+        """
+        :param before: tracemalloc snapshot taken when the capture started
+        :return: dict with the peak bytes and the allocation sites that grew the most
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        growth = tracemalloc.take_snapshot().compare_to(before, "lineno")[:self.top]
+        return {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": [{"location": str(stat.traceback), "size_bytes": stat.size_diff, "count": stat.count_diff}
+                    for stat in growth],
+        }
+
+    def profile_report(self, profiler: cProfile.Profile) -> list:
+        """
+        :return: the functions with the most cumulative time
+        """
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = []
+        for (file_name, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+            rows.append({"function": f'{file_name}:{line}({function})', "calls": calls,
+                         "total_seconds": total, "cumulative_seconds": cumulative})
+        rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+        return rows[:self.top]
+
+    def report(self) -> dict:
+        """
+        :return: json ready dict with timers, counters and captures
+        """
+        return {
+            "enabled": self.enabled,
+            "timers": {name: {"calls": calls, "seconds": seconds, "mean_ms": seconds / calls * 1000}
+                       for name, (calls, seconds) in self.timers.items()},
+            "counters": dict(self.counters),
+            "captures": self.captures,
+        }
+
+    def merge(self, report: dict, prefix=""):
+        """
+        Adds the timers, counters, and captures of another report, like one sent back by a worker process.
+        :param report: dict from report
+        :param prefix: put in front of the merged capture names to keep them apart
+        :return: None
+        """
+        for name, timer in report["timers"].items():
+            entry = self.timers.setdefault(name, [0, 0.0])
+            entry[0] += timer["calls"]
+            entry[1] += timer["seconds"]
+        for name, amount in report["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+        for name, capture in report["captures"].items():
+            self.captures[prefix + name] = capture
+
+    def write(self, path: str):
+        """
+        Writes the report as json.
+        :return: None
+        """
+        with open(path, "w") as json_file:
+            json.dump(self.report(), json_file, indent=2)
+
+    def reset(self):
+        """
+        Clears every timer, counter, and capture.
+        :return: None
+        """
+        self.timers.clear()
+        self.counters.clear()
+        self.captures.clear()
+
+
+def timed(name: str):
+    """
+    Decorator for Hub methods that adds each call to the Hub's named timer.
+    When instrumentation is disabled the method is called directly.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                metrics.add_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
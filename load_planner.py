@@ -0,0 +1,451 @@
+"""
+The LoadPlanner decides which truck carries each package. Special notes are parsed once into typed
+constraints, then packages are assigned with seeding plus cheapest insertion.
+"""
+import re
+import time
+
+from package import END_OF_DAY, Package
+
+TRUCK_NOTE = re.compile(r"truck (\d+)", re.IGNORECASE)
+GROUP_NOTE = re.compile(r"delivered with ([\d,\s]+)", re.IGNORECASE)
+DELAY_NOTE = re.compile(r"until (\d{1,2}:\d{2}\s*[ap]m)", re.IGNORECASE)
+CORRECTED_NOTE = re.compile(r"corrected at (\d{1,2}:\d{2}\s*[ap]m)", re.IGNORECASE)
+WRONG_ADDRESS_NOTE = re.compile(r"wrong address", re.IGNORECASE)
+
+
+def merge_groups(groups: dict) -> dict:
+    """
+    Merges overlapping co-delivery groups with union-find.
+    :param groups: Dict[pkg_id, iterable of pkg_ids it must be delivered with], other pkg_ids are ignored
+    :return: Dict[pkg_id, root pkg_id], packages with the same root must travel together
+    """
+    parent = {pkg_id: pkg_id for pkg_id in groups}
+
+    def find(pkg_id):
+        while parent[pkg_id] != pkg_id:
+            parent[pkg_id] = parent[parent[pkg_id]]
+            pkg_id = parent[pkg_id]
+        return pkg_id
+
+    for pkg_id, group in groups.items():
+        for other in group:
+            if other in parent:
+                parent[find(other)] = find(pkg_id)
+    return {pkg_id: find(pkg_id) for pkg_id in parent}
+
+
+def note_group(notes: str) -> tuple:
+    """
+    :return: the pkg_ids a "Must be delivered with" note names, empty if there is none
+    """
+    match = GROUP_NOTE.search(notes)
+    return tuple(int(pkg_id) for pkg_id in re.findall(r"\d+", match.group(1))) if match else ()
+
+
+class PackageConstraints:
+    """
+    The loading constraints of one package.
+    truck_id: the only truck allowed to carry it, or None
+    group: pkg_ids that must be on the same truck
+    available_minutes: when it is at the Hub and ready to load, None while its address is wrong
+    deadline_minutes: when it must be delivered by
+    """
+    __slots__ = ("pkg_id", "truck_id", "group", "available_minutes", "deadline_minutes")
+
+    def __init__(self, pkg_id: int, truck_id, group: tuple, available_minutes, deadline_minutes: int):
+        self.pkg_id = pkg_id
+        self.truck_id = truck_id
+        self.group = group
+        self.available_minutes = available_minutes
+        self.deadline_minutes = deadline_minutes
+
+    @staticmethod
+    def parse(pkg: Package, opening_minutes: int):
+        """
+        Reads the constraints out of a package's special notes.
+        :param pkg: Package
+        :param opening_minutes: when the Hub opens
+        :return: PackageConstraints
+        """
+        notes = pkg.special_notes
+        truck_match = TRUCK_NOTE.search(notes)
+        truck_id = int(truck_match.group(1)) if truck_match else None
+        group = note_group(notes)
+        available = opening_minutes
+        delay_match = DELAY_NOTE.search(notes)
+        if delay_match:
+            available = max(available, Package.parse_time(delay_match.group(1)))
+        corrected_match = CORRECTED_NOTE.search(notes)
+        if corrected_match:
+            available = max(available, Package.parse_time(corrected_match.group(1)))
+        elif WRONG_ADDRESS_NOTE.search(notes):
+            available = None
+        return PackageConstraints(pkg.pkg_id, truck_id, group, available, pkg.deadline_minutes)
+
+
+class LoadUnit:
+    """
+    Packages that have to travel together: a co-delivery group or a single package.
+    """
+    __slots__ = ("pkg_ids", "stops", "truck_id", "available_minutes", "deadline_minutes")
+
+    def __init__(self):
+        self.pkg_ids = []
+        self.stops = {}  # Location -> earliest deadline at that stop
+        self.truck_id = None
+        self.available_minutes = 0
+        self.deadline_minutes = END_OF_DAY
+
+
+class TruckPlan:
+    """
+    The route a truck would drive for the packages assigned to it so far.
+    """
+    __slots__ = ("truck", "route", "cargo_deadlines", "deadlines", "load", "ready_minutes", "depart_minutes", "units")
+
+    def __init__(self, truck, center, cargo_deadlines: dict):
+        self.truck = truck
+        self.route = [center] + list(truck.cargo.keys())
+        self.cargo_deadlines = cargo_deadlines
+        self.deadlines = dict(cargo_deadlines)
+        self.load = truck.pkg_count
+        self.ready_minutes = truck.depart_minutes
+        self.depart_minutes = truck.depart_minutes
+        self.units = []
+
+
+class LoadPlanner:
+    """
+    Assigns every package waiting at the Hub to a truck while keeping truck pins, co-delivery groups,
+    arrival times, deadlines, and truck capacity.
+    1. Notes are parsed once into PackageConstraints and groups are merged with union-find.
+    2. Empty trucks are seeded with the waiting units farthest from the Hub and from each other,
+       which spreads the trucks over separate areas of the city.
+    3. The remaining units are placed, late arrivals first and then earliest deadline first, on the
+       truck where cheapest insertion adds the fewest miles without making a stop late.
+    4. Units are moved to another truck while that saves miles and keeps every stop on time.
+    Once the time budget is spent the remaining units go to the first truck with room
+    and no more units are moved.
+    Big-O is as follows:
+    plan: O(U * T * S) for U units, T trucks, and S stops per truck
+    solve: same as plan
+    """
+    def __init__(self, time_budget=2.0):
+        """
+        Constraints are cached by pkg_id and only parsed again when a package's notes change.
+        :param time_budget: seconds allowed for cheapest insertion
+        """
+        self.time_budget = time_budget
+        self.constraints = {}
+
+    def plan(self, hub, trucks: list) -> list:
+        """
+        Loads the waiting packages onto trucks. A truck leaves once its last package has arrived.
+        :param hub: Hub
+        :param trucks: List[Truck]
+        :return: List[int] pkg_ids that could not be loaded
+        """
+        plans, waiting, unplanned = self.solve(hub, trucks)
+        for plan in plans:
+            self.load(hub, plan, waiting)
+        return unplanned
+
+    def solve(self, hub, trucks: list, ready_by=None, strict=False):
+        """
+        Plans the loads without touching the trucks, so different plans can be compared.
+        :param hub: Hub
+        :param trucks: List[Truck]
+        :param ready_by: only plan units whose packages have all arrived by this many minutes since midnight
+        :param strict: leave out units that would make a stop late instead of placing them anyway
+        :return: (List[TruckPlan], Dict[pkg_id, (PackageConstraints, Location)], List[int] unplanned pkg_ids)
+        """
+        opening_minutes = Package.parse_time(hub.current_time)
+        waiting = {}
+        unplanned = []
+        for pkg in hub.database.select("At Hub"):
+            constraints = self.get_constraints(pkg, opening_minutes)
+            location = hub.destinations.get_location(pkg.address)
+            if constraints.available_minutes is None or location is None:
+                unplanned.append(pkg.pkg_id)
+                continue
+            waiting[pkg.pkg_id] = (constraints, location)
+        units = self.build_units(waiting)
+        if ready_by is not None:
+            # a group waits at the Hub until its last member has arrived
+            late = [unit for unit in units if unit.available_minutes > ready_by]
+            for unit in late:
+                for pkg_id in unit.pkg_ids:
+                    del waiting[pkg_id]
+            units = [unit for unit in units if unit.available_minutes <= ready_by]
+        graph = hub.routing_graph()
+        plans = [TruckPlan(truck, hub.center, self.cargo_deadlines(hub, truck)) for truck in trucks]
+        stop_at = time.perf_counter() + self.time_budget
+        remaining = self.place_pinned(units, plans, graph, unplanned)
+        remaining = self.seed(remaining, plans, graph, hub.center)
+        # late arrivals go first so they set the departure times the other units are checked against
+        remaining.sort(key=lambda unit: (unit.available_minutes <= opening_minutes, unit.deadline_minutes,
+                                         -unit.available_minutes, -len(unit.pkg_ids)))
+        for unit in remaining:
+            if time.perf_counter() < stop_at:
+                placed = self.place(unit, plans, graph, strict)
+            else:
+                placed = self.place_first_fit(unit, plans)
+            if not placed:
+                unplanned.extend(unit.pkg_ids)
+        self.relocate(plans, graph, stop_at)
+        return plans, waiting, unplanned
+
+    def get_constraints(self, pkg: Package, opening_minutes: int) -> PackageConstraints:
+        """
+        :return: the package's cached constraints, parsed again if its notes have changed
+        """
+        cached = self.constraints.get(pkg.pkg_id)
+        if cached is not None and cached[0] == pkg.special_notes:
+            return cached[1]
+        constraints = PackageConstraints.parse(pkg, opening_minutes)
+        self.constraints[pkg.pkg_id] = (pkg.special_notes, constraints)
+        return constraints
+
+    @staticmethod
+    def build_units(waiting: dict) -> list:
+        """
+        Merges packages that must be delivered together into units with union-find.
+        :param waiting: Dict[pkg_id, (PackageConstraints, Location)]
+        :return: List[LoadUnit]
+        """
+        roots = merge_groups({pkg_id: constraints.group for pkg_id, (constraints, _) in waiting.items()})
+        units = {}
+        for pkg_id, (constraints, location) in waiting.items():
+            unit = units.setdefault(roots[pkg_id], LoadUnit())
+            unit.pkg_ids.append(pkg_id)
+            unit.stops[location] = min(unit.stops.get(location, END_OF_DAY), constraints.deadline_minutes)
+            if constraints.truck_id is not None and unit.truck_id is None:
+                unit.truck_id = constraints.truck_id
+            unit.available_minutes = max(unit.available_minutes, constraints.available_minutes)
+            unit.deadline_minutes = min(unit.deadline_minutes, constraints.deadline_minutes)
+        return list(units.values())
+
+    @staticmethod
+    def cargo_deadlines(hub, truck) -> dict:
+        """
+        :return: Dict[Location, int] earliest deadline at each stop already on the truck
+        """
+        if not truck.cargo:
+            return {}
+        return hub.stop_deadlines(truck)
+
+    def place_pinned(self, units: list, plans: list, graph, unplanned: list) -> list:
+        """
+        Places the units that are pinned to one truck.
+        :return: the units that are not pinned
+        """
+        remaining = []
+        by_id = {plan.truck.truck_id: plan for plan in plans}
+        for unit in units:
+            if unit.truck_id is None:
+                remaining.append(unit)
+                continue
+            plan = by_id.get(unit.truck_id)
+            if plan is None or not self.fits(unit, plan):
+                unplanned.extend(unit.pkg_ids)
+                continue
+            self.assign(unit, plan, *self.insertion(unit, plan, graph)[2:])
+        return remaining
+
+    def seed(self, units: list, plans: list, graph, center) -> list:
+        """
+        Gives each empty truck the waiting unit farthest from the Hub and the other seeds.
+        Only units that are ready when the truck leaves are used as seeds.
+        :return: the units that were not used as seeds
+        """
+        anchors = [center] + [stop for plan in plans for stop in plan.route[1:]]
+        for plan in plans:
+            if len(plan.route) > 1:
+                continue
+            best = None
+            best_distance = -1.0
+            for unit in units:
+                if unit.available_minutes > plan.depart_minutes or not self.fits(unit, plan):
+                    continue
+                stop = next(iter(unit.stops))
+                distance = min(graph.get_distance(anchor, stop) or 0.0 for anchor in anchors)
+                if distance > best_distance:
+                    best, best_distance = unit, distance
+            if best is None:
+                continue
+            units.remove(best)
+            self.assign(best, plan, *self.insertion(best, plan, graph)[2:])
+            anchors.extend(best.stops)
+        return units
+
+    def place(self, unit: LoadUnit, plans: list, graph, strict=False) -> bool:
+        """
+        Puts the unit on the truck where it adds the fewest miles without making a stop late.
+        If every truck would be late, the truck with the least lateness is used unless strict is set.
+        :return: True if the unit was placed
+        """
+        best = None
+        best_key = None
+        for plan in plans:
+            if not self.fits(unit, plan):
+                continue
+            lateness, added, route, depart_minutes = self.insertion(unit, plan, graph)
+            if strict and lateness > 0:
+                continue
+            key = (lateness > 0, lateness, added)
+            if best_key is None or key < best_key:
+                best, best_key = (plan, route, depart_minutes), key
+        if best is None:
+            return False
+        self.assign(unit, *best)
+        return True
+
+    def place_first_fit(self, unit: LoadUnit, plans: list) -> bool:
+        """
+        Puts the unit on the first truck with room, used once the time budget is spent.
+        :return: True if the unit was placed
+        """
+        for plan in plans:
+            if self.fits(unit, plan):
+                route = plan.route + [stop for stop in unit.stops if stop not in plan.route]
+                self.assign(unit, plan, route, max(plan.depart_minutes, unit.available_minutes))
+                return True
+        return False
+
+    def relocate(self, plans: list, graph, stop_at: float):
+        """
+        Moves units that are not pinned to the truck where they add fewer miles than their current
+        truck saves without them, as long as neither truck is late afterwards.
+        :param stop_at: perf_counter value when the time budget runs out
+        :return: None
+        """
+        improved = True
+        while improved and time.perf_counter() < stop_at:
+            improved = False
+            for plan in plans:
+                for unit in list(plan.units):
+                    if unit.truck_id is not None:
+                        continue
+                    route, deadlines, depart_minutes = self.without(unit, plan)
+                    if self.lateness(route, deadlines, depart_minutes, plan.truck.speed, graph) > 0:
+                        continue
+                    saved = self.route_miles(plan.route, graph) - self.route_miles(route, graph)
+                    for other in plans:
+                        if other is plan or not self.fits(unit, other):
+                            continue
+                        lateness, added, other_route, other_depart = self.insertion(unit, other, graph)
+                        if lateness == 0 and added < saved - 1e-9:
+                            plan.units.remove(unit)
+                            plan.route, plan.deadlines, plan.depart_minutes = route, deadlines, depart_minutes
+                            plan.load -= len(unit.pkg_ids)
+                            self.assign(unit, other, other_route, other_depart)
+                            improved = True
+                            break
+                if time.perf_counter() > stop_at:
+                    return
+
+    @staticmethod
+    def without(unit: LoadUnit, plan: TruckPlan):
+        """
+        Takes the unit off the truck's plan without changing the plan.
+        :return: (route, deadlines, departure time) of the plan without the unit
+        """
+        deadlines = dict(plan.cargo_deadlines)
+        depart_minutes = plan.ready_minutes
+        for other in plan.units:
+            if other is unit:
+                continue
+            depart_minutes = max(depart_minutes, other.available_minutes)
+            for stop, deadline in other.stops.items():
+                deadlines[stop] = min(deadlines.get(stop, END_OF_DAY), deadline)
+        route = [plan.route[0]] + [stop for stop in plan.route[1:] if stop in deadlines]
+        return route, deadlines, depart_minutes
+
+    @staticmethod
+    def route_miles(route: list, graph) -> float:
+        """
+        :return: miles driven along route, including the return to the Hub
+        """
+        miles = 0.0
+        for previous, stop in zip(route, route[1:] + route[:1]):
+            miles += graph.get_distance(previous, stop)
+        return miles
+
+    @staticmethod
+    def fits(unit: LoadUnit, plan: TruckPlan) -> bool:
+        """
+        :return: True if the truck has room for the unit
+        """
+        return plan.load + len(unit.pkg_ids) <= plan.truck.capacity
+
+    def insertion(self, unit: LoadUnit, plan: TruckPlan, graph):
+        """
+        Inserts each of the unit's stops where it adds the fewest miles to the truck's route.
+        :return: (minutes late, miles added, new route, new departure time)
+        """
+        route = list(plan.route)
+        added = 0.0
+        for stop in unit.stops:
+            if stop in route:
+                continue
+            best_position = len(route)
+            best_added = None
+            for position in range(1, len(route) + 1):
+                previous = route[position - 1]
+                following = route[position] if position < len(route) else route[0]
+                delta = (graph.get_distance(previous, stop) + graph.get_distance(stop, following)
+                         - graph.get_distance(previous, following))
+                if best_added is None or delta < best_added:
+                    best_position, best_added = position, delta
+            route.insert(best_position, stop)
+            added += best_added
+        depart_minutes = max(plan.depart_minutes, unit.available_minutes)
+        deadlines = dict(plan.deadlines)
+        for stop, deadline in unit.stops.items():
+            deadlines[stop] = min(deadlines.get(stop, END_OF_DAY), deadline)
+        lateness = self.lateness(route, deadlines, depart_minutes, plan.truck.speed, graph)
+        return lateness, added, route, depart_minutes
+
+    @staticmethod
+    def lateness(route: list, deadlines: dict, depart_minutes: int, speed: float, graph) -> float:
+        """
+        :return: total minutes the route reaches its stops after their deadlines
+        """
+        miles = 0.0
+        late = 0.0
+        for previous, stop in zip(route, route[1:]):
+            miles += graph.get_distance(previous, stop)
+            arrival = depart_minutes + miles / speed * 60
+            deadline = deadlines.get(stop, END_OF_DAY)
+            if arrival > deadline:
+                late += arrival - deadline
+        return late
+
+    @staticmethod
+    def assign(unit: LoadUnit, plan: TruckPlan, route: list, depart_minutes: int):
+        """
+        Records the unit on the truck's plan.
+        :return: None
+        """
+        plan.route = route
+        plan.depart_minutes = depart_minutes
+        for stop, deadline in unit.stops.items():
+            plan.deadlines[stop] = min(plan.deadlines.get(stop, END_OF_DAY), deadline)
+        plan.load += len(unit.pkg_ids)
+        plan.units.append(unit)
+
+    @staticmethod
+    def load(hub, plan: TruckPlan, waiting: dict):
+        """
+        Loads the planned packages onto the truck and sets its departure time.
+        :return: None
+        """
+        loaded = []
+        for unit in plan.units:
+            for pkg_id in unit.pkg_ids:
+                location = waiting[pkg_id][1]
+                if plan.truck.load_package(pkg_id, location):
+                    loaded.append(pkg_id)
+        hub.database.set_status_many(loaded, "In Route")
+        plan.truck.depart_minutes = plan.depart_minutes
@@ -5,15 +5,16 @@ The location class represents a vertex point in the distance_table (graph).
 
 class Location:
     """
-    Each location object has a name, address, zip_code, and label
+    Each location object has a name, address, zip_code, and label.
+    Shortest path scratch values are kept by the search, not on the shared vertex.
     """
+    __slots__ = ("name", "address", "zip_code", "label")
+
     def __init__(self, name: str, address: str, zip_code: int, label: str):
         self.name = name
         self.address = address + " Salt Lake City, UT"
         self.zip_code = zip_code
         self.label = self.convert_delivery_label(label)
-        self.distance = 140
-        self.prev_point = None
 
     @staticmethod
     def convert_delivery_label(label: str) -> str:
@@ -16,34 +16,9 @@ def main():
     # corrections for package 9
     pkg_9 = hub.database.look_up(9)
     pkg_9.correct_info("410 S State St", "84111", "corrected at 10:20 AM")
-    hub.trucks[1].load_package(pkg_9.pkg_id, hub.destinations.get_location(pkg_9.address))
-    pkg_9.delivery_status = "In Route"
-    hub.trucks[1].depart_at = "10:20 AM"
 
-    # load truck 2
-    hub.load_truck_2(hub.trucks[1])
-
-    # fill truck 3
-    hub.load_forced_group(hub.trucks[2])
-    hub.load_same_stop_truck(hub.trucks[2])
-    hub.load_zip_code_truck(hub.trucks[2])
-
-    # load truck 1
-    hub.load_delayed_truck(hub.trucks[0])
-    hub.load_early_truck(hub.trucks[0])
-    hub.load_same_stop_truck(hub.trucks[0])
-    hub.load_zip_code_truck(hub.trucks[0])
-
-    # fill truck 2
-    hub.load_delayed_truck(hub.trucks[1], False)
-    hub.load_same_stop_truck(hub.trucks[1])
-    hub.load_zip_code_truck(hub.trucks[1])
-    hub.load_any_truck_(hub.trucks[1])
-
-    # fill up last truck
-    hub.load_any_truck_(hub.trucks[2])
-
-    info, miles = hub.get_miles()
+    # 2 drivers run waves of trips, delayed and corrected packages are loaded once they arrive
+    info, miles = hub.schedule_trips(drivers=2)
     # print_results(info, miles)
     # check_deliveries(hub)
     gui_menu(hub, info, miles)
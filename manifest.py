@@ -0,0 +1,88 @@
+"""
+Streaming ingestion of package manifests (csv files laid out like WGUPS_Package_File.csv).
+Rows flow through a generator pipeline so a manifest is never held in memory all at once.
+"""
+import csv
+import time
+from itertools import chain, islice
+
+from hash_table import HashTable
+from package import Package
+
+
+def read_rows(source):
+    """
+    Yields the csv rows of a manifest, skipping the title and header rows.
+    :param source: path to a csv file or an open file-like object
+    :return: generator of List[str]
+    """
+    if hasattr(source, "read"):
+        csv_file = source
+    else:
+        csv_file = open(source, newline="")
+    try:
+        for row in csv.reader(csv_file):
+            if row and row[0].strip().isdigit():
+                yield row
+    finally:
+        if csv_file is not source:
+            csv_file.close()
+
+
+def parse_rows(rows, report: dict):
+    """
+    Validates each row and yields the Package arguments. Bad rows are counted in report["skipped"].
+    :param rows: iterable of List[str]
+    :param report: dict that collects row counts
+    :return: generator of (pkg_id, address, zip_code, deadline, weight, notes)
+    """
+    for row in rows:
+        try:
+            pkg_id = int(row[0])
+            address = row[1].strip()
+            zip_code = int(row[4])
+            deadline = row[5].strip()
+            Package.parse_time(deadline)
+            weight = int(row[6])
+            notes = row[7].strip() if len(row) > 7 else ""
+        except (IndexError, ValueError):
+            report["skipped"] += 1
+            continue
+        if not address:
+            report["skipped"] += 1
+            continue
+        yield pkg_id, address, zip_code, deadline, weight, notes
+
+
+def chunks(items, size: int):
+    """
+    Groups an iterable into lists of at most size items.
+    :param items: iterable
+    :param size: int
+    :return: generator of lists
+    """
+    iterator = iter(items)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def ingest(database: HashTable, *sources, chunk_size=10000) -> dict:
+    """
+    Streams one or more manifests into the database chunk by chunk. Each source is only opened once
+    the previous one has been read. Rows with a pkg_id already in the database replace that package.
+    :param database: the package store
+    :param sources: paths or file-like objects
+    :param chunk_size: rows parsed before each bulk insert
+    :return: dict with rows, skipped, seconds and rows_per_second
+    """
+    report = {"rows": 0, "skipped": 0}
+    start = time.perf_counter()
+    rows = chain.from_iterable(read_rows(source) for source in sources)
+    for chunk in chunks(parse_rows(rows, report), chunk_size):
+        database.insert_many(chunk)
+        report["rows"] += len(chunk)
+    report["seconds"] = time.perf_counter() - start
+    report["rows_per_second"] = report["rows"] / report["seconds"] if report["seconds"] > 0 else 0.0
+    return report
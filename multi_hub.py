@@ -0,0 +1,240 @@
+"""
+Coordinates many depots that share one distance table. Packages are split between the depots, every depot
+plans its own day in a separate worker process, and the results and metrics are merged.
+"""
+import contextlib
+import io
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import manifest
+from hub_management import Hub
+from instrumentation import Instrumentation
+from load_planner import DELAY_NOTE, PackageConstraints, merge_groups, note_group
+from package import Package
+
+TRANSFER_NOTE = "Delayed on transfer---will not arrive to depot until {}"
+DELAYED_NOTE = re.compile(r"Delayed on [^-]*---will not arrive to depot until \d{1,2}:\d{2}\s*[ap]m", re.IGNORECASE)
+
+
+def run_depot(task):
+    """
+    Worker: builds a Hub for one depot, loads its packages, and runs its day with the trip scheduler.
+    :param task: (depot label, distance table path, package rows, truck count, drivers, collect metrics)
+    :return: dict with depot, trips, miles, deliveries, unplanned, seconds and metrics
+    """
+    depot, distance_table, rows, truck_count, drivers, collect_metrics = task
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        hub = Hub(truck_count, distance_table=distance_table, manifest=None, depot=depot,
+                  instrumentation=Instrumentation(enabled=collect_metrics))
+    hub.database.insert_many(rows)
+    info, miles = hub.schedule_trips(drivers)
+    deliveries = [(pkg.pkg_id, pkg.delivery_minutes) for pkg in hub.database.select("Delivered")]
+    return {
+        "depot": depot,
+        "trips": [" ".join(lines) for lines in info],
+        "miles": sum(miles),
+        "deliveries": deliveries,
+        "unplanned": [pkg.pkg_id for pkg in hub.database.select("At Hub")],
+        "seconds": time.perf_counter() - start,
+        "metrics": hub.metrics.report(),
+    }
+
+
+class HubCoordinator:
+    """
+    HubCoordinator assigns each package to the depot nearest its delivery location, or to the depot with
+    the closest zip code, then plans every depot's day in a process pool so planning time grows with
+    the number of depots divided by the number of cores. Packages that must be delivered together are
+    merged first and go to the depot that fits them best on average.
+    With transfers on, a depot given more packages than its daily capacity hands its farthest packages to the
+    next nearest depot with room, moving co-delivery groups whole. A transferred package leaves once it is
+    available at its first depot and arrives at the other after the drive between the depots.
+    Big-O is as follows:
+    assign: O(P * D) for P packages and D depots
+    run: O(D / W) single depot plans for W workers
+    """
+    def __init__(self, depots: list, distance_table='WGUPS_Distance_Table.csv', assign_by="nearest",
+                 truck_count=3, drivers=2, transfers=False, depot_capacity=None, opening_time="08:00 AM"):
+        """
+        :param depots: labels of the locations used as depots, "HUB" is WGU
+        :param distance_table: distance table csv shared by every depot
+        :param assign_by: "nearest" or "zip"
+        :param truck_count: trucks at each depot
+        :param drivers: drivers at each depot
+        :param transfers: move packages off depots that have more than depot_capacity
+        :param depot_capacity: packages a depot can take in one day, unlimited if None
+        :param opening_time: when the depots open
+        """
+        if assign_by not in ("nearest", "zip"):
+            raise ValueError(f'assign_by must be "nearest" or "zip", not {assign_by}')
+        self.depots = depots
+        self.distance_table = distance_table
+        self.assign_by = assign_by
+        self.truck_count = truck_count
+        self.drivers = drivers
+        self.transfers = transfers
+        self.depot_capacity = depot_capacity
+        self.opening_minutes = Package.parse_time(opening_time)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.hub = Hub(distance_table=distance_table, manifest=None)
+        self.locations = []
+        for depot in depots:
+            location = self.hub.center if depot == "HUB" else self.hub.destinations.get_location(depot)
+            if location is None:
+                raise ValueError(f'depot {depot} is not in the distance table')
+            self.locations.append(location)
+
+    def distance(self, depot: int, location) -> float:
+        """
+        :return: miles from the depot to location, inf if there is no road
+        """
+        if location is None:
+            return float("inf")
+        distance = self.hub.routing_graph().get_distance(self.locations[depot], location)
+        return float("inf") if distance is None else distance
+
+    def costs(self, row) -> list:
+        """
+        :param row: (pkg_id, address, zip_code, deadline, weight, notes)
+        :return: List[float] how badly the package fits each depot, miles or zip code distance
+        """
+        if self.assign_by == "zip":
+            zip_code = int(row[2])
+            return [abs(location.zip_code - zip_code) for location in self.locations]
+        location = self.hub.destinations.get_location(Package.convert_delivery_address(row[1]))
+        return [self.distance(depot, location) for depot in range(len(self.depots))]
+
+    def units(self, rows: list) -> list:
+        """
+        Merges the rows of packages that must be delivered together, as the LoadPlanner does.
+        :param rows: List[(pkg_id, address, zip_code, deadline, weight, notes)]
+        :return: List[List[int]] row indexes of each unit, in the order of their first row
+        """
+        roots = merge_groups({row[0]: note_group(row[5]) for row in rows})
+        units = {}
+        for index, row in enumerate(rows):
+            units.setdefault(roots[row[0]], []).append(index)
+        return list(units.values())
+
+    def assign(self, rows: list) -> list:
+        """
+        Splits the package rows between the depots. A co-delivery group goes to the depot with
+        the lowest combined cost of its packages, so it is never split.
+        :param rows: List[(pkg_id, address, zip_code, deadline, weight, notes)]
+        :return: (List[List[row]] one list per depot, number of transferred packages)
+        """
+        units = self.units(rows)
+        costs = []
+        for unit in units:
+            member_costs = [self.costs(rows[index]) for index in unit]
+            costs.append([sum(cost[depot] for cost in member_costs) / len(unit) for depot in range(len(self.depots))])
+        rankings = [sorted(range(len(self.depots)), key=unit_costs.__getitem__) for unit_costs in costs]
+        assigned = [[] for _ in self.depots]
+        for unit, ranking in enumerate(rankings):
+            assigned[ranking[0]].append(unit)
+        transferred = 0
+        if self.transfers and self.depot_capacity is not None:
+            transferred = self.balance(rows, units, costs, rankings, assigned)
+        return [[rows[index] for unit in depot_units for index in units[unit]] for depot_units in assigned], transferred
+
+    def balance(self, rows: list, units: list, costs: list, rankings: list, assigned: list) -> int:
+        """
+        Moves the units that fit their depot worst to their next choice with room, whole,
+        adding a transfer delay note so the receiving depot loads them once they arrive.
+        :param units: List[List[int]] row indexes of each unit
+        :param costs: List[List[float]] mean cost of each unit at each depot
+        :param rankings: List[List[int]] depots from best to worst for each unit
+        :param assigned: List[List[int]] units of each depot, changed in place
+        :return: number of packages transferred
+        """
+        loads = [sum(len(units[unit]) for unit in depot_units) for depot_units in assigned]
+        transferred = 0
+        for depot, depot_units in enumerate(assigned):
+            if loads[depot] <= self.depot_capacity:
+                continue
+            depot_units.sort(key=lambda unit: costs[unit][depot])
+            keep = []
+            kept = 0
+            for unit in depot_units:
+                size = len(units[unit])
+                if kept + size <= self.depot_capacity:
+                    keep.append(unit)
+                    kept += size
+                    continue
+                target = next((other for other in rankings[unit]
+                               if other != depot and loads[other] + size <= self.depot_capacity), depot)
+                if target == depot:
+                    keep.append(unit)
+                    kept += size
+                    continue
+                for index in units[unit]:
+                    rows[index] = self.transfer(rows[index], depot, target)
+                assigned[target].append(unit)
+                loads[target] += size
+                transferred += size
+            assigned[depot] = keep
+            loads[depot] = kept
+        return transferred
+
+    def transfer(self, row, source: int, target: int):
+        """
+        The transfer note replaces any delay note already on the package, since only the first one is read.
+        A package whose address is still wrong cannot leave yet, so its row is kept as it is.
+        :return: the row with a note delaying the package until it has been driven from source to target
+        """
+        available = PackageConstraints.parse(Package(*row), self.opening_minutes).available_minutes
+        if available is None:
+            return row
+        miles = self.hub.routing_graph().get_distance(self.locations[source], self.locations[target]) or 0.0
+        arrival = Package.get_delivery_minutes(miles, self.hub.trucks[0].speed, available)
+        pkg_id, address, zip_code, deadline, weight, notes = row
+        time = Package.format_time(arrival).lower()
+        note = TRANSFER_NOTE.format(time)
+        if DELAYED_NOTE.search(notes):
+            notes = DELAYED_NOTE.sub(lambda _: note, notes, count=1)
+        elif DELAY_NOTE.search(notes):
+            notes = DELAY_NOTE.sub(lambda _: f'until {time}', notes, count=1)
+        else:
+            notes = f'{notes}---{note}' if notes else note
+        return pkg_id, address, zip_code, deadline, weight, notes
+
+    def run(self, *sources, workers=None, collect_metrics=True) -> dict:
+        """
+        Plans every depot's day in parallel and merges the results.
+        :param sources: manifest csv paths or file-like objects, WGUPS_Package_File.csv if none are given
+        :param workers: number of processes, defaults to the number of cpus
+        :param collect_metrics: enable the instrumentation in each worker
+        :return: dict with depots, miles, delivered, on_time, transferred, unplanned, seconds and metrics
+        """
+        start = time.perf_counter()
+        if not sources:
+            sources = ('WGUPS_Package_File.csv',)
+        report = {"skipped": 0}
+        rows = [row for source in sources for row in manifest.parse_rows(manifest.read_rows(source), report)]
+        split, transferred = self.assign(rows)
+        tasks = [(depot, self.distance_table, depot_rows, self.truck_count, self.drivers, collect_metrics)
+                 for depot, depot_rows in zip(self.depots, split)]
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(run_depot, tasks))
+        metrics = Instrumentation()
+        deadlines = {row[0]: Package.parse_time(row[3]) for row in rows}
+        on_time = 0
+        delivered = 0
+        for result in results:
+            metrics.merge(result.pop("metrics"), prefix=f'{result["depot"]}:')
+            delivered += len(result["deliveries"])
+            on_time += sum(1 for pkg_id, minutes in result["deliveries"] if minutes <= deadlines[pkg_id])
+        return {
+            "depots": results,
+            "miles": sum(result["miles"] for result in results),
+            "delivered": delivered,
+            "on_time": on_time,
+            "transferred": transferred,
+            "unplanned": sum(len(result["unplanned"]) for result in results),
+            "skipped": report["skipped"],
+            "seconds": time.perf_counter() - start,
+            "metrics": metrics.report(),
+        }
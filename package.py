@@ -1,13 +1,41 @@
 """
 Package class holds all the information for a package
 """
+from functools import lru_cache
+from sys import intern
+
+END_OF_DAY = 24 * 60
+
+# delivery statuses are stored as small ints, STATUSES[code] gives the display string back
+STATUSES = ["At Hub", "In Route", "Delivered"]
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+
+def status_code(status: str) -> int:
+    """
+    Returns the code for a delivery status, registering new statuses the first time they are seen.
+    :param status: str
+    :return: int
+    """
+    code = STATUS_CODES.get(status)
+    if code is None:
+        code = STATUS_CODES[status] = len(STATUSES)
+        STATUSES.append(intern(status))
+    return code
 
 
 class Package:
     """
     Packages have id numbers, a delivery address and zip code, a deadline, weight,
-    and special notes for delivery instructions
+    and special notes for delivery instructions.
+    Packages use __slots__, interned strings, status codes, and minutes since midnight for
+    delivery times to keep each instance small.
     """
+    __slots__ = ("listener", "pkg_id", "_address", "_zip_code", "deadline", "deadline_minutes",
+                 "weight", "special_notes", "_status", "delivery_minutes")
+
+    city = "Salt Lake City"
+    state = "UT"
 
     def __init__(self, pkg_id: int, address: str, zip_code: int, dl: str, wt: int, notes: str):
         """
@@ -19,16 +47,111 @@ class Package:
         :param notes: describes problems with or instructions for a package's delivery
         """
 
+        self.listener = None
         self.pkg_id = pkg_id
-        self.address = self.convert_delivery_address(address)
-        self.city = "Salt Lake City"
-        self.state = "UT"
-        self.zip_code = zip_code
-        self.deadline = dl
+        self._address = intern(self.convert_delivery_address(address))
+        self._zip_code = zip_code
+        self.deadline = intern(dl)
+        self.deadline_minutes = self.parse_time(dl)
         self.weight = wt
-        self.special_notes = notes
-        self.delivery_status = "At Hub"
-        self.delivery_time = "24:00 AM"
+        self.special_notes = intern(notes)
+        self._status = 0
+        self.delivery_minutes = END_OF_DAY
+
+    @classmethod
+    def restore_many(cls, rows) -> list:
+        """
+        Rebuilds saved packages without parsing their addresses and deadlines again.
+        :param rows: iterable of (pkg_id, address, zip_code, deadline, deadline_minutes, weight, notes,
+         delivery_status, delivery_minutes) with the address already converted
+        :return: List[Package]
+        """
+        new = cls.__new__
+        codes = {}
+        packages = []
+        for pkg_id, address, zip_code, dl, deadline_minutes, wt, notes, status, delivery_minutes in rows:
+            package = new(cls)
+            package.listener = None
+            package.pkg_id = pkg_id
+            package._address = intern(address)
+            package._zip_code = zip_code
+            package.deadline = intern(dl)
+            package.deadline_minutes = deadline_minutes
+            package.weight = wt
+            package.special_notes = intern(notes)
+            code = codes.get(status)
+            if code is None:
+                code = codes[status] = status_code(status)
+            package._status = code
+            package.delivery_minutes = delivery_minutes
+            packages.append(package)
+        return packages
+
+    @property
+    def address(self) -> str:
+        """delivery address, changes are reported to the listener so its indexes stay current"""
+        return self._address
+
+    @address.setter
+    def address(self, address: str):
+        old = self._address
+        self._address = intern(address)
+        if self.listener is not None:
+            self.listener.reindex(self, "address", old, address)
+
+    @property
+    def zip_code(self):
+        """zip code, changes are reported to the listener so its indexes stay current"""
+        return self._zip_code
+
+    @zip_code.setter
+    def zip_code(self, zip_code):
+        old = self._zip_code
+        self._zip_code = zip_code
+        if self.listener is not None:
+            self.listener.reindex(self, "zip_code", old, zip_code)
+
+    @property
+    def delivery_status(self) -> str:
+        """At Hub, In Route, or Delivered. Changes are reported to the listener."""
+        return STATUSES[self._status]
+
+    @delivery_status.setter
+    def delivery_status(self, status: str):
+        old = STATUSES[self._status]
+        self._status = status_code(status)
+        if self.listener is not None:
+            self.listener.reindex(self, "delivery_status", old, status)
+
+    @property
+    def delivery_time(self) -> str:
+        """delivery time in 12 hr time, stored as minutes since midnight"""
+        return self.format_time(self.delivery_minutes)
+
+    @delivery_time.setter
+    def delivery_time(self, time: str):
+        self.delivery_minutes = self.parse_time(time)
+
+    @staticmethod
+    def parse_time(time: str) -> int:
+        """
+        Convert a time from str into minutes since midnight.
+        12:xx AM is just after midnight and 12:xx PM is just after noon.
+        :param time: str containing hr:min and AM or PM in either case, or EOD
+        :return: int minutes since midnight, EOD is END_OF_DAY
+        """
+        time = time.strip()
+        if time == "EOD":
+            return END_OF_DAY
+        hour, rest = time.split(":", 1)
+        hour = int(hour)
+        minute = int(rest[:2])
+        am_pm = rest[2:].strip().upper()
+        if am_pm == "PM" and hour < 12:
+            hour += 12
+        elif am_pm == "AM" and hour == 12:
+            hour = 0
+        return hour * 60 + minute
 
     @staticmethod
     def calculate_deadline(deadline: str) -> float:
@@ -37,20 +160,14 @@ class Package:
         :param deadline: str containing hr:min and AM or PM
         :return: float representation of the dl time in 24 hr time
         """
-        if deadline == "EOD":
-            return 24.0
-        time = deadline.split(":")
-        am_pm = float(0.0)
-        if time[1][3:-1] == "PM":
-            am_pm = 12.0
-        hour = float(time[0])
-        minute = float(time[1][0:2]) / 60
-        return hour + minute + am_pm
+        return Package.parse_time(deadline) / 60
 
     @staticmethod
+    @lru_cache(maxsize=65536)
     def convert_delivery_address(address: str) -> str:
         """
-        Makes the delivery address more consistent with Location labels
+        Makes the delivery address more consistent with Location labels.
+        Results are cached so each distinct address is only converted once.
         :param address: containing North, South, East, West
         :return: address string with abbreviated cardinal directions
         """
@@ -60,6 +177,36 @@ class Package:
         address = address.replace('West', 'W')
         return address
 
+    @staticmethod
+    def format_time(minutes: int) -> str:
+        """
+        Convert minutes since midnight into 12 hr time.
+        :param minutes: int
+        :return: str like 9:05 AM, END_OF_DAY is shown as 24:00 AM
+        """
+        if minutes >= END_OF_DAY:
+            return "24:00 AM"
+        hour, minute = divmod(int(minutes), 60)
+        am_pm = " AM"
+        if hour >= 12:
+            am_pm = " PM"
+            if hour > 12:
+                hour -= 12
+        elif hour == 0:
+            hour = 12
+        return f'{hour}:{minute:02d}{am_pm}'
+
+    @staticmethod
+    def get_delivery_minutes(miles: float, avg_speed: float, departure_minutes: int) -> int:
+        """
+        Calculate delivery time based on average speed and mileage.
+        :param miles: current miles traveled from HUB
+        :param avg_speed: avg_speed of the truck
+        :param departure_minutes: the time the truck leaves the Hub in minutes since midnight
+        :return: int minutes since midnight, partial minutes are dropped
+        """
+        return int(departure_minutes + miles / avg_speed * 60)
+
     @staticmethod
     def get_delivery_time(miles: float, avg_speed: float, departure_time: str) -> str:
         """
@@ -69,20 +216,8 @@ class Package:
         :param departure_time: the time the truck leaves the Hub
         :return: str representation of the dl time in 12 hr time
         """
-        start_time = Package.calculate_deadline(departure_time)
-        delivery_time = miles / avg_speed
-        delivery_time += start_time
-        hour = int(delivery_time)
-        minute = int(60 * (delivery_time - hour))
-        am_pm = " AM"
-        if hour >= 12:
-            am_pm = " PM"
-            if hour > 12:
-                hour -= 12
-        if minute < 10:
-            minute = "0" + str(minute)
-        time = str(hour) + ":" + str(minute) + am_pm
-        return time
+        departure_minutes = Package.parse_time(departure_time)
+        return Package.format_time(Package.get_delivery_minutes(miles, avg_speed, departure_minutes))
 
     def correct_info(self, address: str = "", zip_code: str = "", notes: str = ""):
         """
@@ -97,7 +232,7 @@ class Package:
         if zip_code != "":
             self.zip_code = zip_code
         if notes != "":
-            self.special_notes += "---" + notes
+            self.special_notes = intern(self.special_notes + "---" + notes)
 
     def __str__(self) -> str:
         return str(f'PkgID={self.pkg_id} '
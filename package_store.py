@@ -0,0 +1,484 @@
+"""
+Durable storage for the package hash table. Every change is appended to a write-ahead journal and the
+whole table is written to a compact binary snapshot from time to time, so a restart loads the snapshot
+and replays the journal instead of parsing the manifest again.
+
+A store is a directory holding:
+    snapshot.bin  header (magic, version, sequence, crc32), every package encoded column by column,
+                  the event log, then the table's slots so loading does not probe for each package again
+    journal.bin   one frame per commit: header (length, crc32, sequence) then the changed packages,
+                  the new events, and the removed pkg_ids, encoded the same way
+"""
+import gc
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from event_log import EventLog
+from hash_table import HashTable
+from package import Package
+
+STORE_VERSION = 1
+MAGIC = b"WGPS"
+SNAPSHOT_HEADER = struct.Struct("<4sIQI")  # magic, version, sequence, crc32 of the body
+FRAME_HEADER = struct.Struct("<IIQ")  # body length, crc32 of the body, sequence
+BLOCK_HEADER = struct.Struct("<III")  # packages, strings, string bytes
+EVENTS_HEADER = struct.Struct("<BIII")  # log cleared first, events, strings, string bytes
+TEXT_FIELDS = 5  # address, zip code, deadline, notes, status
+
+
+def encode_packages(packages) -> bytes:
+    """
+    Encodes packages column by column. Strings are stored once in a table and referenced by index,
+    so the repeated addresses, deadlines, notes and statuses cost four bytes per package.
+    :param packages: iterable of Package, pkg_id and weight must be ints
+    :return: bytes
+    """
+    strings = {}
+    ids = array("q")
+    weights = array("q")
+    minutes = array("i")  # deadline then delivery time of each package
+    refs = array("I")
+    zip_is_int = array("B")
+    for package in packages:
+        ids.append(int(package.pkg_id))
+        weights.append(int(package.weight))
+        minutes.append(package.deadline_minutes)
+        minutes.append(int(package.delivery_minutes))
+        zip_code = package.zip_code
+        zip_is_int.append(isinstance(zip_code, int))
+        for text in (package.address, str(zip_code), package.deadline, package.special_notes,
+                     package.delivery_status):
+            ref = strings.get(text)
+            if ref is None:
+                if "\0" in text:
+                    raise ValueError(f'package {package.pkg_id} has a NUL character in {text!r}')
+                ref = strings[text] = len(strings)
+            refs.append(ref)
+    blob = "\0".join(strings).encode()
+    columns = (ids, weights, minutes, refs)
+    if sys.byteorder == "big":
+        for column in columns:
+            column.byteswap()
+    return b"".join([BLOCK_HEADER.pack(len(ids), len(strings), len(blob)), blob]
+                    + [column.tobytes() for column in columns] + [zip_is_int.tobytes()])
+
+
+def decode_packages(data, offset=0):
+    """
+    Rebuilds the packages written by encode_packages.
+    :param data: bytes
+    :param offset: where the block starts in data
+    :return: (List[Package], offset just past the block)
+    """
+    count, string_count, blob_length = BLOCK_HEADER.unpack_from(data, offset)
+    offset += BLOCK_HEADER.size
+    strings = bytes(data[offset:offset + blob_length]).decode().split("\0") if string_count else []
+    offset += blob_length
+    columns = []
+    for typecode, length in (("q", count), ("q", count), ("i", 2 * count), ("I", TEXT_FIELDS * count)):
+        column = array(typecode)
+        end = offset + length * column.itemsize
+        column.frombytes(data[offset:end])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns.append(column)
+        offset = end
+    zip_is_int = data[offset:offset + count]
+    offset += count
+    ids, weights, minutes, refs = columns
+    texts = [[strings[ref] for ref in refs[field::TEXT_FIELDS]] for field in range(TEXT_FIELDS)]
+    addresses, zip_codes, deadlines, notes, statuses = texts
+    zip_codes = [int(zip_code) if is_int else zip_code for zip_code, is_int in zip(zip_codes, zip_is_int)]
+    rows = zip(ids, addresses, zip_codes, deadlines, minutes[0::2], weights, notes, statuses, minutes[1::2])
+    return Package.restore_many(rows), offset
+
+
+def encode_events(events, cleared=False) -> bytes:
+    """
+    Encodes (time, pkg_id, status) events column by column with the statuses in a string table.
+    :param events: sequence of (minutes since midnight, pkg_id, status)
+    :param cleared: the log was cleared before these events
+    :return: bytes
+    """
+    strings = {}
+    times = array("i", [event[0] for event in events])
+    ids = array("q", [int(event[1]) for event in events])
+    refs = array("I", [strings.setdefault(event[2], len(strings)) for event in events])
+    blob = "\0".join(strings).encode()
+    columns = (times, ids, refs)
+    if sys.byteorder == "big":
+        for column in columns:
+            column.byteswap()
+    return b"".join([EVENTS_HEADER.pack(cleared, len(events), len(strings), len(blob)), blob]
+                    + [column.tobytes() for column in columns])
+
+
+def decode_events(data, offset=0):
+    """
+    Rebuilds the events written by encode_events.
+    :param data: bytes
+    :param offset: where the block starts in data
+    :return: (cleared, List[(time, pkg_id, status)], offset just past the block)
+    """
+    cleared, count, string_count, blob_length = EVENTS_HEADER.unpack_from(data, offset)
+    offset += EVENTS_HEADER.size
+    strings = bytes(data[offset:offset + blob_length]).decode().split("\0") if string_count else []
+    offset += blob_length
+    columns = []
+    for typecode in ("i", "q", "I"):
+        column = array(typecode)
+        end = offset + count * column.itemsize
+        column.frombytes(data[offset:end])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns.append(column)
+        offset = end
+    times, ids, refs = columns
+    return bool(cleared), list(zip(times, ids, [strings[ref] for ref in refs])), offset
+
+
+class JournaledEventLog(EventLog):
+    """
+    EventLog that reports every new event, and every clear, to its PackageStore.
+    """
+
+    def __init__(self, store, initial_status="At Hub"):
+        """
+        :param store: PackageStore the events go to
+        """
+        super().__init__(initial_status)
+        self.store = store
+
+    def record(self, time: int, pkg_id: int, status: str):
+        super().record(time, pkg_id, status)
+        self.store.recorded((time, pkg_id, status))
+
+    def clear(self):
+        super().clear()
+        self.store.cleared()
+
+
+class JournaledHashTable(HashTable):
+    """
+    HashTable that reports every change to its PackageStore. Packages already report address, zip code
+    and status changes through reindex. Changes the table cannot see, like special_notes, are
+    reported by calling update with the package.
+    """
+
+    def __init__(self, store, table_size=41, load_factor=0.8):
+        """
+        :param store: PackageStore the changes go to
+        """
+        super().__init__(table_size, load_factor)
+        self.store = store
+
+    def put(self, package: Package):
+        super().put(package)
+        self.store.changed(package)
+
+    def put_many(self, packages: list) -> int:
+        count = super().put_many(packages)
+        self.store.changed_many(packages)
+        return count
+
+    def load(self, packages: list, slots=None):
+        super().load(packages, slots)
+        self.store.changed_many(packages)
+
+    def update(self, package: Package):
+        super().update(package)
+        if int(package.pkg_id) in self:
+            self.store.changed(package)
+
+    def remove(self, pkg_id: int):
+        if pkg_id in self:
+            super().remove(pkg_id)
+            self.store.removed(int(pkg_id))
+
+    def reindex(self, package: Package, field: str, old, new):
+        super().reindex(package, field, old, new)
+        self.store.changed(package)
+
+    def apply_status(self, packages: list, status: str, minutes: int = None):
+        super().apply_status(packages, status, minutes)
+        self.store.changed_many(packages)
+
+    def commit(self):
+        """
+        Makes every change so far durable with one write and one fsync.
+        :return: None
+        """
+        self.store.commit()
+
+
+class PackageStore:
+    """
+    PackageStore keeps a JournaledHashTable and the JournaledEventLog of its status history on disk.
+    Package changes are buffered by pkg_id and new events in order, and both are written as one journal
+    frame per commit (group commit), so a commit costs one fsync however many packages changed, and a
+    package changed many times between commits is written once. A commit happens when commit is
+    called, or on the next change once commit_every changes are waiting or commit_interval
+    seconds have passed. Once the journal grows past snapshot_every bytes the table is written to a
+    new snapshot and the journal starts over.
+    A frame holds the whole state of each changed package, so replaying it is an upsert. Frames carry
+    the commit sequence number and a crc32: frames already in the snapshot are skipped, and a frame
+    torn by a crash ends the replay and is cut off.
+    Big-O is as follows:
+    changed: O(1)
+    commit: O(C) for C changed packages
+    snapshot: O(N)
+    open: O(N + J) for N packages in the snapshot and J journaled changes
+    """
+
+    def __init__(self, directory: str, commit_every=4096, commit_interval=1.0, snapshot_every=16 << 20, sync=True):
+        """
+        :param directory: folder for snapshot.bin and journal.bin, created if missing
+        :param commit_every: changed packages that trigger a commit
+        :param commit_interval: seconds after the last commit that trigger a commit on the next change
+        :param snapshot_every: journal bytes that trigger a snapshot
+        :param sync: fsync commits and snapshots, turn off only when durability does not matter
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, "snapshot.bin")
+        self.journal_path = os.path.join(directory, "journal.bin")
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.sync = sync
+        self.pending = {}  # pkg_id -> Package to write, or None if it was removed
+        self.pending_events = []
+        self.events_cleared = False
+        self.sequence = 0
+        self.journal = None
+        self.database = None
+        self.events = None
+        self.last_commit = time.monotonic()
+        self.stats = {"commits": 0, "changes_written": 0, "snapshots": 0, "replayed_frames": 0,
+                      "torn_bytes": 0}
+
+    def open(self) -> JournaledHashTable:
+        """
+        Loads the snapshot, replays the journal after it, and opens the journal for appending.
+        The restored event log is kept in self.events.
+        :return: JournaledHashTable holding every committed package
+        """
+        # the load allocates objects that all survive, so garbage collection passes would only slow it down
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            packages, events, slots, self.sequence = self.read_snapshot()
+            database = JournaledHashTable(self)
+            log = JournaledEventLog(self)
+            # the base class methods leave out the journal, everything loaded here is already durable
+            HashTable.load(database, packages, slots)
+            for event in events:
+                EventLog.record(log, *event)
+            for sequence, changed, cleared, new_events, removed in self.read_journal(self.sequence):
+                HashTable.put_many(database, changed)
+                for pkg_id in removed:
+                    HashTable.remove(database, pkg_id)
+                if cleared:
+                    EventLog.clear(log)
+                for event in new_events:
+                    EventLog.record(log, *event)
+                self.sequence = sequence
+                self.stats["replayed_frames"] += 1
+        finally:
+            if collecting:
+                gc.enable()
+        self.database = database
+        self.events = log
+        self.journal = open(self.journal_path, "ab")
+        self.last_commit = time.monotonic()
+        return database
+
+    def read_snapshot(self):
+        """
+        :return: (List[Package], List[event], slots, sequence of the last commit in the snapshot),
+         empty if there is none
+        """
+        try:
+            with open(self.snapshot_path, "rb") as snapshot_file:
+                data = snapshot_file.read()
+        except FileNotFoundError:
+            return [], [], None, 0
+        if len(data) < SNAPSHOT_HEADER.size:
+            raise ValueError(f'{self.snapshot_path} is truncated')
+        magic, version, sequence, crc = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != MAGIC or version != STORE_VERSION:
+            raise ValueError(f'{self.snapshot_path} is not a version {STORE_VERSION} package snapshot')
+        body = memoryview(data)[SNAPSHOT_HEADER.size:]
+        if zlib.crc32(body) != crc:
+            raise ValueError(f'{self.snapshot_path} failed its checksum')
+        packages, offset = decode_packages(body)
+        _, events, offset = decode_events(body, offset)
+        slots = array("i")
+        slots.frombytes(body[offset:])
+        if sys.byteorder == "big":
+            slots.byteswap()
+        return packages, events, slots, sequence
+
+    def read_journal(self, after: int):
+        """
+        Yields the committed frames newer than after. A torn or corrupt frame ends the journal
+        and is cut off so new commits follow the last good one.
+        :param after: sequence already in the snapshot
+        :return: generator of (sequence, List[Package] changed, log cleared, List[event] recorded,
+         array of removed pkg_ids)
+        """
+        try:
+            with open(self.journal_path, "rb") as journal_file:
+                data = journal_file.read()
+        except FileNotFoundError:
+            return
+        view = memoryview(data)
+        offset = 0
+        while offset + FRAME_HEADER.size <= len(data):
+            length, crc, sequence = FRAME_HEADER.unpack_from(data, offset)
+            start = offset + FRAME_HEADER.size
+            body = view[start:start + length]
+            if len(body) < length or zlib.crc32(body) != crc:
+                break
+            offset = start + length
+            if sequence <= after:
+                continue
+            changed, end = decode_packages(body)
+            cleared, events, end = decode_events(body, end)
+            removed = array("q")
+            removed.frombytes(body[end:])
+            if sys.byteorder == "big":
+                removed.byteswap()
+            yield sequence, changed, cleared, events, removed
+        if offset < len(data):
+            self.stats["torn_bytes"] += len(data) - offset
+            with open(self.journal_path, "r+b") as journal_file:
+                journal_file.truncate(offset)
+
+    def changed(self, package: Package):
+        """
+        Queues a package to be written by the next commit.
+        :return: None
+        """
+        self.pending[int(package.pkg_id)] = package
+        self.maybe_commit()
+
+    def changed_many(self, packages: list):
+        """
+        Queues many packages to be written by the next commit.
+        :return: None
+        """
+        self.pending.update((int(package.pkg_id), package) for package in packages)
+        self.maybe_commit()
+
+    def removed(self, pkg_id: int):
+        """
+        Queues the removal of a package for the next commit.
+        :return: None
+        """
+        self.pending[pkg_id] = None
+        self.maybe_commit()
+
+    def recorded(self, event: tuple):
+        """
+        Queues a new event for the next commit.
+        :return: None
+        """
+        self.pending_events.append(event)
+        self.maybe_commit()
+
+    def cleared(self):
+        """
+        Queues the clearing of the event log, which also drops the events waiting to be written.
+        :return: None
+        """
+        self.pending_events.clear()
+        self.events_cleared = True
+        self.maybe_commit()
+
+    def maybe_commit(self):
+        """
+        Commits once enough changes are waiting or the last commit is old enough.
+        :return: None
+        """
+        waiting = len(self.pending) + len(self.pending_events)
+        if waiting >= self.commit_every or time.monotonic() - self.last_commit >= self.commit_interval:
+            self.commit()
+
+    def commit(self) -> int:
+        """
+        Appends one journal frame with every waiting change and syncs it to disk.
+        :return: number of changes written
+        """
+        if not (self.pending or self.pending_events or self.events_cleared) or self.journal is None:
+            return 0
+        changed = [package for package in self.pending.values() if package is not None]
+        removed = array("q", [pkg_id for pkg_id, package in self.pending.items() if package is None])
+        if sys.byteorder == "big":
+            removed.byteswap()
+        body = encode_packages(changed) + encode_events(self.pending_events, self.events_cleared) + removed.tobytes()
+        self.sequence += 1
+        self.journal.write(FRAME_HEADER.pack(len(body), zlib.crc32(body), self.sequence) + body)
+        self.journal.flush()
+        if self.sync:
+            os.fsync(self.journal.fileno())
+        count = len(self.pending) + len(self.pending_events)
+        self.pending.clear()
+        self.pending_events = []
+        self.events_cleared = False
+        self.last_commit = time.monotonic()
+        self.stats["commits"] += 1
+        self.stats["changes_written"] += count
+        if self.journal.tell() >= self.snapshot_every:
+            self.snapshot()
+        return count
+
+    def snapshot(self):
+        """
+        Writes the whole table to a new snapshot, replaces the old one, and empties the journal.
+        A crash before the journal is emptied is harmless since its frames are older than the snapshot.
+        :return: None
+        """
+        self.commit()
+        database = self.database
+        if len(database.entries) != len(database):
+            database.rehash(database.table_size)  # drop removed entries so the slots match the saved order
+        slots = array("i", database.slots)
+        if sys.byteorder == "big":
+            slots.byteswap()
+        body = encode_packages(database) + encode_events(self.events.events) + slots.tobytes()
+        temporary_path = self.snapshot_path + ".tmp"
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(SNAPSHOT_HEADER.pack(MAGIC, STORE_VERSION, self.sequence, zlib.crc32(body)))
+            snapshot_file.write(body)
+            snapshot_file.flush()
+            if self.sync:
+                os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+        if self.sync and hasattr(os, "O_DIRECTORY"):
+            folder = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(folder)
+            finally:
+                os.close(folder)
+        self.journal.truncate(0)
+        self.journal.seek(0)
+        self.stats["snapshots"] += 1
+
+    def close(self, snapshot=True):
+        """
+        Commits the waiting changes and closes the journal.
+        :param snapshot: also write a snapshot if the journal is not empty, so the next open has nothing to replay
+        :return: None
+        """
+        if self.journal is None:
+            return
+        self.commit()
+        if snapshot and self.journal.tell() > 0:
+            self.snapshot()
+        self.journal.close()
+        self.journal = None
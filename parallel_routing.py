@@ -0,0 +1,180 @@
+"""
+Plans truck routes in a pool of worker processes. The distance matrix is copied into shared memory
+and each worker attaches to it when it starts, so the graph is never pickled per truck.
+The pool and the shared matrix are kept between calls and only refreshed when the graph changes.
+"""
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import weakref
+
+from package import END_OF_DAY
+from route_optimizer import nearest_neighbor_tour
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# set in each worker process by attach
+WORKER = {}
+
+
+def attach(name: str, size: int, optimizer):
+    """
+    Pool initializer, attaches the worker to the shared distance matrix.
+    :param name: name of the shared memory block
+    :param size: number of locations in the matrix
+    :param optimizer: the Hub's route optimizer or None
+    :return: None
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    WORKER["memory"] = memory
+    WORKER["matrix"] = memory.buf.cast("d")
+    WORKER["size"] = size
+    WORKER["optimizer"] = optimizer
+
+
+def plan_tour(task):
+    """
+    Builds and improves one truck's route inside a worker.
+    :param task: (matrix indexes of the Hub and stops, deadline at each, departure minutes, speed)
+    :return: (visiting order as positions in the task's indexes, nearest neighbor miles)
+    """
+    indexes, limits, depart_minutes, speed = task
+    matrix = WORKER["matrix"]
+    size = WORKER["size"]
+    local = [[matrix[i * size + j] for j in indexes] for i in indexes]
+    tour = nearest_neighbor_tour(local)
+    initial_distance = 0.0
+    for previous, current in zip(tour, tour[1:] + [0]):
+        initial_distance += local[previous][current]
+    optimizer = WORKER["optimizer"]
+    if optimizer is not None:
+        reordered = [[local[i][j] for j in tour] for i in tour]
+        improved = optimizer.improve_tour(reordered, [limits[i] for i in tour], depart_minutes, speed)
+        tour = [tour[i] for i in improved]
+    return tour, initial_distance
+
+
+class RoutePool:
+    """
+    RoutePool keeps a process pool attached to one shared memory copy of the distance matrix.
+    The matrix is copied again only when the graph or its version changes, and the pool and the segment
+    are only replaced when the number of locations, the optimizer, or the number of workers changes.
+    Big-O is as follows:
+    share: O(N^2) when the matrix is copied, O(1) otherwise
+    plan: O(T * S^2) for T trucks and S stops per truck, spread over the workers
+    """
+    def __init__(self):
+        self.memory = None
+        self.pool = None
+        self.key = None
+        self.graph = None
+        self.version = None
+        self.finalizer = None
+
+    def share(self, graph, optimizer, workers):
+        """
+        Makes sure the workers see the graph's current distances.
+        :param graph: DenseDistanceTable
+        :param optimizer: RouteOptimizer or None, sent to each worker once when the pool starts
+        :param workers: number of processes, None for the number of cpus
+        :return: None
+        """
+        size = len(graph.locations)
+        key = (size, id(optimizer), workers)
+        if key != self.key:
+            self.close()
+            self.memory = shared_memory.SharedMemory(create=True, size=max(size * size, 1) * 8)
+            self.pool = ProcessPoolExecutor(workers, initializer=attach, initargs=(self.memory.name, size, optimizer))
+            self.finalizer = weakref.finalize(self, RoutePool.release, self.memory, self.pool)
+            self.key = key
+        if graph is not self.graph or graph.version != self.version:
+            copy_matrix(graph.export_matrix(), self.memory, size)
+            self.graph = graph
+            self.version = graph.version
+
+    def plan(self, tasks: list) -> list:
+        """
+        :param tasks: one plan_tour task per truck
+        :return: the results of plan_tour in the order of tasks
+        """
+        return list(self.pool.map(plan_tour, tasks))
+
+    def close(self):
+        """
+        Shuts the workers down and frees the shared matrix.
+        :return: None
+        """
+        if self.finalizer is not None:
+            self.finalizer()
+        self.memory = None
+        self.pool = None
+        self.key = None
+        self.graph = None
+        self.finalizer = None
+
+    @staticmethod
+    def release(memory, pool):
+        """
+        Runs once, from close or when the RoutePool is garbage collected.
+        :return: None
+        """
+        pool.shutdown()
+        memory.close()
+        memory.unlink()
+
+
+def copy_matrix(matrix, memory, size: int):
+    """
+    Copies the distances straight into the shared block, without building a list of floats first.
+    :param matrix: N x N NumPy array or flat array of N * N floats
+    :param memory: SharedMemory of at least N * N doubles
+    :param size: N
+    :return: None
+    """
+    if numpy is not None and hasattr(matrix, "ravel"):
+        numpy.ndarray((size, size), dtype=numpy.float64, buffer=memory.buf)[:] = matrix
+        return
+    shared = memory.buf.cast("d")
+    try:
+        shared[:size * size] = matrix if matrix.typecode == "d" else array("d", matrix)
+    finally:
+        shared.release()
+
+
+def plan_routes(hub, trucks: list, workers=None, pool=None) -> list:
+    """
+    Plans the route of every truck in parallel. Results come back in the order of trucks,
+    so the caller can drive them one after another and get the same delivery times every run.
+    An optimizer without improve_tour cannot run in the workers, so the routes are then planned here one by one.
+    :param hub: Hub whose routing graph is a DenseDistanceTable
+    :param trucks: List[Truck]
+    :param workers: number of processes, defaults to the number of cpus
+    :param pool: RoutePool to reuse, a new one is made and closed again if None
+    :return: List[(List[Location] route starting at the Hub, nearest neighbor miles)]
+    """
+    if hub.optimizer is not None and not hasattr(hub.optimizer, "improve_tour"):
+        return [hub.plan_route(truck) for truck in trucks]
+    graph = hub.routing_graph()
+    tasks = []
+    for truck in trucks:
+        stops = list(truck.cargo.keys())
+        deadlines = hub.stop_deadlines(truck)
+        indexes = [graph.indexes[hub.center]] + [graph.indexes[stop] for stop in stops]
+        limits = [END_OF_DAY] + [deadlines[stop] for stop in stops]
+        tasks.append((indexes, limits, truck.depart_minutes, truck.speed))
+    owned = pool is None
+    pool = RoutePool() if owned else pool
+    try:
+        pool.share(graph, hub.optimizer, workers)
+        results = pool.plan(tasks)
+    finally:
+        if owned:
+            pool.close()
+    routes = []
+    for truck, (tour, initial_distance) in zip(trucks, results):
+        points = [hub.center] + list(truck.cargo.keys())
+        routes.append(([points[i] for i in tour], initial_distance))
+    return routes
@@ -0,0 +1,144 @@
+"""
+Incremental changes to a truck's route while it is out delivering. One stop is inserted, removed, or moved
+and only that truck's remaining route is repaired, so dispatcher edits are answered in milliseconds.
+"""
+from location import Location
+from package import END_OF_DAY
+from route_optimizer import RouteOptimizer
+
+
+class LiveRoute:
+    """
+    The rest of a truck's route.
+    position: the Location the truck is at
+    minutes: the time it is there in minutes since midnight
+    stops: List[Location] still to visit, the truck returns to hub after the last one
+    deadlines: Dict[Location, int] earliest deadline at each stop
+    """
+    __slots__ = ("truck", "hub", "position", "minutes", "stops", "deadlines")
+
+    def __init__(self, truck, hub: Location, position: Location, minutes: int, stops: list, deadlines: dict):
+        self.truck = truck
+        self.hub = hub
+        self.position = position
+        self.minutes = minutes
+        self.stops = stops
+        self.deadlines = deadlines
+
+
+class Rerouter:
+    """
+    Rerouter edits a LiveRoute with cheapest insertion, then repairs it with a short run of the
+    route optimizer. The optimizer sees the truck's position and the Hub as one node, leaving from the
+    position and arriving at the Hub, so the repair never moves the truck or the return trip.
+    Big-O is as follows:
+    insert: O(S^2) to find the position plus the repair budget
+    remove: O(S) plus the repair budget
+    relocate: same as insert
+    """
+    def __init__(self, graph, optimizer=None, repair_budget=0.005):
+        """
+        :param graph: DistanceTable the routes are planned on
+        :param optimizer: RouteOptimizer used for repairs, one with repair_budget seconds if None
+        :param repair_budget: seconds allowed per repair when no optimizer is given
+        """
+        self.graph = graph
+        self.optimizer = RouteOptimizer(time_budget=repair_budget) if optimizer is None else optimizer
+
+    def remaining_miles(self, live: LiveRoute) -> float:
+        """
+        :return: miles from the truck's position through its stops and back to the Hub
+        """
+        nodes = [live.position] + live.stops + [live.hub]
+        return sum(self.graph.get_distance(a, b) for a, b in zip(nodes, nodes[1:]))
+
+    def lateness(self, live: LiveRoute, stops: list, deadlines: dict) -> float:
+        """
+        :return: total minutes the stops are reached after their deadlines
+        """
+        miles = 0.0
+        late = 0.0
+        previous = live.position
+        for stop in stops:
+            miles += self.graph.get_distance(previous, stop)
+            arrival = live.minutes + miles / live.truck.speed * 60
+            deadline = deadlines.get(stop, END_OF_DAY)
+            if arrival > deadline:
+                late += arrival - deadline
+            previous = stop
+        return late
+
+    def insert(self, live: LiveRoute, stop: Location, deadline=END_OF_DAY) -> float:
+        """
+        Adds a stop where it makes the fewest stops late, then where it adds the fewest miles.
+        A stop already on the route only has its deadline tightened.
+        :param live: LiveRoute, changed in place
+        :param stop: Location
+        :param deadline: deadline of the packages for the stop in minutes since midnight
+        :return: miles added to the rest of the route
+        """
+        before = self.remaining_miles(live)
+        live.deadlines[stop] = min(live.deadlines.get(stop, END_OF_DAY), deadline)
+        if stop in live.stops or stop is live.position:
+            return 0.0
+        nodes = [live.position] + live.stops + [live.hub]
+        best_stops = None
+        best_key = None
+        for i in range(len(nodes) - 1):
+            previous, following = nodes[i], nodes[i + 1]
+            added = (self.graph.get_distance(previous, stop) + self.graph.get_distance(stop, following)
+                     - self.graph.get_distance(previous, following))
+            candidate = live.stops[:i] + [stop] + live.stops[i:]
+            key = (self.lateness(live, candidate, live.deadlines), added)
+            if best_key is None or key < best_key:
+                best_stops, best_key = candidate, key
+        live.stops = best_stops
+        self.repair(live)
+        return self.remaining_miles(live) - before
+
+    def remove(self, live: LiveRoute, stop: Location) -> float:
+        """
+        Drops a stop from the route.
+        :param live: LiveRoute, changed in place
+        :param stop: Location
+        :return: miles saved on the rest of the route
+        """
+        if stop not in live.stops:
+            return 0.0
+        before = self.remaining_miles(live)
+        live.stops.remove(stop)
+        live.deadlines.pop(stop, None)
+        self.repair(live)
+        return before - self.remaining_miles(live)
+
+    def relocate(self, live: LiveRoute, old_stop: Location, new_stop: Location, deadline=END_OF_DAY) -> float:
+        """
+        Moves a stop to a new Location, used when an address is corrected.
+        :param live: LiveRoute, changed in place
+        :return: miles added to the rest of the route, negative if it got shorter
+        """
+        return self.insert(live, new_stop, deadline) - self.remove(live, old_stop)
+
+    def repair(self, live: LiveRoute):
+        """
+        Improves the order of the remaining stops without moving the truck or the Hub.
+        :return: None
+        """
+        if len(live.stops) < 3:
+            return
+        nodes = [live.position] + live.stops
+        matrix = [self.row(stop, nodes) for stop in nodes]
+        # node 0 leaves from the position and arrives at the Hub
+        for i, distance in enumerate(self.row(live.hub, nodes)):
+            matrix[i][0] = distance
+        matrix[0][0] = 0.0
+        limits = [END_OF_DAY] + [live.deadlines.get(stop, END_OF_DAY) for stop in live.stops]
+        order = self.optimizer.improve_tour(matrix, limits, live.minutes, live.truck.speed)
+        live.stops = [nodes[i] for i in order[1:]]
+
+    def row(self, from_point: Location, points: list) -> list:
+        """
+        :return: List[float] distances from from_point to each of points
+        """
+        row = self.graph.get_row(from_point, points)
+        return row.tolist() if hasattr(row, "tolist") else list(row)
@@ -0,0 +1,184 @@
+"""
+Local search that improves a truck's route after it has been built with nearest neighbor.
+"""
+import time
+
+from package import END_OF_DAY
+
+
+def nearest_neighbor_tour(matrix: list) -> list:
+    """
+    Walks the distance matrix from point 0, always moving to the closest unvisited point.
+    Each step scans the row of the current point over the unvisited points, so the tour costs O(N^2).
+    Ties go to the point with the lower index.
+    :param matrix: List[List[float]] row i holds the distances from point i to every point
+    :return: List[int] visiting order starting with 0
+    """
+    remaining = list(range(1, len(matrix)))
+    tour = [0]
+    while remaining:
+        row = matrix[tour[-1]]
+        best = min(range(len(remaining)), key=lambda position: row[remaining[position]])
+        tour.append(remaining.pop(best))
+    return tour
+
+
+class RouteOptimizer:
+    """
+    Applies 2-opt (reverse a section of the route) and Or-opt (move a run of 1 to 3 stops) moves
+    until no move shortens the route or the time budget runs out.
+    Moves are scored by their change in miles in O(1) from a small matrix of the route's stops.
+    An improving move is only kept if it does not make the route's total lateness worse.
+    Big-O is as follows:
+    improve: O(N^2) per pass plus O(N) for each improving move's deadline check
+    improve_tour: same as improve
+    """
+    def __init__(self, time_budget=0.1, segment_lengths=(1, 2, 3)):
+        """
+        :param time_budget: seconds allowed per route
+        :param segment_lengths: run lengths tried by Or-opt moves
+        """
+        self.time_budget = time_budget
+        self.segment_lengths = segment_lengths
+
+    def improve(self, route: list, graph, deadlines: dict, depart_minutes: int, speed: float) -> list:
+        """
+        Returns an improved copy of route. The route starts at the Hub and implicitly returns to it.
+        :param route: List[Location] starting with the Hub
+        :param graph: DistanceTable
+        :param deadlines: Dict[Location, int] earliest deadline at each stop in minutes since midnight
+        :param depart_minutes: when the truck leaves the Hub
+        :param speed: truck speed in mph
+        :return: List[Location]
+        """
+        if len(route) < 4:
+            return list(route)
+        stops = list(route)
+        matrix = [graph.get_row(stop, stops) for stop in stops]
+        matrix = [row.tolist() if hasattr(row, "tolist") else list(row) for row in matrix]
+        limits = [deadlines.get(stop, END_OF_DAY) for stop in stops]
+        return [stops[i] for i in self.improve_tour(matrix, limits, depart_minutes, speed)]
+
+    def improve_tour(self, matrix: list, limits: list, depart_minutes: int, speed: float) -> list:
+        """
+        Improves the route 0, 1, ..., N-1 over a matrix of the route's stops.
+        :param matrix: List[List[float]] distances between the stops, row 0 is the Hub
+        :param limits: earliest deadline at each stop in minutes since midnight
+        :param depart_minutes: when the truck leaves the Hub
+        :param speed: truck speed in mph
+        :return: List[int] visiting order starting with 0
+        """
+        if len(matrix) < 4:
+            return list(range(len(matrix)))
+        # tour holds indexes into matrix, closed with a second copy of the Hub
+        tour = list(range(len(matrix))) + [0]
+        stop_at = time.perf_counter() + self.time_budget
+        search = LocalSearch(matrix, limits, depart_minutes, speed / 60, stop_at)
+        improved = True
+        while improved and not search.out_of_time():
+            improved = search.two_opt(tour) or search.or_opt(tour, self.segment_lengths)
+        return tour[:-1]
+
+
+class LocalSearch:
+    """
+    Holds the state of one improve call so the move functions can share it.
+    """
+    def __init__(self, matrix: list, limits: list, depart_minutes: int, miles_per_minute: float, deadline: float):
+        self.matrix = matrix
+        self.limits = limits
+        self.depart_minutes = depart_minutes
+        self.miles_per_minute = miles_per_minute
+        self.deadline = deadline
+        self.lateness = None
+
+    def out_of_time(self) -> bool:
+        """
+        :return: True once the time budget is spent
+        """
+        return time.perf_counter() > self.deadline
+
+    def total_lateness(self, tour: list) -> float:
+        """
+        Sum of the minutes each stop is reached after its deadline.
+        :param tour: closed tour of indexes
+        :return: float
+        """
+        matrix = self.matrix
+        miles = 0.0
+        lateness = 0.0
+        for k in range(1, len(tour) - 1):
+            miles += matrix[tour[k - 1]][tour[k]]
+            arrival = self.depart_minutes + miles / self.miles_per_minute
+            if arrival > self.limits[tour[k]]:
+                lateness += arrival - self.limits[tour[k]]
+        return lateness
+
+    def accept(self, tour: list, candidate: list) -> bool:
+        """
+        Replaces tour with candidate if candidate is not later overall.
+        :return: True if the candidate was kept
+        """
+        if self.lateness is None:
+            self.lateness = self.total_lateness(tour)
+        lateness = self.total_lateness(candidate)
+        if lateness > self.lateness + 1e-9:
+            return False
+        self.lateness = lateness
+        tour[:] = candidate
+        return True
+
+    def two_opt(self, tour: list) -> bool:
+        """
+        Tries reversing tour[i..j] for every i < j and keeps the first improving move.
+        :param tour: closed tour of indexes, changed in place
+        :return: True if the tour changed
+        """
+        matrix = self.matrix
+        last = len(tour) - 1
+        for i in range(1, last - 1):
+            a, b = tour[i - 1], tour[i]
+            row_a = matrix[a]
+            row_b = matrix[b]
+            for j in range(i + 1, last):
+                c, d = tour[j], tour[j + 1]
+                delta = row_a[c] + row_b[d] - row_a[b] - matrix[c][d]
+                if delta < -1e-9:
+                    candidate = tour[:i] + tour[i:j + 1][::-1] + tour[j + 1:]
+                    if self.accept(tour, candidate):
+                        return True
+            if self.out_of_time():
+                break
+        return False
+
+    def or_opt(self, tour: list, segment_lengths) -> bool:
+        """
+        Tries moving each run of stops to every other edge, forwards and reversed.
+        :param tour: closed tour of indexes, changed in place
+        :param segment_lengths: run lengths to try
+        :return: True if the tour changed
+        """
+        matrix = self.matrix
+        last = len(tour) - 1
+        for length in segment_lengths:
+            for i in range(1, last - length + 1):
+                j = i + length - 1
+                prev, first, end, after = tour[i - 1], tour[i], tour[j], tour[j + 1]
+                removed = matrix[prev][first] + matrix[end][after] - matrix[prev][after]
+                for p in range(0, last):
+                    if i - 1 <= p <= j:
+                        continue
+                    left, right = tour[p], tour[p + 1]
+                    forward = matrix[left][first] + matrix[end][right]
+                    backward = matrix[left][end] + matrix[first][right]
+                    added = min(forward, backward) - matrix[left][right]
+                    if added - removed < -1e-9:
+                        segment = tour[i:j + 1] if forward <= backward else tour[i:j + 1][::-1]
+                        rest = tour[:i] + tour[j + 1:]
+                        position = p + 1 if p < i else p + 1 - length
+                        candidate = rest[:position] + segment + rest[position:]
+                        if self.accept(tour, candidate):
+                            return True
+                if self.out_of_time():
+                    return False
+        return False
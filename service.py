@@ -0,0 +1,284 @@
+"""
+Asyncio dispatch service for the Hub. Clients connect over TCP and send one command per line,
+each reply is one line of json. Run with: python service.py [--host 127.0.0.1 --port 8765]
+
+    LOOKUP <pkg_id>
+    STATUS <pkg_id> [time]
+    DELIVERED [time]
+    TRUCKS
+    CORRECT {"pkg_id": 9, "address": "410 S State St", "zip_code": "84111", "time": "10:20 AM"}
+    VERSION
+    QUIT
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+from types import MappingProxyType
+
+from hub_management import Hub
+from package import END_OF_DAY, Package
+
+WGUPS_CORRECTIONS = ({"pkg_id": 9, "address": "410 S State St", "zip_code": "84111", "time": "10:20 AM"},)
+
+
+def default_hub() -> Hub:
+    """
+    :return: a Hub loaded with the WGUPS csv files, without the welcome message
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Hub()
+
+
+class PlanSnapshot:
+    """
+    A planned day that is never changed after it is published. Replanning builds a new snapshot from
+    a new Hub, so queries can read the current snapshot without locks while the next one is built.
+    Big-O is as follows:
+    lookup: O(1)
+    status: O(log K) for K events of the package
+    delivered: O(log N + K)
+    """
+    __slots__ = ("version", "hub", "packages", "trucks", "miles", "corrections")
+
+    def __init__(self, version: int, hub: Hub, corrections: tuple):
+        """
+        :param version: increases by one with every replan
+        :param hub: Hub whose day has been scheduled, owned by the snapshot from now on
+        :param corrections: the corrections the plan includes
+        """
+        self.version = version
+        self.hub = hub
+        self.corrections = corrections
+        self.packages = MappingProxyType({pkg.pkg_id: MappingProxyType({
+            "pkg_id": pkg.pkg_id, "address": pkg.address, "zip_code": pkg.zip_code, "deadline": pkg.deadline,
+            "weight": pkg.weight, "notes": pkg.special_notes, "status": pkg.delivery_status,
+            "delivery_time": pkg.delivery_time}) for pkg in hub.database})
+        self.trucks = tuple(MappingProxyType({
+            "truck_id": trip.truck_id, "trip": trip.number, "depart": Package.format_time(trip.depart_minutes),
+            "return": Package.format_time(trip.return_minutes), "miles": round(trip.miles, 2),
+            "packages": len(trip.pkg_ids)}) for truck in hub.trucks for trip in truck.trips)
+        self.miles = round(sum(trip["miles"] for trip in self.trucks), 2)
+
+    def lookup(self, pkg_id: int) -> dict:
+        """
+        :return: the package as planned for the end of the day
+        """
+        return dict(self.packages[pkg_id])
+
+    def status(self, pkg_id: int, minutes: int) -> dict:
+        """
+        :return: the package's status at the given time
+        """
+        if pkg_id not in self.packages:
+            raise KeyError(pkg_id)
+        status, since = self.hub.events.status_at(pkg_id, minutes)
+        return {"pkg_id": pkg_id, "status": status, "since": None if since is None else Package.format_time(since)}
+
+    def delivered(self, minutes: int) -> list:
+        """
+        :return: List[int] pkg_ids delivered before the given time, the same boundary as Hub.get_deliveries
+        """
+        return self.hub.events.with_status_by("Delivered", minutes)
+
+
+class DispatchService:
+    """
+    DispatchService answers queries from the published PlanSnapshot and sends every correction through
+    one planner task. The planner takes all corrections waiting in the queue, replans once in a worker
+    thread, and swaps in the new snapshot, so queries are never blocked by replanning and corrections
+    are applied one batch at a time in the order they arrived.
+    """
+    def __init__(self, hub_factory=default_hub, drivers=2, corrections=()):
+        """
+        :param hub_factory: callable returning a freshly loaded Hub
+        :param drivers: drivers used when the day is scheduled
+        :param corrections: corrections already known when the service starts
+        """
+        self.hub_factory = hub_factory
+        self.drivers = drivers
+        self.snapshot = self.plan(0, tuple(corrections))
+        self.queue = None
+        self.planner_task = None
+        self.server = None
+
+    def plan(self, version: int, corrections: tuple) -> PlanSnapshot:
+        """
+        Builds a new Hub, applies the corrections, and schedules the day. Runs in a worker thread.
+        :return: PlanSnapshot
+        """
+        hub = self.hub_factory()
+        for correction in corrections:
+            notes = f'corrected at {correction["time"]}' if correction.get("time") else ""
+            hub.correct_package(correction["pkg_id"], correction.get("address", ""), correction.get("zip_code", ""),
+                                notes)
+        hub.schedule_trips(self.drivers)
+        return PlanSnapshot(version, hub, corrections)
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """
+        Starts the planner task and the TCP server.
+        :return: asyncio.Server
+        """
+        self.queue = asyncio.Queue()
+        self.planner_task = asyncio.create_task(self.planner())
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def stop(self):
+        """
+        Closes the server and cancels the planner task.
+        :return: None
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.planner_task is not None:
+            self.planner_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.planner_task
+
+    async def planner(self):
+        """
+        The only task that replans. Each batch of waiting corrections is answered with the new version.
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            current = self.snapshot
+            corrections = current.corrections + tuple(correction for correction, _ in batch)
+            try:
+                snapshot = await loop.run_in_executor(None, self.plan, current.version + 1, corrections)
+            except Exception as error:  # reported to the clients, the published plan is kept
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            self.snapshot = snapshot
+            for _, future in batch:
+                future.set_result(snapshot.version)
+
+    async def submit(self, correction: dict) -> int:
+        """
+        Queues a correction for the planner and waits for the plan that includes it.
+        :return: version of the new plan
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((correction, future))
+        return await future
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves one client connection until it sends QUIT or disconnects.
+        :return: None
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode().strip().partition(" ")
+                command = command.upper()
+                if command == "QUIT":
+                    break
+                try:
+                    reply = await self.execute(command, argument.strip())
+                except (KeyError, ValueError, TypeError) as error:
+                    reply = {"error": f'{type(error).__name__}: {error}'}
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def execute(self, command: str, argument: str) -> dict:
+        """
+        Runs one command against the current snapshot, or queues it for the planner if it is a correction.
+        :return: json ready reply
+        """
+        snapshot = self.snapshot
+        if command == "LOOKUP":
+            return snapshot.lookup(int(argument))
+        if command == "STATUS":
+            pkg_id, _, time = argument.partition(" ")
+            return snapshot.status(int(pkg_id), self.minutes(time))
+        if command == "DELIVERED":
+            minutes = self.minutes(argument)
+            pkg_ids = snapshot.delivered(minutes)
+            return {"time": Package.format_time(minutes), "count": len(pkg_ids), "pkg_ids": pkg_ids}
+        if command == "TRUCKS":
+            trips = [dict(trip) for trip in snapshot.trucks]
+            return {"version": snapshot.version, "miles": snapshot.miles, "trips": trips}
+        if command == "VERSION":
+            return {"version": snapshot.version, "corrections": len(snapshot.corrections)}
+        if command == "CORRECT":
+            correction = json.loads(argument)
+            self.check_correction(snapshot, correction, argument)
+            try:
+                version = await self.submit(correction)
+            except Exception as error:  # the planner failed, the client gets an error instead of a dropped connection
+                return {"error": f'planning failed: {type(error).__name__}: {error}'}
+            return {"version": version}
+        raise ValueError(f'unknown command {command}')
+
+    @staticmethod
+    def check_correction(snapshot: PlanSnapshot, correction, argument: str):
+        """
+        Checks a correction before it is queued, so a bad one is refused without replanning.
+        :param snapshot: PlanSnapshot whose packages and distance table are checked against
+        :param correction: the parsed json of the CORRECT command
+        :param argument: the raw json, used in error messages
+        :return: None
+        """
+        if not isinstance(correction, dict):
+            raise TypeError(f'correction must be a json object, not {argument}')
+        pkg_id = correction.get("pkg_id")
+        if type(pkg_id) is not int or pkg_id not in snapshot.packages:
+            raise KeyError(f'unknown package in {argument}')
+        for field in ("address", "zip_code", "time"):
+            if not isinstance(correction.get(field, ""), str):
+                raise TypeError(f'{field} must be a string in {argument}')
+        address = correction.get("address", "")
+        if address and snapshot.hub.destinations.get_location(Package.convert_delivery_address(address)) is None:
+            raise ValueError(f'address {address} is not in the distance table')
+        if correction.get("time"):
+            Package.parse_time(correction["time"])
+
+    @staticmethod
+    def minutes(time: str) -> int:
+        """
+        :param time: like "10:30 AM", EOD or empty for the end of the day
+        :return: minutes since midnight
+        """
+        time = time.strip()
+        return END_OF_DAY if not time else Package.parse_time(time)
+
+
+async def serve(host="127.0.0.1", port=8765):
+    """
+    Runs the service with the WGUPS data and the package 9 correction until it is interrupted.
+    :return: None
+    """
+    service = DispatchService(corrections=WGUPS_CORRECTIONS)
+    server = await service.start(host, port)
+    print(f'WGU-PS dispatch service listening on {host}:{port}')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WGU-PS dispatch service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve(args.host, args.port))
@@ -0,0 +1,135 @@
+"""
+Shortest path service for the graph class. Results are cached and thrown away when the graph changes.
+"""
+import heapq
+from array import array
+
+from dense_distance_table import DenseDistanceTable
+from location import Location
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MISSING = float("inf")
+
+
+class ShortestPaths:
+    """
+    ShortestPaths answers shortest path queries with a heapq based Dijkstra's Algorithm.
+    Each query keeps its own distance and predecessor dictionaries, so nothing is stored on the
+    shared Location objects and repeated calls give the same answer.
+    Big-O is as follows:
+    from_source: O((V + E) log V), O(1) when cached
+    distance: same as from_source
+    path: same as from_source plus O(V)
+    all_pairs: O(V^3) with Floyd-Warshall (vectorized with NumPy), O(V (V + E) log V) without NumPy
+    metric_table: same as all_pairs, O(1) when cached
+    """
+    def __init__(self, graph):
+        """
+        :param graph: DistanceTable to search
+        """
+        self.graph = graph
+        self.version = graph.version
+        self.sources = {}
+        self.table = None
+
+    def check_version(self):
+        """
+        Clears every cached result if the graph has changed since they were computed.
+        :return: None
+        """
+        if self.version != self.graph.version:
+            self.sources.clear()
+            self.table = None
+            self.version = self.graph.version
+
+    def from_source(self, source: Location):
+        """
+        Runs Dijkstra's Algorithm from source over the whole graph.
+        :param source: Location
+        :return: Dict[Location, float] distances and Dict[Location, Location] predecessors
+        """
+        self.check_version()
+        cached = self.sources.get(source)
+        if cached is not None:
+            return cached
+        graph = self.graph
+        distance = {source: 0.0}
+        prev_point = {}
+        visited = set()
+        order = 0  # breaks ties in the heap without comparing Locations
+        queue = [(0.0, order, source)]
+        while queue:
+            current_distance, _, current_point = heapq.heappop(queue)
+            if current_point in visited:
+                continue
+            visited.add(current_point)
+            for neighbor in graph.adjacent(current_point):
+                route_distance = graph.get_distance(current_point, neighbor)
+                if route_distance is None:
+                    continue
+                alternative_path_distance = current_distance + route_distance
+                if alternative_path_distance < distance.get(neighbor, MISSING):
+                    distance[neighbor] = alternative_path_distance
+                    prev_point[neighbor] = current_point
+                    order += 1
+                    heapq.heappush(queue, (alternative_path_distance, order, neighbor))
+        self.sources[source] = (distance, prev_point)
+        return distance, prev_point
+
+    def distance(self, from_point: Location, to_point: Location) -> float:
+        """
+        :return: the length of the shortest path or inf if to_point cannot be reached
+        """
+        return self.from_source(from_point)[0].get(to_point, MISSING)
+
+    def path(self, from_point: Location, to_point: Location) -> list:
+        """
+        :return: List[Location] from from_point to to_point, empty if to_point cannot be reached
+        """
+        distance, prev_point = self.from_source(from_point)
+        if to_point not in distance:
+            return []
+        path = [to_point]
+        while path[-1] is not from_point:
+            path.append(prev_point[path[-1]])
+        path.reverse()
+        return path
+
+    def all_pairs(self):
+        """
+        Computes every shortest path length at once.
+        :return: (List[Location], N x N NumPy array or flat array of N * N floats)
+        """
+        self.check_version()
+        locations = list(self.graph.points)
+        size = len(locations)
+        if numpy is not None and isinstance(self.graph, DenseDistanceTable):
+            matrix = numpy.array(self.graph.export_matrix(), dtype=numpy.float64)
+            for k in range(size):
+                numpy.minimum(matrix, matrix[:, k:k + 1] + matrix[k:k + 1, :], out=matrix)
+            return locations, matrix
+        matrix = array("d")
+        for source in locations:
+            distance = self.from_source(source)[0]
+            matrix.extend(distance.get(location, MISSING) for location in locations)
+        return locations, matrix
+
+    def metric_table(self) -> DenseDistanceTable:
+        """
+        Returns a distance table over the same locations whose distances are shortest path lengths,
+        so routes built on it never take a direct road that is longer than a detour.
+        :return: DenseDistanceTable
+        """
+        self.check_version()
+        if self.table is None:
+            locations, matrix = self.all_pairs()
+            table = DenseDistanceTable(capacity=max(len(locations), 1))
+            for location in locations:
+                table.add_location(location)
+            table.set_matrix(matrix, len(locations))
+            self.table = table
+        return self.table
@@ -0,0 +1,389 @@
+"""
+Discrete-event simulator for a delivery day. Works on a plain distance matrix and light package records
+so thousands of randomized days can be run to compare loading policies and fleet sizes offline.
+"""
+import heapq
+import random
+import time
+
+from dense_distance_table import MISSING
+from load_planner import PackageConstraints, merge_groups
+from package import END_OF_DAY, Package
+
+DEPART, ARRIVE, DELIVER, RETURN, PACKAGE_ARRIVAL, ADDRESS_CORRECTION = range(6)
+EVENT_NAMES = ("depart", "arrive", "deliver", "return", "package-arrival", "address-correction")
+
+
+class SimPackage:
+    """
+    A package as the simulator sees it.
+    location: row of its stop in the distance matrix, row 0 is the Hub, None while its address is unknown
+    arrival: minutes since midnight it reaches the Hub, None while its address is wrong or unknown
+    truck_id: the only truck allowed to carry it, or None
+    group: key shared by packages that must be delivered together, or None
+    """
+    __slots__ = ("pkg_id", "location", "deadline", "arrival", "truck_id", "group", "delivered")
+
+    def __init__(self, pkg_id: int, location: int, deadline=END_OF_DAY, arrival=0, truck_id=None, group=None):
+        self.pkg_id = pkg_id
+        self.location = location
+        self.deadline = deadline
+        self.arrival = arrival
+        self.truck_id = truck_id
+        self.group = group
+        self.delivered = None
+
+
+class SimTruck:
+    """
+    A truck as the simulator sees it. route holds the stops still to visit, route[0] is the one it is driving to.
+    """
+    __slots__ = ("truck_id", "position", "route", "cargo", "miles", "trips")
+
+    def __init__(self, truck_id: int):
+        self.truck_id = truck_id
+        self.position = 0
+        self.route = []
+        self.cargo = {}
+        self.miles = 0.0
+        self.trips = 0
+
+
+def deadline_first(simulator, truck: SimTruck, now: int) -> list:
+    """
+    Default loading policy: the waiting packages with the earliest deadlines that the truck may carry,
+    keeping co-delivery groups together. A group waits at the Hub until every undelivered member has arrived.
+    :return: List[SimPackage] to load, empty to keep the truck at the Hub
+    """
+    waiting = {pkg.pkg_id for pkg in simulator.waiting}
+    chosen = []
+    taken = set()
+    for pkg in sorted(simulator.waiting, key=lambda waiting: (waiting.deadline, waiting.pkg_id)):
+        if pkg.pkg_id in taken:
+            continue
+        members = [pkg]
+        if pkg.group is not None:
+            members = [member for member in simulator.groups[pkg.group] if member.delivered is None]
+            if any(member.pkg_id not in waiting for member in members):
+                continue
+        if any(member.truck_id not in (None, truck.truck_id) for member in members):
+            continue
+        if len(chosen) + len(members) > simulator.capacity:
+            continue
+        chosen.extend(members)
+        taken.update(member.pkg_id for member in members)
+    return chosen
+
+
+class Simulator:
+    """
+    Simulator pops events from a heap ordered by (minutes, sequence), so events at the same minute run
+    in the order they were scheduled. Trucks leave as soon as a driver is free and the policy gives them
+    packages, drive a nearest neighbor route over their stops, and reload when they return.
+    An address correction for a package on a truck moves its stop to the cheapest place in the rest of the route.
+    Big-O is as follows:
+    run: O(E log E + D * P log P) for E events, D dispatches, and P waiting packages
+    """
+    def __init__(self, matrix: list, trucks=3, drivers=2, capacity=16, speed=18.0, opening_minutes=480,
+                 policy=deadline_first):
+        """
+        :param matrix: List[List[float]] distances between locations, row 0 is the Hub
+        :param trucks: number of trucks
+        :param drivers: number of trucks that can be out at once
+        :param capacity: packages per truck per trip
+        :param speed: truck speed in mph
+        :param opening_minutes: when the first truck can leave
+        :param policy: callable(simulator, truck, now) returning the packages to load
+        """
+        self.matrix = matrix
+        self.truck_count = trucks
+        self.drivers = drivers
+        self.capacity = capacity
+        self.minutes_per_mile = 60 / speed
+        self.opening_minutes = opening_minutes
+        self.policy = policy
+        self.queue = []
+        self.sequence = 0
+        self.trucks = []
+        self.idle = []
+        self.free_drivers = 0
+        self.waiting = []
+        self.groups = {}
+        self.trace = None
+
+    def schedule(self, minutes: float, kind: int, subject, detail=None):
+        """
+        Adds an event to the queue.
+        :return: None
+        """
+        self.sequence += 1
+        heapq.heappush(self.queue, (minutes, self.sequence, kind, subject, detail))
+
+    def run(self, packages: list, corrections=(), trace=False) -> dict:
+        """
+        Simulates one day.
+        :param packages: List[SimPackage], changed in place with their delivery times
+        :param corrections: (minutes, pkg_id, new location) address corrections
+        :param trace: keep every event as (minutes, event name, truck_id or pkg_id)
+        :return: dict with miles, delivered, on_time, late, undelivered, trips, finish_minutes and events
+        """
+        self.queue = []
+        self.sequence = 0
+        self.trucks = [SimTruck(truck_id) for truck_id in range(1, self.truck_count + 1)]
+        self.idle = list(self.trucks)
+        self.free_drivers = self.drivers
+        self.waiting = []
+        self.groups = {}
+        self.trace = [] if trace else None
+        by_id = {}
+        for pkg in packages:
+            by_id[pkg.pkg_id] = pkg
+            pkg.delivered = None
+            if pkg.group is not None:
+                self.groups.setdefault(pkg.group, []).append(pkg)
+            if pkg.arrival is not None:
+                self.schedule(max(pkg.arrival, self.opening_minutes), PACKAGE_ARRIVAL, pkg)
+        for minutes, pkg_id, location in corrections:
+            self.schedule(minutes, ADDRESS_CORRECTION, by_id[pkg_id], location)
+        handlers = (self.on_depart, self.on_arrive, self.on_deliver, self.on_return,
+                    self.on_package_arrival, self.on_address_correction)
+        events = 0
+        now = self.opening_minutes
+        queue = self.queue
+        while queue:
+            now, _, kind, subject, detail = heapq.heappop(queue)
+            events += 1
+            if self.trace is not None:
+                subject_id = subject.pkg_id if kind >= PACKAGE_ARRIVAL else subject.truck_id
+                self.trace.append((now, EVENT_NAMES[kind], subject_id))
+            handlers[kind](now, subject, detail)
+        delivered = [pkg for pkg in packages if pkg.delivered is not None]
+        on_time = sum(1 for pkg in delivered if pkg.delivered <= pkg.deadline)
+        return {
+            "miles": sum(truck.miles for truck in self.trucks),
+            "delivered": len(delivered),
+            "on_time": on_time,
+            "late": len(delivered) - on_time,
+            "undelivered": len(packages) - len(delivered),
+            "trips": sum(truck.trips for truck in self.trucks),
+            "finish_minutes": now,
+            "events": events,
+        }
+
+    def dispatch(self, now: float):
+        """
+        Loads idle trucks while drivers are free and the policy has packages for them.
+        :return: None
+        """
+        for truck in list(self.idle):
+            if self.free_drivers == 0 or not self.waiting:
+                return
+            load = self.policy(self, truck, now)
+            if not load:
+                continue
+            loaded = {pkg.pkg_id for pkg in load}
+            self.waiting = [pkg for pkg in self.waiting if pkg.pkg_id not in loaded]
+            for pkg in load:
+                truck.cargo.setdefault(pkg.location, []).append(pkg)
+            truck.route = self.nearest_neighbor(list(truck.cargo))
+            self.idle.remove(truck)
+            self.free_drivers -= 1
+            self.schedule(now, DEPART, truck)
+
+    def nearest_neighbor(self, stops: list) -> list:
+        """
+        :param stops: matrix rows to visit
+        :return: the stops in nearest neighbor order starting from the Hub
+        """
+        matrix = self.matrix
+        route = []
+        current = 0
+        remaining = set(stops)
+        while remaining:
+            row = matrix[current]
+            current = min(remaining, key=row.__getitem__)
+            remaining.remove(current)
+            route.append(current)
+        return route
+
+    def drive(self, now: float, truck: SimTruck, destination: int, kind: int):
+        """
+        Moves the truck toward destination and schedules its arrival there.
+        :return: None
+        """
+        miles = self.matrix[truck.position][destination]
+        truck.miles += miles
+        self.schedule(now + miles * self.minutes_per_mile, kind, truck, destination)
+
+    def on_depart(self, now: float, truck: SimTruck, _):
+        truck.trips += 1
+        truck.position = 0
+        self.drive(now, truck, truck.route[0], ARRIVE)
+
+    def on_arrive(self, now: float, truck: SimTruck, stop: int):
+        truck.position = stop
+        self.schedule(now, DELIVER, truck, stop)
+
+    def on_deliver(self, now: float, truck: SimTruck, stop: int):
+        for pkg in truck.cargo.pop(stop, ()):
+            pkg.delivered = now
+        truck.route.pop(0)
+        if truck.route:
+            self.drive(now, truck, truck.route[0], ARRIVE)
+        else:
+            self.drive(now, truck, 0, RETURN)
+
+    def on_return(self, now: float, truck: SimTruck, _):
+        truck.position = 0
+        for packages in truck.cargo.values():  # corrected too late to deliver on this trip
+            self.waiting.extend(packages)
+        truck.cargo = {}
+        self.idle.append(truck)
+        self.free_drivers += 1
+        self.dispatch(now)
+
+    def on_package_arrival(self, now: float, pkg: SimPackage, _):
+        self.waiting.append(pkg)
+        self.dispatch(now)
+
+    def on_address_correction(self, now: float, pkg: SimPackage, location: int):
+        old_location = pkg.location
+        pkg.location = location
+        if pkg.delivered is not None:
+            return
+        if pkg.arrival is None:  # held for the correction, it can be loaded now
+            pkg.arrival = now
+            self.on_package_arrival(now, pkg, None)
+            return
+        for truck in self.trucks:
+            packages = truck.cargo.get(old_location)
+            if packages is None or pkg not in packages:
+                continue
+            packages.remove(pkg)
+            if not packages:
+                del truck.cargo[old_location]
+                if old_location in truck.route[1:]:
+                    truck.route.remove(old_location)
+            truck.cargo.setdefault(location, []).append(pkg)
+            if truck.route and location not in truck.route:
+                self.insert_stop(truck, location)
+            return
+
+    def insert_stop(self, truck: SimTruck, stop: int):
+        """
+        Inserts stop where it adds the fewest miles, after the stop the truck is driving to.
+        :return: None
+        """
+        matrix = self.matrix
+        route = truck.route
+        best_position = len(route)
+        best_added = matrix[route[-1]][stop] + matrix[stop][0] - matrix[route[-1]][0]
+        for position in range(1, len(route)):
+            previous, following = route[position - 1], route[position]
+            added = matrix[previous][stop] + matrix[stop][following] - matrix[previous][following]
+            if added < best_added:
+                best_position, best_added = position, added
+        route.insert(best_position, stop)
+
+    def run_days(self, days: int, package_count=40, seed=0) -> dict:
+        """
+        Simulates many randomized days over the same matrix.
+        :param days: number of days
+        :param package_count: packages per day
+        :param seed: seed for the random manifests
+        :return: dict with days, seconds, days_per_minute, mean_miles, on_time_rate and undelivered
+        """
+        rng = random.Random(seed)
+        start = time.perf_counter()
+        miles = 0.0
+        on_time = 0
+        total = 0
+        undelivered = 0
+        for _ in range(days):
+            packages, corrections = random_manifest(rng, len(self.matrix), package_count, self.truck_count,
+                                                    self.opening_minutes)
+            result = self.run(packages, corrections)
+            miles += result["miles"]
+            on_time += result["on_time"]
+            total += len(packages)
+            undelivered += result["undelivered"]
+        seconds = time.perf_counter() - start
+        return {
+            "days": days,
+            "seconds": seconds,
+            "days_per_minute": days / seconds * 60 if seconds else float("inf"),
+            "mean_miles": miles / days if days else 0.0,
+            "on_time_rate": on_time / total if total else 1.0,
+            "undelivered": undelivered,
+        }
+
+
+def random_manifest(rng: random.Random, location_count: int, package_count: int, truck_count=3,
+                    opening_minutes=480):
+    """
+    Builds a random day shaped like the WGUPS manifest: mostly EOD deadlines, some early deadlines,
+    a few delayed and pinned packages, small co-delivery groups of 2 to 4 packages,
+    and one wrong address corrected mid morning.
+    :return: List[SimPackage], List[(minutes, pkg_id, location)] corrections
+    """
+    packages = []
+    group = None
+    group_left = 0
+    for pkg_id in range(1, package_count + 1):
+        deadline = rng.choice((END_OF_DAY, END_OF_DAY, END_OF_DAY, 9 * 60, 10 * 60 + 30, 10 * 60 + 30))
+        arrival = opening_minutes if rng.random() > 0.1 else opening_minutes + rng.randrange(30, 120)
+        if group_left == 0:
+            group = None
+            if pkg_id < package_count and rng.random() < 0.03:
+                group = pkg_id
+                group_left = min(rng.randint(2, 4), package_count - pkg_id + 1)
+        if group is not None:
+            group_left -= 1
+        truck_id = rng.randint(1, truck_count) if group is None and rng.random() < 0.05 else None
+        packages.append(SimPackage(pkg_id, rng.randrange(1, location_count), deadline, arrival, truck_id, group))
+    corrections = []
+    single = [pkg for pkg in packages if pkg.group is None]
+    if single:
+        held = rng.choice(single)
+        held.arrival = None
+        held.deadline = END_OF_DAY
+        corrections.append((opening_minutes + rng.randrange(60, 180), held.pkg_id, rng.randrange(1, location_count)))
+    return packages, corrections
+
+
+def from_hub(hub, corrections=()):
+    """
+    Builds the simulator's inputs from a Hub's routing graph and package database.
+    A wrong address without a correction note, or an address missing from the distance table, is held
+    until its correction event and counts as undelivered without one. Missing edges stay infinite.
+    :param hub: Hub
+    :param corrections: (time like "10:20 AM", pkg_id, corrected address)
+    :return: List[List[float]] matrix, List[SimPackage], List[(minutes, pkg_id, location)]
+    :raises ValueError: if a corrected address is not in the distance table
+    """
+    graph = hub.routing_graph()
+    locations = [hub.center] + [point for point in graph.points if point is not hub.center]
+    rows = {location: row for row, location in enumerate(locations)}
+    matrix = [[MISSING if distance is None else distance for distance in (graph.get_distance(a, b) for b in locations)]
+              for a in locations]
+    opening_minutes = Package.parse_time(hub.current_time)
+    constraints = {pkg.pkg_id: PackageConstraints.parse(pkg, opening_minutes) for pkg in hub.database}
+    roots = merge_groups({pkg_id: parsed.group for pkg_id, parsed in constraints.items()})
+    sizes = {}
+    for root in roots.values():
+        sizes[root] = sizes.get(root, 0) + 1
+    packages = []
+    for pkg in hub.database:
+        parsed = constraints[pkg.pkg_id]
+        root = roots[pkg.pkg_id]
+        location = rows.get(hub.destinations.get_location(pkg.address))
+        arrival = None if location is None else parsed.available_minutes
+        packages.append(SimPackage(pkg.pkg_id, location, parsed.deadline_minutes, arrival, parsed.truck_id,
+                                   root if sizes[root] > 1 else None))
+    events = []
+    for minutes, pkg_id, address in corrections:
+        location = rows.get(hub.destinations.get_location(address))
+        if location is None:
+            raise ValueError(f'address {address} is not in the distance table')
+        events.append((Package.parse_time(minutes), pkg_id, location))
+    return matrix, packages, events
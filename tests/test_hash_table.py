@@ -0,0 +1,241 @@
+import io
+import random
+
+import pytest
+
+import manifest
+from hash_table import HashTable
+from package import Package
+
+
+def check_indexes(table):
+    """
+    Rebuilds every secondary index from the stored packages and compares it with the table's.
+    """
+    expected = {"status": {}, "address": {}, "zip": {}, "deadline": {}}
+    for pkg in table:
+        expected["status"].setdefault(pkg.delivery_status, set()).add(pkg.pkg_id)
+        expected["address"].setdefault(pkg.address, set()).add(pkg.pkg_id)
+        expected["zip"].setdefault(HashTable.zip_key(pkg.zip_code), set()).add(pkg.pkg_id)
+        expected["deadline"].setdefault(pkg.deadline_minutes, set()).add(pkg.pkg_id)
+    actual = {"status": table.by_status, "address": table.by_address, "zip": table.by_zip,
+              "deadline": table.by_deadline}
+    for name, index in actual.items():
+        assert {key: set(bucket) for key, bucket in index.items()} == expected[name], name
+    assert table.deadlines == sorted(expected["deadline"])
+    assert len(table) == sum(1 for _ in table)
+
+
+def test_repeated_pkg_id_in_one_batch_keeps_each_deadline_once():
+    table = HashTable()
+    table.insert_many([(1, "195 W Oakland Ave", 84115, "11:00 AM", 2, ""),
+                       (1, "195 W Oakland Ave", 84115, "EOD", 2, ""),
+                       (1, "195 W Oakland Ave", 84115, "11:00 AM", 2, ""),
+                       (2, "2530 S 500 E", 84106, "EOD", 2, "")])
+    check_indexes(table)
+    assert [pkg.pkg_id for pkg in table.deadline_range()] == [1, 2]
+    table.remove(1)
+    check_indexes(table)
+    assert [pkg.pkg_id for pkg in table.deadline_range()] == [2]
+
+
+def test_ingest_of_manifests_sharing_a_pkg_id():
+    first = io.StringIO("1,195 W Oakland Ave,Salt Lake City,UT,84115,11:00 AM,21,\n")
+    second = io.StringIO("1,195 W Oakland Ave,Salt Lake City,UT,84115,EOD,21,\n"
+                         "1,195 W Oakland Ave,Salt Lake City,UT,84115,11:00 AM,21,\n")
+    table = HashTable()
+    manifest.ingest(table, first, second)
+    assert table.deadlines == [Package.parse_time("11:00 AM")]
+    assert [pkg.pkg_id for pkg in table.deadline_range()] == [1]
+    table.remove(1)
+    assert table.deadline_range() == []
+    check_indexes(table)
+
+
+ADDRESSES = ["195 W Oakland Ave", "2530 S 500 E", "233 Canyon Rd", "380 W 2880 S", "410 S State St"]
+DEADLINES = ["9:00 AM", "10:30 AM", "11:00 AM", "EOD"]
+STATUSES = ["At Hub", "In Route", "Delivered"]
+
+
+def random_rows(rng, count, id_range=10 ** 12):
+    pkg_ids = rng.sample(range(id_range), count)
+    return [(pkg_id, rng.choice(ADDRESSES), 84100 + rng.randrange(20), rng.choice(DEADLINES), rng.randrange(1, 50), "")
+            for pkg_id in pkg_ids]
+
+
+def table_state(table):
+    packages = [(pkg.pkg_id, pkg.address, pkg.zip_code, pkg.deadline, pkg.delivery_status, pkg.delivery_minutes)
+                for pkg in table]
+    indexes = [{key: set(bucket) for key, bucket in index.items()}
+               for index in (table.by_status, table.by_address, table.by_zip, table.by_deadline)]
+    return packages, indexes, list(table.deadlines), len(table)
+
+
+def pair(rows, statuses):
+    """
+    Two equal tables with random statuses, one for the bulk call and one for the per-package loop.
+    """
+    tables = (HashTable(), HashTable())
+    for table in tables:
+        for row in rows:
+            table.insert(*row)
+    for row, status in zip(rows, statuses):
+        for table in tables:
+            table.look_up(row[0]).delivery_status = status
+    return tables
+
+
+def test_insert_many_matches_insert():
+    rng = random.Random(1)
+    rows = random_rows(rng, 300)
+    rows += [(rows[i][0], rng.choice(ADDRESSES), 84111, rng.choice(DEADLINES), 3, "") for i in range(0, 300, 7)]
+    rng.shuffle(rows)
+    bulk = HashTable()
+    assert bulk.insert_many(rows) == len(rows)
+    loop = HashTable()
+    for row in rows:
+        loop.insert(*row)
+    assert table_state(bulk) == table_state(loop)
+    check_indexes(bulk)
+
+
+def test_put_many_into_a_filled_table_matches_put():
+    rng = random.Random(2)
+    rows = random_rows(rng, 200)
+    bulk, loop = HashTable(), HashTable()
+    bulk.insert_many(rows[:100])
+    for row in rows[:100]:
+        loop.insert(*row)
+    batch = rows[100:] + [(row[0], "233 Canyon Rd", 84103, "9:00 AM", 1, "") for row in rows[:50]]
+    bulk.put_many([Package(*row) for row in batch])
+    for row in batch:
+        loop.put(Package(*row))
+    assert table_state(bulk) == table_state(loop)
+    check_indexes(bulk)
+
+
+def test_look_up_many_matches_look_up():
+    rng = random.Random(3)
+    rows = random_rows(rng, 500)
+    table = HashTable()
+    table.insert_many(rows)
+    table.remove(rows[0][0])
+    pkg_ids = [row[0] for row in rows[:50]] + [12345, rows[10][0], str(rows[20][0])]
+    assert table.look_up_many(pkg_ids) == [table.look_up(pkg_id) for pkg_id in pkg_ids]
+
+
+def test_packages_for_small_large_and_whole_batches():
+    rng = random.Random(4)
+    rows = random_rows(rng, 400)
+    table = HashTable()
+    table.insert_many(rows)
+    pkg_ids = [row[0] for row in rows]
+    for batch in (pkg_ids[:5] + pkg_ids[:5] + [7],                 # probed one by one
+                  pkg_ids[:300] + [7, 8],                          # one pass over entries
+                  pkg_ids + pkg_ids[:3],                           # every stored package
+                  [str(pkg_id) for pkg_id in pkg_ids[:200]]):      # ids that need int()
+        expected = {table.look_up(pkg_id).pkg_id for pkg_id in batch if pkg_id in table}
+        found = table.packages_for(batch)
+        assert len(found) == len(expected)
+        assert {pkg.pkg_id for pkg in found} == expected
+
+
+@pytest.mark.parametrize("case", ["partial", "whole bucket", "mixed", "whole table", "already set"])
+@pytest.mark.parametrize("minutes", [None, 1020])
+def test_set_status_many_matches_setting_each_status(case, minutes):
+    rng = random.Random(5)
+    rows = random_rows(rng, 200)
+    pkg_ids = [row[0] for row in rows]
+    if case in ("partial", "whole bucket"):
+        statuses = ["At Hub"] * 100 + ["In Route"] * 100
+    else:
+        statuses = [rng.choice(STATUSES) for _ in rows]
+    bulk, loop = pair(rows, statuses)
+    batch = {"partial": pkg_ids[10:60], "whole bucket": pkg_ids[:100], "mixed": rng.sample(pkg_ids, 120),
+             "whole table": pkg_ids, "already set": [pkg_id for pkg_id, status in zip(pkg_ids, statuses)
+                                                     if status == "Delivered"][:5] + pkg_ids[:3]}[case]
+    batch = batch + batch[:4] + [999]
+    assert bulk.set_status_many(batch, "Delivered", minutes) == len(set(batch) - {999})
+    for pkg_id in dict.fromkeys(batch):
+        pkg = loop.look_up(pkg_id)
+        if pkg is None:
+            continue
+        pkg.delivery_status = "Delivered"
+        if minutes is not None:
+            pkg.delivery_minutes = minutes
+    assert table_state(bulk) == table_state(loop)
+    check_indexes(bulk)
+    assert [pkg.pkg_id for pkg in bulk.select("Delivered")] == [pkg.pkg_id for pkg in loop.select("Delivered")]
+
+
+def test_sparse_large_pkg_ids():
+    # the low bits of these ids are equal, so only the perturbed probing keeps them apart
+    pkg_ids = [(k << 40) + 7 for k in range(1, 200)] + [2 ** 62 + 1, 10 ** 18]
+    table = HashTable()
+    for pkg_id in pkg_ids:
+        table.insert(pkg_id, "410 S State St", 84111, "EOD", 1, "")
+    assert all(table.look_up(pkg_id).pkg_id == pkg_id for pkg_id in pkg_ids)
+    assert table.look_up(7) is None and 7 not in table
+    for pkg_id in pkg_ids[::2]:
+        table.remove(pkg_id)
+    assert all((pkg_id in table) == (i % 2 == 1) for i, pkg_id in enumerate(pkg_ids))
+    assert [pkg.pkg_id for pkg in table] == pkg_ids[1::2]
+    table.remove(12345)  # missing ids are ignored
+    assert len(table) == len(pkg_ids[1::2])
+    check_indexes(table)
+
+
+def test_remove_leaves_a_tombstone_that_is_reused():
+    table = HashTable(table_size=8)
+    for pkg_id in (1, 9):  # both start probing at slot 1
+        table.insert(pkg_id, "410 S State St", 84111, "EOD", 1, "")
+    table.remove(1)
+    assert table.look_up(9).pkg_id == 9, "probing passes the tombstone"
+    used, size = table.used_count, table.table_size
+    table.insert(17, "233 Canyon Rd", 84103, "EOD", 1, "")
+    assert table.used_count == used and table.table_size == size
+    assert table.slots[1] == 2  # the tombstone slot now points at the new entry
+    table.insert(1, "2530 S 500 E", 84106, "10:30 AM", 1, "")
+    assert [pkg.pkg_id for pkg in table] == [9, 17, 1]
+    assert table.look_up(1).address == "2530 S 500 E"
+    check_indexes(table)
+
+
+def test_resize_keeps_insertion_order():
+    table = HashTable(table_size=8)
+    pkg_ids = list(range(1000, 0, -1))
+    for pkg_id in pkg_ids:
+        table.insert(pkg_id, ADDRESSES[pkg_id % 5], 84100 + pkg_id % 7, DEADLINES[pkg_id % 4], 1, "")
+        assert table.used_count <= table.table_size * table.load_factor
+        if pkg_id % 3 == 0:
+            table.remove(pkg_id)
+    kept = [pkg_id for pkg_id in pkg_ids if pkg_id % 3]
+    assert table.table_size >= 1024
+    assert [pkg.pkg_id for pkg in table] == kept
+    assert all(table.look_up(pkg_id).pkg_id == pkg_id for pkg_id in kept)
+    table.rehash(table.table_size)
+    assert None not in table.entries and table.used_count == len(kept)
+    assert [pkg.pkg_id for pkg in table] == kept
+    check_indexes(table)
+
+
+def test_indexes_follow_update_and_correct_info():
+    table = HashTable()
+    table.insert(1, "195 W Oakland Ave", 84115, "10:30 AM", 21, "")
+    table.insert(2, "195 W Oakland Ave", 84115, "EOD", 44, "")
+    pkg = table.look_up(1)
+    pkg.correct_info("410 South State St", "84111", "corrected")
+    assert [found.pkg_id for found in table.select(address="410 S State St", zip_code=84111)] == [1]
+    assert [found.pkg_id for found in table.select(address="195 W Oakland Ave", zip_code="84115")] == [2]
+    pkg.delivery_status = "In Route"
+    assert [found.pkg_id for found in table.select("In Route")] == [1]
+    replaced = table.look_up(2)
+    table.update(Package(2, "233 Canyon Rd", 84103, "9:00 AM", 2, ""))
+    assert table.look_up(2).address == "233 Canyon Rd"
+    replaced.delivery_status = "Delivered"  # a replaced package no longer reports to the table
+    assert table.select("Delivered") == []
+    assert [found.pkg_id for found in table.deadline_range(0, Package.parse_time("10:00 AM"))] == [2]
+    assert table.select(address="195 W Oakland Ave") == []
+    table.update(Package(3, "233 Canyon Rd", 84103, "EOD", 2, ""))  # only updates stored packages
+    assert 3 not in table
+    check_indexes(table)
@@ -0,0 +1,50 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from hub_management import Hub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Hub()
+
+
+def test_correct_package_to_unknown_address_changes_nothing(hub):
+    hub.plan_loads()
+    truck = next(truck for truck in hub.trucks if truck.cargo)
+    pkg_id = next(iter(next(iter(truck.cargo.values()))))
+    live = hub.live_route(truck)
+    before = hub.database.look_up(pkg_id).address
+    with pytest.raises(ValueError):
+        hub.correct_package(pkg_id, "1 Nowhere Rd", "84000", "corrected", live=live)
+    assert hub.database.look_up(pkg_id).address == before
+    assert hub.database.look_up(pkg_id).special_notes.count("corrected") == 0
+
+
+def test_correct_package_moves_the_stop_on_the_live_route(hub):
+    hub.plan_loads()
+    truck = next(truck for truck in hub.trucks if truck.cargo)
+    pkg_id = next(iter(next(iter(truck.cargo.values()))))
+    live = hub.live_route(truck)
+    hub.correct_package(pkg_id, "410 S State St", "84111", live=live)
+    assert pkg_id in truck.cargo[hub.destinations.get_location("410 S State St")]
+
+
+def test_same_stop_packages_match_by_normalized_address(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        hub = Hub(manifest=None)
+    hub.database.insert(1, "410 S State St", 84111, "EOD", 2, "")
+    hub.database.insert(2, "410 s  State St", 84111, "EOD", 2, "")
+    hub.database.insert(3, "1060 Dalton Ave S", 84104, "EOD", 2, "")
+    truck = hub.trucks[0]
+    truck.load_package(1, hub.destinations.get_location("410 S State St"))
+    hub.load_same_stop_truck(truck)
+    assert sorted(pkg_id for pkg_ids in truck.cargo.values() for pkg_id in pkg_ids) == [1, 2]
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from load_planner import PackageConstraints
+from multi_hub import HubCoordinator
+from package import Package
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def coordinator(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    return HubCoordinator(["HUB", "410 S State St"], transfers=True, depot_capacity=10)
+
+
+def drive_minutes(coordinator):
+    miles = coordinator.hub.routing_graph().get_distance(*coordinator.locations)
+    return Package.get_delivery_minutes(miles, coordinator.hub.trucks[0].speed, 0)
+
+
+def available(row):
+    return PackageConstraints.parse(Package(*row), 480).available_minutes
+
+
+def test_transfer_leaves_once_the_package_is_available(coordinator):
+    row = (6, "3060 Lester St", 84119, "10:30 AM", 88, "Delayed on flight---will not arrive to depot until 9:05 am")
+    moved = coordinator.transfer(row, 0, 1)
+    assert available(moved) == Package.parse_time("9:05 AM") + drive_minutes(coordinator)
+    assert moved[5].lower().count("until") == 1
+    assert moved[5].startswith("Delayed on transfer")
+    again = coordinator.transfer(moved, 1, 0)
+    assert available(again) == available(moved) + drive_minutes(coordinator)
+    assert again[5].lower().count("until") == 1
+
+
+def test_transfer_of_a_package_at_the_depot_from_opening(coordinator):
+    moved = coordinator.transfer((3, "233 Canyon Rd", 84103, "EOD", 2, "Can only be on truck 2"), 0, 1)
+    assert available(moved) == 480 + drive_minutes(coordinator)
+    assert moved[5].startswith("Can only be on truck 2---Delayed on transfer")
+
+
+def test_transfer_keeps_a_wrong_address_held(coordinator):
+    row = (9, "300 State St", 84103, "EOD", 2, "Wrong address listed")
+    assert coordinator.transfer(row, 0, 1) == row
@@ -0,0 +1,92 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from hub_management import Hub
+from package_store import PackageStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def package_state(database):
+    return [(pkg.pkg_id, pkg.address, pkg.zip_code, pkg.deadline, pkg.deadline_minutes, pkg.weight,
+             pkg.special_notes, pkg.delivery_status, pkg.delivery_minutes) for pkg in database]
+
+
+def hub_state(hub):
+    snapshot = [(pkg.pkg_id, status, minutes) for pkg, status, minutes in hub.get_snapshot("10:00 AM")]
+    return (package_state(hub.database), list(hub.events.events),
+            [hub.get_status(pkg.pkg_id, "10:00 AM") for pkg in hub.database],
+            [pkg.pkg_id for pkg in hub.get_deliveries()], snapshot)
+
+
+def open_hub(store):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Hub(store=str(store))
+
+
+@pytest.fixture(autouse=True)
+def in_repo(monkeypatch):
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.mark.parametrize("snapshot", [True, False])
+def test_restart_restores_packages_and_events(tmp_path, snapshot):
+    hub = open_hub(tmp_path)
+    hub.correct_package(9, "410 S State St", "84111", "corrected at 10:20 AM")
+    hub.schedule_trips(2)
+    expected = hub_state(hub)
+    assert expected[3], "the day delivered packages"
+    hub.store.close(snapshot=snapshot)
+
+    again = open_hub(tmp_path)
+    assert hub_state(again) == expected
+    assert again.get_status(1) == hub.get_status(1)
+    assert again.get_status(1)[0] == "Delivered"
+    assert again.store.stats["replayed_frames"] == (0 if snapshot else hub.store.stats["commits"])
+    again.close()
+
+
+def test_removal_and_cleared_events_survive_restart(tmp_path):
+    hub = open_hub(tmp_path)
+    hub.schedule_trips(2)
+    hub.database.remove(3)
+    hub.events.clear()
+    hub.events.record(600, 1, "Delivered")
+    hub.close()
+
+    again = open_hub(tmp_path)
+    assert 3 not in again.database
+    assert list(again.events.events) == [(600, 1, "Delivered")]
+    again.close()
+
+
+def test_torn_frame_is_cut_off(tmp_path):
+    store = PackageStore(str(tmp_path))
+    database = store.open()
+    database.insert(1, "4001 South 700 East", 84107, "EOD", 2, "")
+    database.insert(2, "1060 Dalton Ave S", 84104, "10:30 AM", 5, "")
+    database.commit()
+    store.events.record(540, 1, "Delivered")
+    database.set_status_many([1], "Delivered", 540)
+    database.commit()
+    store.journal.write(b"\x40\x00\x00\x00torn")
+    store.close(snapshot=False)
+
+    store = PackageStore(str(tmp_path))
+    database = store.open()
+    assert store.stats["replayed_frames"] == 2
+    assert store.stats["torn_bytes"] == 8
+    assert database.look_up(1).delivery_status == "Delivered"
+    assert database.look_up(1).delivery_minutes == 540
+    assert store.events.status_at(1, 600) == ("Delivered", 540)
+    database.set_status_many([2], "In Route")
+    store.close(snapshot=False)
+
+    store = PackageStore(str(tmp_path))
+    database = store.open()
+    assert store.stats["torn_bytes"] == 0
+    assert database.look_up(2).delivery_status == "In Route"
+    store.close()
@@ -0,0 +1,53 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from hub_management import Hub
+import parallel_routing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class KeepOrder:
+    """
+    An optimizer without improve_tour, so it cannot run in the workers.
+    """
+    def improve(self, route, graph, deadlines, depart_minutes, speed):
+        return list(route)
+
+
+def loaded_hub(**kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        hub = Hub(**kwargs)
+    hub.plan_loads()
+    return hub
+
+
+@pytest.fixture(autouse=True)
+def in_repo(monkeypatch):
+    monkeypatch.chdir(ROOT)
+
+
+def test_parallel_routes_match_serial_and_reuse_the_pool():
+    hub = loaded_hub()
+    serial = [hub.plan_route(truck) for truck in hub.trucks]
+    pool = parallel_routing.RoutePool()
+    try:
+        assert parallel_routing.plan_routes(hub, hub.trucks, 2, pool) == serial
+        workers = pool.pool
+        graph = hub.routing_graph()
+        graph.add_distance(hub.center, next(iter(hub.trucks[0].cargo)), 0.1)
+        changed = parallel_routing.plan_routes(hub, hub.trucks, 2, pool)
+        assert pool.pool is workers
+        assert pool.version == graph.version
+        assert changed == [hub.plan_route(truck) for truck in hub.trucks]
+    finally:
+        pool.close()
+
+
+def test_optimizer_without_improve_tour_plans_here():
+    hub = loaded_hub(optimizer=KeepOrder())
+    routes = parallel_routing.plan_routes(hub, hub.trucks, 2)
+    assert routes == [hub.plan_route(truck) for truck in hub.trucks]
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from package import Package
+from service import DispatchService
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def service():
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        yield DispatchService()
+    finally:
+        os.chdir(cwd)
+
+
+async def ask(service, *lines):
+    server = await service.start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    replies = []
+    for line in lines:
+        writer.write((line + "\n").encode())
+        await writer.drain()
+        replies.append(json.loads(await reader.readline()))
+    writer.write(b"QUIT\n")
+    await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    await service.stop()
+    return replies
+
+
+@pytest.mark.parametrize("correction, error", [
+    ({"pkg_id": 9, "address": "1 Nowhere Rd"}, "ValueError"),
+    ({"pkg_id": 9, "address": 5}, "TypeError"),
+    ({"pkg_id": 9, "time": 1020}, "TypeError"),
+    ({"pkg_id": "9"}, "KeyError"),
+    ([9], "TypeError"),
+])
+def test_bad_corrections_get_an_error_reply(service, correction, error):
+    replies = asyncio.run(ask(service, "CORRECT " + json.dumps(correction), "VERSION"))
+    assert replies[0]["error"].startswith(error)
+    assert replies[1] == {"version": 0, "corrections": 0}
+
+
+def test_planner_failure_is_an_error_reply(service, monkeypatch):
+    def fail(version, corrections):
+        raise RuntimeError("no trucks")
+    monkeypatch.setattr(service, "plan", fail)
+    replies = asyncio.run(ask(service, 'CORRECT {"pkg_id": 9, "address": "410 S State St"}', "VERSION"))
+    assert replies[0] == {"error": "planning failed: RuntimeError: no trucks"}
+    assert replies[1]["version"] == 0
+
+
+def test_delivered_matches_the_hub(service):
+    hub = service.snapshot.hub
+    minutes = hub.events.by_status["Delivered"][5][0]
+    for time in (minutes, minutes + 1):
+        expected = [pkg.pkg_id for pkg in hub.get_deliveries(Package.format_time(time))]
+        assert sorted(service.snapshot.delivered(time)) == sorted(expected)
@@ -0,0 +1,45 @@
+import contextlib
+import io
+import math
+import os
+
+import pytest
+
+from hub_management import Hub
+from location import Location
+import simulator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        hub = Hub(manifest=None)
+    hub.database.insert(1, "410 S State St", 84111, "EOD", 2, "")
+    hub.database.insert(2, "1 Nowhere Rd", 84000, "EOD", 2, "")
+    return hub
+
+
+def test_unknown_address_is_held_not_delivered_at_the_hub(hub):
+    matrix, packages, events = simulator.from_hub(hub)
+    unknown = packages[1]
+    assert unknown.location is None and unknown.arrival is None
+    result = hub.simulate_day()
+    assert result["delivered"] == 1 and result["undelivered"] == 1
+
+
+def test_correction_releases_a_package_with_an_unknown_address(hub):
+    result = hub.simulate_day(corrections=[("10:20 AM", 2, "233 Canyon Rd")])
+    assert result["delivered"] == 2 and result["undelivered"] == 0
+    with pytest.raises(ValueError):
+        simulator.from_hub(hub, [("10:20 AM", 2, "2 Nowhere Rd")])
+
+
+def test_missing_edges_stay_missing(hub):
+    hub.destinations.add_location(Location("Island", "1 Island Rd", 84000, "1 Island Rd"))
+    matrix, _, _ = simulator.from_hub(hub)
+    assert math.isinf(matrix[0][-1]) and math.isinf(matrix[-1][0])
+    assert matrix[-1][-1] == 0
+    assert all(not math.isinf(distance) for row in matrix[:-1] for distance in row[:-1])
@@ -0,0 +1,45 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from hub_management import Hub
+from trip_scheduler import TripScheduler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def in_repo(monkeypatch):
+    monkeypatch.chdir(ROOT)
+
+
+def empty_hub(truck_count=3):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Hub(truck_count=truck_count, manifest=None)
+
+
+def test_drivers_must_be_positive():
+    with pytest.raises(ValueError):
+        TripScheduler(drivers=0)
+
+
+def test_every_idle_truck_is_tried():
+    hub = empty_hub(2)
+    hub.database.insert(1, "1060 Dalton Ave S", 84104, "EOD", 2,
+                        "Can only be on truck 1, Delayed on flight---will not arrive to depot until 9:05 am")
+    hub.database.insert(2, "410 S State St", 84111, "EOD", 2, "Can only be on truck 2")
+    trips = TripScheduler(drivers=2, max_wait=0).schedule(hub, hub.trucks)
+    assert [(trip.truck_id, trip.depart_minutes, trip.pkg_ids) for trip in trips] == [(2, 480, [2]), (1, 545, [1])]
+
+
+def test_packages_that_can_never_be_loaded_are_reported():
+    hub = empty_hub()
+    hub.database.insert(1, "1060 Dalton Ave S", 84104, "EOD", 2, "")
+    hub.database.insert(2, "300 State St", 84103, "EOD", 2, "Wrong address listed")
+    hub.database.insert(3, "1 Nowhere Rd", 84000, "EOD", 2, "")
+    scheduler = TripScheduler()
+    trips = scheduler.schedule(hub, hub.trucks)
+    assert [trip.pkg_ids for trip in trips] == [[1]]
+    assert sorted(scheduler.unplanned) == [2, 3]
@@ -0,0 +1,147 @@
+"""
+Schedules the trucks over the whole day. Each truck can make several trips, reloading at the Hub,
+and the number of drivers limits how many trucks are out at once.
+"""
+import heapq
+
+from load_planner import LoadPlanner
+from package import END_OF_DAY, Package
+
+
+class TripScheduler:
+    """
+    TripScheduler moves a clock between driver returns, truck returns and package arrivals.
+    Whenever a driver and a truck are both at the Hub it tries leaving now or waiting for each package
+    arrival in the next max_wait minutes, plans the truck's load for every choice with the LoadPlanner,
+    and sends the trip that is late for the fewest packages, then carries the most packages with a deadline,
+    then the most packages, then leaves earliest. Loads are planned so no stop is late when possible.
+    Every idle truck is tried, pinned trucks first, until one of them has a load.
+    Delayed packages and corrected addresses are just arrivals, read from the notes by the planner.
+    Packages still at the Hub when nothing more can be loaded are kept in unplanned.
+    Big-O is as follows:
+    schedule: O(W * T * C * S) for W waves, T idle trucks, C candidate departure times,
+    and S the cost of LoadPlanner.solve
+    """
+    def __init__(self, drivers=2, planner=None, max_wait=120):
+        """
+        :param drivers: number of trucks that can be out at once
+        :param planner: LoadPlanner, a default planner if None
+        :param max_wait: minutes a loaded wave may wait at the Hub for more packages to arrive
+        """
+        if drivers < 1:
+            raise ValueError(f'at least one driver is needed, not {drivers}')
+        self.drivers = drivers
+        self.planner = LoadPlanner() if planner is None else planner
+        self.max_wait = max_wait
+        self.unplanned = []
+
+    def schedule(self, hub, trucks: list) -> list:
+        """
+        Loads and drives waves of trips until every package that can arrive has been delivered.
+        The pkg_ids that could never be loaded are left in self.unplanned.
+        :param hub: Hub
+        :param trucks: List[Truck]
+        :return: List[Trip] in the order they left the Hub
+        """
+        opening_minutes = Package.parse_time(hub.current_time)
+        clock = opening_minutes
+        driver_free = [opening_minutes] * self.drivers  # heap of the times each driver is back at the Hub
+        truck_free = {truck: opening_minutes for truck in trucks}
+        trips = []
+        while True:
+            arrivals, pinned = self.waiting(hub, opening_minutes)
+            if not arrivals:
+                break
+            idle = [truck for truck in trucks if truck_free[truck] <= clock]
+            idle.sort(key=lambda truck: truck.truck_id not in pinned)
+            wave = None
+            if driver_free[0] <= clock:
+                for truck in idle:
+                    wave = self.best_wave(hub, truck, clock, arrivals)
+                    if wave is not None:
+                        break
+            if wave is None:
+                future = [minutes for minutes in driver_free if minutes > clock]
+                future += [minutes for minutes in truck_free.values() if minutes > clock]
+                future += [minutes for minutes in arrivals if minutes > clock]
+                if not future:
+                    break
+                clock = min(future)
+                continue
+            plan, waiting = wave
+            truck = plan.truck
+            self.planner.load(hub, plan, waiting)
+            the_way, initial_distance = hub.plan_route(truck)
+            hub.drive_route(truck, the_way, initial_distance)
+            truck_free[truck] = truck.return_minutes
+            heapq.heapreplace(driver_free, truck.return_minutes)
+            trips.append(truck.trips[-1])
+        self.unplanned = [pkg.pkg_id for pkg in hub.database.select("At Hub")]
+        trips.sort(key=lambda trip: trip.depart_minutes)
+        return trips
+
+    def waiting(self, hub, opening_minutes: int):
+        """
+        :return: sorted arrival times of the packages still at the Hub, and the truck ids they are pinned to
+        """
+        arrivals = set()
+        pinned = set()
+        for pkg in hub.database.select("At Hub"):
+            constraints = self.planner.get_constraints(pkg, opening_minutes)
+            if constraints.available_minutes is None:
+                continue
+            arrivals.add(constraints.available_minutes)
+            if constraints.truck_id is not None:
+                pinned.add(constraints.truck_id)
+        return sorted(arrivals), pinned
+
+    def best_wave(self, hub, truck, clock: int, arrivals: list):
+        """
+        Plans the truck's load for leaving now and for leaving at each upcoming arrival.
+        If no load can be on time, the truck leaves now with the least late load.
+        :return: (TruckPlan, waiting packages) or None if nothing can be loaded
+        """
+        candidates = [clock] + [minutes for minutes in arrivals if clock < minutes <= clock + self.max_wait]
+        best = None
+        best_score = None
+        for depart_minutes in candidates:
+            truck.depart_minutes = depart_minutes
+            plans, waiting, _ = self.planner.solve(hub, [truck], ready_by=depart_minutes, strict=True)
+            late, urgent, loaded = self.score(plans[0], waiting, hub.routing_graph())
+            if loaded == 0:
+                continue
+            score = (-late, urgent, loaded, -depart_minutes)
+            if best_score is None or score > best_score:
+                best, best_score = (plans[0], waiting), score
+        if best is None:
+            truck.depart_minutes = clock
+            plans, waiting, _ = self.planner.solve(hub, [truck], ready_by=clock)
+            if not plans[0].units:
+                return None
+            best = (plans[0], waiting)
+        truck.depart_minutes = best[0].depart_minutes
+        return best
+
+    @staticmethod
+    def score(plan, waiting: dict, graph):
+        """
+        Estimates each package's delivery time along the planned route.
+        :return: (packages delivered late, packages with a deadline, packages loaded)
+        """
+        late = 0
+        urgent = 0
+        loaded = 0
+        arrival = {}
+        miles = 0.0
+        for previous, stop in zip(plan.route, plan.route[1:]):
+            miles += graph.get_distance(previous, stop)
+            arrival[stop] = Package.get_delivery_minutes(miles, plan.truck.speed, plan.depart_minutes)
+        for unit in plan.units:
+            for pkg_id in unit.pkg_ids:
+                constraints, location = waiting[pkg_id]
+                loaded += 1
+                if constraints.deadline_minutes < END_OF_DAY:
+                    urgent += 1
+                if arrival.get(location, plan.depart_minutes) > constraints.deadline_minutes:  # at the Hub
+                    late += 1
+        return late, urgent, loaded
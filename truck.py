@@ -1,5 +1,23 @@
 """Truck Class"""
 from location import Location
+from package import Package
+
+
+class Trip:
+    """One wave of deliveries: the truck leaves the Hub loaded and comes back empty."""
+    __slots__ = ("truck_id", "number", "depart_minutes", "return_minutes", "miles", "initial_miles", "pkg_ids",
+                 "route")
+
+    def __init__(self, truck_id: int, number: int, depart_minutes: int, return_minutes: int, miles: float,
+                 initial_miles: float, pkg_ids: list, route: list):
+        self.truck_id = truck_id
+        self.number = number
+        self.depart_minutes = depart_minutes
+        self.return_minutes = return_minutes
+        self.miles = miles
+        self.initial_miles = initial_miles
+        self.pkg_ids = pkg_ids
+        self.route = route
 
 
 class Truck:
@@ -8,13 +26,30 @@ class Truck:
         """
         Constructor sets the id number.
         :param truck_id: id number of the truck
+        :param capacity: number of packages the truck can carry on one trip
         """
         self.truck_id = truck_id
         self.speed = 18.0
         self.capacity = capacity
         self.cargo = {}
         self.pkg_count = 0
-        self.depart_at = "08:00 AM"
+        self.depart_minutes = 8 * 60
+        self.return_minutes = self.depart_minutes
+        self.trips = []
+
+    @property
+    def depart_at(self) -> str:
+        """departure time in 12 hr time, stored as minutes since midnight"""
+        return Package.format_time(self.depart_minutes)
+
+    @depart_at.setter
+    def depart_at(self, time: str):
+        self.depart_minutes = Package.parse_time(time)
+
+    @property
+    def returns_at(self) -> str:
+        """return time of the last trip in 12 hr time"""
+        return Package.format_time(self.return_minutes)
 
     def load_package(self, pkg_id: int, delivery_location: Location) -> bool:
         """
@@ -31,6 +66,24 @@ class Truck:
         self.pkg_count += 1
         return True
 
+    def move_package(self, pkg_id: int, old_location: Location, new_location: Location) -> bool:
+        """
+        Moves a package already on the truck to a new delivery location, used when its address is corrected.
+        :param pkg_id: package's ID number
+        :param old_location: where the package was going
+        :param new_location: where it is going now
+        :return: True if the old location has no packages left
+        """
+        packages = self.cargo[old_location]
+        packages.discard(pkg_id)
+        if new_location not in self.cargo:
+            self.cargo[new_location] = set()
+        self.cargo[new_location].add(pkg_id)
+        if not packages:
+            del self.cargo[old_location]
+            return True
+        return False
+
     def unload_package(self, delivery_location: Location) -> list:
         """
         If truck is not empty, remove the packages being delivered to this location from cargo.